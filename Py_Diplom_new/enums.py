@@ -14,3 +14,15 @@ class Status(models.TextChoices):
 class Role(models.TextChoices):
     shop = "shop", "Магазин"
     buyer = "buyer", "Покупатель"
+
+
+class JobState(models.TextChoices):
+    queued = "queued", "В очереди"
+    running = "running", "Выполняется"
+    done = "done", "Выполнена"
+    failed = "failed", "Ошибка"
+
+
+class ChangeTopic(models.TextChoices):
+    offer = "offer", "Предложение"
+    order = "order", "Заказ"
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 
@@ -40,9 +42,12 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "backend",
     "rest_framework",
+    "django_rest_passwordreset",
 ]
 
 MIDDLEWARE = [
+    "backend.middleware.RequestMetricsMiddleware",
+    "backend.middleware.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,15 +81,145 @@ WSGI_APPLICATION = "Py_Diplom_new.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Соединения живут CONN_MAX_AGE секунд и переиспользуются запросами потока;
+# перед повторным использованием соединение проверяется (CONN_HEALTH_CHECKS)
+CONN_MAX_AGE = int(os.environ.get("CONN_MAX_AGE", "60"))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
-        "NAME": "Try_Diplom",
-        "USER": "postgres",
-        "PASSWORD": "123456",
+        "NAME": os.environ.get("POSTGRES_DB", "Try_Diplom"),
+        "USER": os.environ.get("POSTGRES_USER", "postgres"),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", "123456"),
+        "HOST": os.environ.get("POSTGRES_HOST", ""),
+        "PORT": os.environ.get("POSTGRES_PORT", ""),
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+    }
+}
+# реплика для чтения каталога: те же учетные данные, другой хост
+if os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = dict(
+        DATABASES["default"],
+        HOST=os.environ["POSTGRES_REPLICA_HOST"],
+        PORT=os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        TEST={"MIRROR": "default"},
+    )
+# локальный запуск без PostgreSQL (например, замеры): DB_ENGINE=sqlite;
+# SQLITE_REPLICA_PATH - второй файл в роли реплики
+if os.environ.get("DB_ENGINE") == "sqlite":
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+    }
+    DATABASES.pop("replica", None)
+    if os.environ.get("SQLITE_REPLICA_PATH"):
+        DATABASES["replica"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ["SQLITE_REPLICA_PATH"],
+            "TEST": {"MIRROR": "default"},
+        }
+# manage.py test: без настроенной реплики ее роль играет зеркало основной
+# БД, чтобы маршрутизация чтения проверялась в каждом прогоне тестов
+if sys.argv[1:2] == ["test"] and "replica" not in DATABASES:
+    DATABASES["replica"] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+
+DATABASE_ROUTERS = ["backend.routers.PrimaryReplicaRouter"]
+REPLICA_DATABASE = "replica"
+# сколько секунд после записи пользователь читает из основной БД
+REPLICA_PIN_SECONDS = 5
+
+# Кеш каталога: локальная память процесса или Redis, если задан REDIS_URL
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
     }
+
+# Поиск без PostgreSQL идет по индексу в памяти процесса (только для
+# разработки и тестов); через столько секунд индекс перестраивается из БД
+SEARCH_INDEX_TTL = 60
+
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = 300
+
+# Метрики запросов: доля запросов, для которых перехватывается SQL, и
+# токен сборщика Prometheus для /metrics/
+REQUEST_METRICS_SAMPLE_RATE = float(
+    os.environ.get("REQUEST_METRICS_SAMPLE_RATE", "1.0")
+)
+REQUEST_METRICS_SERVER_TIMING = True
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+REST_FRAMEWORK = {
+    "DEFAULT_THROTTLE_CLASSES": ["backend.throttling.TokenBucketThrottle"],
 }
 
+# Квоты запросов (backend.throttling): "N/период" - ведро на N запросов,
+# пополняемое за период, по группе эндпоинтов и роли пользователя;
+# THROTTLE_TENANT_RATES - квоты отдельных арендаторов, например
+# {"shop:5": {"stock": "50/s"}}
+THROTTLE_ENABLED = os.environ.get("THROTTLE_ENABLED", "1") == "1"
+THROTTLE_RATES = {
+    "catalog": {"anon": "20/s", "default": "50/s"},
+    "orders": {"default": "10/s"},
+    "export": {"default": "10/h"},
+    "import": {"default": "60/h"},
+    "stock": {"default": "10/s"},
+    "shop": {"default": "10/s"},
+    "changes": {"default": "5/s"},
+}
+THROTTLE_TENANT_RATES = {}
+THROTTLE_STORE = "redis" if os.environ.get("REDIS_URL") else "local"
+THROTTLE_REDIS_URL = os.environ.get("THROTTLE_REDIS_URL", os.environ.get("REDIS_URL"))
+
+# Лента изменений (backend.changes): строк журнала в пакете, период опроса
+# журнала, наибольшее ожидание длинного запроса, длительность потока
+# Server-Sent Events и период пинга в нем (в секундах), срок хранения
+# журнала для manage.py prune_changes (в днях)
+CHANGE_FEED_BATCH_SIZE = 500
+CHANGE_FEED_POLL_INTERVAL = 1
+CHANGE_FEED_WAIT_MAX = 30
+CHANGE_FEED_STREAM_SECONDS = 300
+CHANGE_FEED_HEARTBEAT = 15
+CHANGE_FEED_RETENTION_DAYS = 7
+
+# Фоновые задачи (manage.py run_jobs): число попыток, экспоненциальная
+# задержка повтора, время, после которого задача зависшего воркера
+# возвращается в очередь, и период продления блокировки выполняемой
+# задачи (в секундах)
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10
+JOBS_RETRY_BACKOFF_MAX = 3600
+JOBS_LOCK_TIMEOUT = 900
+JOBS_HEARTBEAT_INTERVAL = 60
+JOBS_WORKER_PROCESSES = int(os.environ.get("JOBS_WORKER_PROCESSES", "1"))
+JOBS_WORKER_THREADS = int(os.environ.get("JOBS_WORKER_THREADS", "4"))
+
+# Почта: без EMAIL_HOST письма выводятся в консоль
+# https://docs.djangoproject.com/en/4.1/topics/email/
+
+EMAIL_BACKEND = (
+    "django.core.mail.backends.smtp.EmailBackend"
+    if os.environ.get("EMAIL_HOST")
+    else "django.core.mail.backends.console.EmailBackend"
+)
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", "25"))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS") == "1"
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "shop@example.com")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -122,6 +257,8 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+MEDIA_ROOT = BASE_DIR / "media"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -14,8 +14,73 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
-from backend.views import ProductView
+from backend import async_views
+from backend.views import (
+    BasketLinesView,
+    BasketView,
+    CacheStatsView,
+    CatalogExportView,
+    CategoryListView,
+    ChangeFeedView,
+    CheckoutView,
+    HealthView,
+    JobDetailView,
+    JobListView,
+    MetricsView,
+    OrderHistoryView,
+    OrderEventsView,
+    OrderStatusView,
+    ProductDetailView,
+    ProductFilterView,
+    ProductPricesView,
+    ProductView,
+    SearchView,
+    ShopChangeFeedView,
+    ShopDashboardView,
+    ShopExportView,
+    ShopImportView,
+    ShopOrderStatusView,
+    ShopListView,
+    ShopStateView,
+    ShopStockView,
+)
 
-urlpatterns = [path("admin/", admin.site.urls), path("product/", ProductView.as_view())]
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("product/", ProductView.as_view()),
+    path("product/<int:pk>/", ProductDetailView.as_view()),
+    path("product/filter/", ProductFilterView.as_view()),
+    path("products/<int:pk>/prices/", ProductPricesView.as_view()),
+    path("search/", SearchView.as_view()),
+    path("shops/", ShopListView.as_view()),
+    path("categories/", CategoryListView.as_view()),
+    path("cache/stats/", CacheStatsView.as_view()),
+    path("metrics/", MetricsView.as_view()),
+    path("health/", HealthView.as_view()),
+    path("basket/", BasketView.as_view()),
+    path("basket/lines/", BasketLinesView.as_view()),
+    path("basket/checkout/", CheckoutView.as_view()),
+    path("orders/", OrderHistoryView.as_view()),
+    path("orders/<int:pk>/", OrderStatusView.as_view()),
+    path("orders/<int:pk>/events/", OrderEventsView.as_view()),
+    path("async/product/", async_views.product_list),
+    path("async/product/<int:pk>/", async_views.product_detail),
+    path("async/orders/<int:pk>/", async_views.order_status),
+    path("shop/<int:pk>/import/", ShopImportView.as_view()),
+    path("shop/<int:pk>/export/<str:fmt>/", ShopExportView.as_view()),
+    path("shop/<int:pk>/dashboard/", ShopDashboardView.as_view()),
+    path("shop/<int:pk>/offers/", ShopStockView.as_view()),
+    path("shop/<int:pk>/state/", ShopStateView.as_view()),
+    path("shop/<int:pk>/orders/status/", ShopOrderStatusView.as_view()),
+    path("shop/<int:pk>/changes/", ShopChangeFeedView.as_view()),
+    path("export/catalog/<str:fmt>/", CatalogExportView.as_view()),
+    path("changes/", ChangeFeedView.as_view()),
+    path("jobs/", JobListView.as_view()),
+    path("jobs/<int:pk>/", JobDetailView.as_view()),
+    path(
+        "user/password_reset/",
+        include("django_rest_passwordreset.urls", namespace="password_reset"),
+    ),
+]
@@ -1,8 +1,21 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from backend.cache import CATALOG, CATEGORIES, SHOPS, catalog_cache, shop_scope
+from backend.stock import change_prices
+from backend.transitions import TransitionError, transition
+from Py_Diplom_new.enums import Status
 
 from .models import (
     Shop,
     Category,
+    Job,
+    Order,
+    OrderItem,
     Product,
     Parameter,
     ProductInfo,
@@ -10,20 +23,146 @@ from .models import (
     User,
 )
 
+# начиная с этого размера таблицы число строк без фильтров берется из
+# статистики PostgreSQL, а не считается через COUNT(*)
+ESTIMATE_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списков больших таблиц: без фильтров число строк - оценка
+    планировщика (``pg_class.reltuples``), с фильтрами - точный подсчет
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == "postgresql" and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [query.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Список без полного подсчета строк и без выборки различных значений
+    столбцов для фильтров
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class RangeFilter(admin.SimpleListFilter):
+    """
+    Фильтр по заранее заданным диапазонам значений поля ``parameter_name``;
+    ``ranges`` - пары (от, до не включая), ``None`` - без верхней границы
+    """
+
+    ranges = ()
+
+    def lookups(self, request, model_admin):
+        return [
+            (f"{low}-{'' if high is None else high}", self.label(low, high))
+            for low, high in self.ranges
+        ]
+
+    @staticmethod
+    def label(low, high):
+        if high is None:
+            return f"от {low}"
+        if high == low + 1:
+            return str(low)
+        return f"{low} - {high - 1}"
 
-#  Order, OrderItem
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            low, high = (
+                int(value) if value else None for value in self.value().split("-")
+            )
+        except ValueError:
+            return queryset
+        lookups = {f"{self.parameter_name}__gte": low}
+        if high is not None:
+            lookups[f"{self.parameter_name}__lt"] = high
+        return queryset.filter(**lookups)
+
+
+class QuantityFilter(RangeFilter):
+    title = "Количество"
+    parameter_name = "quantity"
+    ranges = ((0, 1), (1, 10), (10, 100), (100, None))
+
+
+class PriceFilter(RangeFilter):
+    title = "Цена"
+    parameter_name = "price"
+    ranges = ((0, 1000), (1000, 10000), (10000, 50000), (50000, None))
+
+
+class PriceActionForm(ActionForm):
+    percent = forms.IntegerField(
+        label="Изменение цены, %", required=False, min_value=-90, max_value=1000
+    )
+
+
+class TransitionActionForm(ActionForm):
+    status = forms.ChoiceField(
+        label="Новый статус",
+        required=False,
+        choices=[("", "---------")]
+        + [choice for choice in Status.choices if choice[0] != Status.basket],
+    )
+
+
+def _placed(order):
+    # позиции оформленного заказа меняют только переходы статусов
+    return order is not None and order.status != Status.basket
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_filter = ["email"]
+    list_filter = ["role"]
     list_display = ["email", "role"]
+    search_fields = ["email"]
 
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
     list_display = ["name", "state", "user"]
-    list_filter = ["name", "state", "user"]
+    list_filter = ["state"]
+    list_select_related = ["user"]
+    search_fields = ["name"]
+    raw_id_fields = ["user"]
+    actions = ["enable_orders", "disable_orders"]
+
+    @admin.action(description="Включить прием заказов")
+    def enable_orders(self, request, queryset):
+        self._set_state(request, queryset, True)
+
+    @admin.action(description="Отключить прием заказов")
+    def disable_orders(self, request, queryset):
+        self._set_state(request, queryset, False)
+
+    def _set_state(self, request, queryset, state):
+        # один UPDATE магазинов; доступность предложений и лучшие
+        # предложения обновляет ShopQuerySet.update
+        shop_ids = list(queryset.exclude(state=state).values_list("id", flat=True))
+        if shop_ids:
+            Shop.objects.filter(id__in=shop_ids).update(state=state)
+            catalog_cache.invalidate(
+                SHOPS, CATEGORIES, CATALOG, *map(shop_scope, shop_ids)
+            )
+        self.message_user(request, f"Изменено магазинов: {len(shop_ids)}")
 
 
 @admin.register(Category)
@@ -31,7 +170,7 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = [
         "name",
     ]
-    list_filter = [
+    search_fields = [
         "name",
     ]
     filter_vertical = [
@@ -39,11 +178,8 @@ class CategoryAdmin(admin.ModelAdmin):
     ]
 
 
-# Добавить choises
-
-
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = [
         "id",
         "category",
@@ -51,33 +187,137 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         "category",
-        "name",
     ]
+    list_select_related = ["category"]
+    search_fields = ["name"]
+    autocomplete_fields = ["category"]
 
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
-    list_display = ["quantity", "price", "product", "shop"]
-    list_filter = ["quantity", "price", "product", "shop"]
+class ProductInfoAdmin(LargeTableAdmin):
+    list_display = ["id", "model", "quantity", "price", "product", "shop", "available"]
+    list_filter = [QuantityFilter, PriceFilter, "available"]
+    list_select_related = ["product__category", "shop__user"]
+    search_fields = ["=id", "model"]
+    autocomplete_fields = ["product", "shop"]
+    action_form = PriceActionForm
+    actions = ["change_price"]
+
+    @admin.action(description="Изменить цену на указанный процент")
+    def change_price(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields["action"].choices = self.get_action_choices(request)
+        if not form.is_valid() or form.cleaned_data["percent"] is None:
+            self.message_user(
+                request, "Укажите изменение цены от -90 до 1000 %", messages.ERROR
+            )
+            return
+        rows = change_prices(queryset, form.cleaned_data["percent"])
+        self.message_user(request, f"Изменено предложений: {rows}")
 
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
     list_display = ["name"]
-    list_filter = ["name"]
+    search_fields = ["name"]
 
 
 @admin.register(ProductParameter)
-class ProductParameterAdmin(admin.ModelAdmin):
-    list_display = ["parameter", "value"]
-    list_filter = ["parameter", "value"]
-
-
-# @admin.register(Order)
-# class OrderAdmin(admin.ModelAdmin):
-#     pass
-#
-#
-# @admin.register(OrderItem)
-# class OrderItemAdmin(admin.ModelAdmin):
-#     pass
+class ProductParameterAdmin(LargeTableAdmin):
+    list_display = ["product", "parameter", "value"]
+    list_filter = ["parameter"]
+    list_select_related = ["product__category", "parameter"]
+    search_fields = ["value"]
+    autocomplete_fields = ["product", "parameter"]
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["id", "name", "state", "attempts", "run_at", "finished_at"]
+    list_filter = ["state", "name"]
+    raw_id_fields = ["user"]
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ["product_info"]
+
+    def has_add_permission(self, request, obj=None):
+        return not _placed(obj) and super().has_add_permission(request, obj)
+
+    def has_change_permission(self, request, obj=None):
+        return not _placed(obj) and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return not _placed(obj) and super().has_delete_permission(request, obj)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    """
+    Статус меняется только действием списка через
+    ``backend.transitions.transition``: условный UPDATE, события, сводки
+    продаж, возврат остатков при отмене и письма покупателям
+    """
+
+    list_display = ["id", "user", "status", "items_count", "total_sum", "created_at"]
+    list_filter = ["status"]
+    list_select_related = ["user"]
+    search_fields = ["=id", "user__email"]
+    raw_id_fields = ["user", "contact"]
+    readonly_fields = ["status"]
+    inlines = [OrderItemInline]
+    action_form = TransitionActionForm
+    actions = ["change_status"]
+
+    @admin.action(description="Сменить статус")
+    def change_status(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields["action"].choices = self.get_action_choices(request)
+        if not form.is_valid() or not form.cleaned_data["status"]:
+            self.message_user(request, "Укажите новый статус", messages.ERROR)
+            return
+        new_status = form.cleaned_data["status"]
+        orders = {}
+        for pk, status in queryset.values_list("id", "status"):
+            orders.setdefault(status, []).append(pk)
+        moved = 0
+        for old_status, ids in orders.items():
+            try:
+                moved += len(transition(ids, old_status, new_status, request.user))
+            except TransitionError as exc:
+                self.message_user(
+                    request, f"{exc} (заказов: {len(ids)})", messages.WARNING
+                )
+        self.message_user(request, f"Изменено заказов: {moved}")
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ["id", "order", "product_info", "quantity", "total_amount"]
+    list_filter = ["order__status"]
+    list_select_related = [
+        "order__user",
+        "product_info__product",
+        "product_info__shop__user",
+    ]
+    search_fields = ["=order__id"]
+    raw_id_fields = ["order", "product_info"]
+
+    def has_add_permission(self, request):
+        # позиции добавляются через корзину
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return not _placed(obj and obj.order) and super().has_change_permission(
+            request, obj
+        )
+
+    def has_delete_permission(self, request, obj=None):
+        # без объекта - массовое удаление, в выборке могут быть оформленные
+        return (
+            obj is not None
+            and not _placed(obj.order)
+            and super().has_delete_permission(request, obj)
+        )
@@ -0,0 +1,128 @@
+"""
+Асинхронные (ASGI) представления каталога и статуса заказа.
+
+Повторяют ответы синхронных ``ProductView``, ``ProductDetailView`` и
+``OrderStatusView``, но не занимают поток на время ожидания БД, кеша и
+медленного клиента: запросы идут через асинхронный ORM и асинхронный API
+кеша Django. DRF не поддерживает асинхронные представления, поэтому это
+обычные представления Django, а сериализаторы используются как есть:
+все связанные данные загружаются заранее, и сериализация не обращается
+к БД.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+
+from backend.cache import CATALOG, catalog_cache, offer_scopes
+from backend.conditional import acatalog_state, aoffer_state, conditional_response
+from backend.models import Order
+from backend.pagination import CatalogPagination
+from backend.serializers import OrderTotalsSerializer, ProductInfoSerializer
+from backend.views import catalog_queryset
+from Py_Diplom_new.enums import Status
+
+
+def require_get(view):
+    """
+    ``require_GET`` для корутин: декораторы Django 4.1 их не поддерживают
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return HttpResponseNotAllowed(["GET", "HEAD"])
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get("page_size", CatalogPagination.page_size))
+    except ValueError:
+        size = CatalogPagination.page_size
+    return min(max(size, 1), CatalogPagination.max_page_size)
+
+
+def _json(data, headers, status=200):
+    response = JsonResponse(
+        data, status=status, safe=False, json_dumps_params={"ensure_ascii": False}
+    )
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@require_get
+async def product_list(request):
+    """
+    Страница каталога с пагинацией по ключу: ``?after=<id>&page_size=``
+    """
+    not_modified, headers = conditional_response(request, await acatalog_state())
+    if not_modified is not None:
+        return not_modified
+    try:
+        after = int(request.GET.get("after", 0))
+    except ValueError:
+        return _json({"error": "after: ожидается целое число"}, {}, status=400)
+    size = _page_size(request)
+
+    async def produce():
+        offers = [
+            offer
+            async for offer in catalog_queryset()
+            .filter(available=True, id__gt=after)
+            .order_by("id")[: size + 1]
+        ]
+        next_url = None
+        if len(offers) > size:
+            offers = offers[:size]
+            next_url = request.build_absolute_uri(
+                f"{request.path}?after={offers[-1].id}&page_size={size}"
+            )
+        return {
+            "next": next_url,
+            "results": ProductInfoSerializer(offers, many=True).data,
+        }
+
+    data = await catalog_cache.aget_or_set(
+        f"async-products:{request.build_absolute_uri()}", produce, [CATALOG]
+    )
+    return _json(data, headers)
+
+
+@require_get
+async def product_detail(request, pk):
+    not_modified, headers = conditional_response(request, await aoffer_state(pk))
+    if not_modified is not None:
+        return not_modified
+
+    async def produce():
+        offer = await catalog_queryset().filter(pk=pk).afirst()
+        if offer is None:
+            raise Http404
+        return ProductInfoSerializer(offer).data
+
+    return _json(
+        await catalog_cache.aget_or_set(f"offer:{pk}", produce, offer_scopes), headers
+    )
+
+
+@require_get
+async def order_status(request, pk):
+    """
+    Статус и итоги заказа пользователя
+    """
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return _json({"detail": "Учетные данные не были предоставлены."}, {}, 403)
+    order = (
+        await Order.objects.filter(user=user, pk=pk)
+        .exclude(status=Status.basket)
+        .afirst()
+    )
+    if order is None:
+        raise Http404
+    return _json(OrderTotalsSerializer(order).data, {})
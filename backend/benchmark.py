@@ -0,0 +1,446 @@
+"""
+Замеры горячих запросов и сценариев API каталога и заказов.
+
+Для каждого горячего запроса записываются план ``EXPLAIN`` и время
+выполнения, для сценариев API - перцентили времени ответа, пропускная
+способность и число SQL-запросов.
+
+Для замера индексов состояние «до» воспроизводит прежние индексы внутри транзакции, которая
+затем откатывается: DDL транзакционен и в PostgreSQL, и в SQLite, поэтому
+схема после замера не меняется.
+"""
+import io
+import json
+import logging
+import math
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from django.db import connection, models, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.cache import catalog_cache
+from backend.jobs import run_job
+from backend.models import (
+    Category,
+    Job,
+    Order,
+    Product,
+    ProductFacet,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+    User,
+)
+from backend.routers import pin_to_primary
+from Py_Diplom_new.enums import JobState, Status
+
+HOT_PATH_INDEXES = (
+    (ProductInfo, "productinfo_shop_id_idx"),
+    (ProductInfo, "productinfo_product_price_idx"),
+    (Order, "order_user_status_created_idx"),
+    (Order, "order_history_idx"),
+)
+
+# индексы до миграции 0007: внешних ключей и истории заказов
+BASELINE_INDEXES = (
+    (ProductInfo, models.Index(fields=["product"], name="baseline_info_product_idx")),
+    (ProductInfo, models.Index(fields=["shop"], name="baseline_info_shop_idx")),
+    (Order, models.Index(fields=["user"], name="baseline_order_user_idx")),
+    (
+        Order,
+        models.Index(fields=["user", "-created_at"], name="order_user_created_idx"),
+    ),
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    """
+    Горячие запросы с параметрами, взятыми из текущих данных
+    """
+    shop_id = (
+        Shop.objects.filter(state=True)
+        .annotate(offers=Count("product_infos"))
+        .order_by("-offers")
+        .values_list("id", flat=True)
+        .first()
+    )
+    user_id = (
+        Order.objects.order_by()
+        .values_list("user_id")
+        .annotate(count=Count("id"))
+        .order_by("-count")
+        .values_list("user_id", flat=True)
+        .first()
+    )
+    category_id = (
+        ProductFacet.objects.order_by()
+        .values_list("category_id")
+        .annotate(count=Count("id"))
+        .order_by("-count")
+        .values_list("category_id", flat=True)
+        .first()
+    )
+    product_id = ProductInfo.objects.values_list("product_id", flat=True).first()
+    return {
+        "open_shop_offers": ProductInfo.objects.filter(
+            shop_id=shop_id, available=True
+        ).order_by("id")[:50],
+        "user_orders_by_status": Order.objects.filter(
+            user_id=user_id, status=Status.new
+        ).order_by("-created_at")[:20],
+        "user_basket": Order.objects.filter(user_id=user_id, status=Status.basket)[:1],
+        "order_history": Order.objects.filter(user_id=user_id)
+        .exclude(status=Status.basket)
+        .order_by("-created_at", "-id")[:20],
+        "category_offers_by_price": ProductFacet.objects.filter(
+            category_id=category_id, parameter__isnull=True
+        ).order_by("price")[:50],
+        "product_offers_by_price": ProductInfo.objects.filter(
+            product_id=product_id
+        ).order_by("price")[:10],
+    }
+
+
+def measure(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "plan": queryset.explain(),
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+    }
+
+
+def measure_hot_queries(repeat=50):
+    return {name: measure(qs, repeat) for name, qs in hot_queries().items()}
+
+
+def benchmark_indexes(repeat=50):
+    """
+    Замеры горячих запросов на схеме до миграции индексов горячих путей
+    и после нее; обе фазы читают основную БД, индексы которой меняются
+    """
+    # SQLite кеширует подготовленные запросы вместе с планом, поэтому
+    # каждая фаза выполняется в новом соединении
+    connection.close()
+    before = None
+    try:
+        with transaction.atomic():
+            # редактор схемы SQLite нельзя открыть внутри транзакции, поэтому
+            # выполняется только SQL удаления индексов
+            editor = connection.schema_editor()
+            with connection.cursor() as cursor:
+                for model, name in HOT_PATH_INDEXES:
+                    index = next(i for i in model._meta.indexes if i.name == name)
+                    cursor.execute(str(index.remove_sql(model, editor)))
+                for model, index in BASELINE_INDEXES:
+                    cursor.execute(str(index.create_sql(model, editor)))
+            before = measure_hot_queries(repeat)
+            raise _Rollback
+    except _Rollback:
+        pass
+    connection.close()
+    with pin_to_primary():
+        after = measure_hot_queries(repeat)
+    return {
+        "vendor": connection.vendor,
+        "queries": {
+            name: {"before": before[name], "after": after[name]} for name in after
+        },
+    }
+
+
+def percentile(values, q):
+    """
+    Перцентиль ``q`` (0-100) методом ближайшего ранга
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.timings = []
+        self.queries = []
+        self.statuses = Counter()
+
+    def record(self, elapsed, queries, status):
+        self.timings.append(elapsed)
+        self.queries.append(queries)
+        self.statuses[status] += 1
+
+    def as_dict(self):
+        total = sum(self.timings)
+        return {
+            "requests": len(self.timings),
+            "throughput_rps": round(len(self.timings) / total, 1) if total else None,
+            "p50_ms": round(percentile(self.timings, 50) * 1000, 3),
+            "p95_ms": round(percentile(self.timings, 95) * 1000, 3),
+            "p99_ms": round(percentile(self.timings, 99) * 1000, 3),
+            "queries_mean": round(statistics.mean(self.queries), 2),
+            "queries_max": max(self.queries),
+            "statuses": {str(code): count for code, count in self.statuses.items()},
+        }
+
+
+class EndpointBenchmark:
+    """
+    Прогон сценариев каталога, корзины, оформления и импорта через
+    тестовый клиент DRF со всеми middleware; для каждого запроса
+    фиксируются время и число SQL-запросов. Все изменения данных
+    откатываются в конце прогона
+    """
+
+    scenarios = (
+        "catalog_page",
+        "product_card",
+        "catalog_filter",
+        "search",
+        "basket_add",
+        "checkout",
+        "import",
+        "import_job",
+    )
+
+    def __init__(self, iterations=200, import_runs=5, seed=0, cold_cache=False):
+        self.iterations = iterations
+        self.import_runs = import_runs
+        self.rng = random.Random(seed)
+        self.cold_cache = cold_cache
+        self.stats = defaultdict(EndpointStats)
+        self.client = APIClient()
+
+    def request(self, name, method, url, user=None, **kwargs):
+        if self.cold_cache:
+            catalog_cache.cache.clear()
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, **kwargs)
+            elapsed = time.perf_counter() - started
+        self.stats[name].record(elapsed, len(queries), response.status_code)
+        return response
+
+    def run(self):
+        offer_ids = list(
+            ProductInfo.objects.filter(available=True, quantity__gt=0).values_list(
+                "id", flat=True
+            )
+        )
+        category_ids = list(Category.objects.values_list("id", flat=True))
+        buyers = list(User.objects.filter(shop__isnull=True, is_active=True)[:500])
+        if not offer_ids or not buyers:
+            raise ValueError("Нет данных для замеров: сначала generate_marketplace")
+        words = [
+            name.split()[0]
+            for name in Product.objects.values_list("name", flat=True)[:100]
+        ]
+
+        url = "/product/?page_size=50"
+        for _ in range(self.iterations):
+            response = self.request("catalog_page", "get", url)
+            url = response.data.get("next") or "/product/?page_size=50"
+        for _ in range(self.iterations):
+            pk = self.rng.choice(offer_ids)
+            self.request("product_card", "get", f"/product/{pk}/")
+        for _ in range(self.iterations):
+            self.request(
+                "catalog_filter",
+                "get",
+                "/product/filter/",
+                data={
+                    "category": self.rng.choice(category_ids),
+                    "price_max": self.rng.randint(1000, 200000),
+                },
+            )
+        for _ in range(self.iterations):
+            self.request(
+                "search", "get", "/search/", data={"q": self.rng.choice(words)}
+            )
+        for _ in range(self.iterations):
+            self.request(
+                "basket_add",
+                "post",
+                "/basket/",
+                user=self.rng.choice(buyers),
+                data=self._basket_items(offer_ids),
+                format="json",
+            )
+        for _ in range(self.iterations):
+            user = self.rng.choice(buyers)
+            self.client.force_authenticate(user)
+            self.client.post(
+                "/basket/", self._basket_items(offer_ids, quantity=1), format="json"
+            )
+            self.request(
+                "checkout", "post", "/basket/checkout/", user=user, format="json"
+            )
+        self._run_imports()
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def _basket_items(self, offer_ids, quantity=None):
+        return {
+            "items": [
+                {
+                    "product_info": pk,
+                    "quantity": quantity or self.rng.randint(1, 3),
+                }
+                for pk in self.rng.sample(offer_ids, k=min(3, len(offer_ids)))
+            ]
+        }
+
+    def _run_imports(self):
+        shops = list(
+            Shop.objects.annotate(offers=Count("product_infos"))
+            .filter(offers__gt=0)
+            .select_related("user")
+            .order_by("-offers")[: self.import_runs]
+        )
+        for shop in shops:
+            upload = io.BytesIO(self._price_list(shop).encode())
+            upload.name = "price.json"
+            response = self.request(
+                "import",
+                "post",
+                f"/shop/{shop.id}/import/",
+                user=shop.user,
+                data={"file": upload},
+                format="multipart",
+            )
+            # импорт выполняется воркером: его время замеряется отдельно
+            Job.objects.filter(pk=response.data["id"]).update(
+                state=JobState.running, locked_by="benchmark", locked_at=timezone.now()
+            )
+            job = Job.objects.get(pk=response.data["id"])
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                run_job(job)
+                elapsed = time.perf_counter() - started
+            job.refresh_from_db()
+            self.stats["import_job"].record(elapsed, len(queries), job.state)
+
+    def _price_list(self, shop):
+        """
+        Текущий прайс-лист магазина, у половины товаров изменены цены
+        """
+        categories = {}
+        goods = []
+        parameters = defaultdict(dict)
+        offers = ProductInfo.objects.filter(shop=shop).select_related(
+            "product__category"
+        )
+        for product_id, name, value in ProductParameter.objects.filter(
+            product__products__shop=shop
+        ).values_list("product_id", "parameter__name", "value"):
+            parameters[product_id][name] = value
+        for offer in offers:
+            category = offer.product.category
+            categories[category.id] = category.name
+            price = offer.price
+            if self.rng.random() < 0.5:
+                price += self.rng.randint(1, 100)
+            goods.append(
+                {
+                    "id": offer.product_id,
+                    "category": category.id,
+                    "model": offer.model,
+                    "name": offer.product.name,
+                    "price": price,
+                    "price_rrc": offer.price_rrc,
+                    "quantity": offer.quantity,
+                    "parameters": parameters[offer.product_id],
+                }
+            )
+        return json.dumps(
+            {
+                "shop": shop.name,
+                "categories": [
+                    {"id": pk, "name": name} for pk, name in categories.items()
+                ],
+                "goods": goods,
+            },
+            ensure_ascii=False,
+        )
+
+
+def benchmark_endpoints(iterations=200, import_runs=5, seed=0, cold_cache=False):
+    """
+    Отчет о замерах сценариев; изменения данных откатываются, загруженные
+    прайс-листы пишутся во временный каталог
+    """
+    benchmark = EndpointBenchmark(iterations, import_runs, seed, cold_cache)
+    catalog_cache.cache.clear()
+    catalog_cache.reset_stats()
+    started = time.perf_counter()
+    # ответы 409 при нехватке остатка - ожидаемая часть сценария
+    request_logger = logging.getLogger("django.request")
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        MEDIA_ROOT=media_root,
+        ALLOWED_HOSTS=["testserver"],
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        THROTTLE_ENABLED=False,
+    ):
+        try:
+            with transaction.atomic():
+                endpoints = benchmark.run()
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            request_logger.setLevel(level)
+    catalog_cache.cache.clear()
+    return {
+        "vendor": connection.vendor,
+        "created_at": timezone.now().isoformat(),
+        "duration_s": round(time.perf_counter() - started, 2),
+        "iterations": iterations,
+        "cold_cache": cold_cache,
+        "dataset": {
+            "users": User.objects.count(),
+            "shops": Shop.objects.count(),
+            "products": Product.objects.count(),
+            "offers": ProductInfo.objects.count(),
+            "orders": Order.objects.count(),
+        },
+        "cache": catalog_cache.stats(),
+        "endpoints": endpoints,
+    }
+
+
+def compare_reports(baseline, report, threshold=0.2):
+    """
+    Сравнение с прошлым отчетом: относительное изменение p95 и разница
+    среднего числа запросов; регрессия - рост p95 больше ``threshold`` или
+    рост числа запросов
+    """
+    changes = {}
+    regressions = []
+    for name, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            continue
+        p95 = current["p95_ms"] / previous["p95_ms"] - 1 if previous["p95_ms"] else 0
+        queries = current["queries_mean"] - previous["queries_mean"]
+        changes[name] = {"p95_change": round(p95, 3), "queries_change": queries}
+        if p95 > threshold or queries > 0:
+            regressions.append(name)
+    return {"changes": changes, "regressions": regressions}
@@ -0,0 +1,63 @@
+"""
+Массовая запись разных значений в разные строки одним запросом.
+
+``UPDATE ... FROM (VALUES ...)`` передает значения строк параметрами, а не
+выражением ``CASE`` по каждому полю: такой запрос ORM собирает медленнее,
+чем СУБД его выполняет, а условие по составному ключу через ``OR``
+выполняется еще и медленно. Поддерживается PostgreSQL и SQLite 3.33+,
+на остальных СУБД вызывающий код использует ``CASE``.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def supports_update_from(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        return True
+    return (
+        connection.vendor == "sqlite"
+        and connection.Database.sqlite_version_info >= (3, 33)
+    )
+
+
+def update_from_values(
+    model, keys, columns, rows, increment=False, using=DEFAULT_DB_ALIAS, **constants
+):
+    """
+    ``rows`` - кортежи ``(*значения keys, *значения columns)``; с
+    ``increment`` значения прибавляются к текущим, ``constants`` -
+    одинаковые для всех строк значения полей
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in (*keys, *columns)]
+    placeholders = "(%s)" % ", ".join(["%s"] * len(fields))
+    assignments = [
+        f"{quote(column)} = "
+        f"{f'{table}.{quote(column)} + ' if increment else ''}v.column{number}"
+        for number, column in enumerate(columns, start=len(keys) + 1)
+    ]
+    assignments += [f"{quote(column)} = %s" for column in constants]
+    condition = " AND ".join(
+        f"{table}.{quote(key)} = v.column{number}"
+        for number, key in enumerate(keys, start=1)
+    )
+    sql = (
+        f"UPDATE {table} SET {', '.join(assignments)} "
+        f"FROM (VALUES {', '.join([placeholders] * len(rows))}) AS v "
+        f"WHERE {condition}"
+    )
+    # параметры SET идут в запросе раньше VALUES
+    params = [
+        model._meta.get_field(column).get_db_prep_save(value, connection)
+        for column, value in constants.items()
+    ]
+    params += [
+        field.get_db_prep_save(value, connection)
+        for row in rows
+        for field, value in zip(fields, row)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
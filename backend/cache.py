@@ -0,0 +1,230 @@
+"""
+Сквозной кеш чтения каталога.
+
+Кеш работает поверх кеша Django (``CACHES``): локальная память по
+умолчанию или Redis, если задан ``REDIS_URL``. Каждая запись хранит версии
+областей, от которых она зависит (магазин, продукт, категория, список
+каталога...). Инвалидация не удаляет записи, а меняет версию области;
+запись с устаревшей версией при чтении считается промахом. Версии меняются
+после фиксации транзакции, поэтому в кеш не попадают незафиксированные
+или откатанные данные, а читаются до вычисления значения, поэтому
+инвалидация во время вычисления не закрепляет в кеше старые данные.
+"""
+import hashlib
+import secrets
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from backend.metrics import registry
+
+CATALOG = "catalog"
+CATEGORIES = "categories"
+SHOPS = "shops"
+
+_MISSING = object()
+
+
+def shop_scope(pk):
+    return f"shop:{pk}"
+
+
+def product_scope(pk):
+    return f"product:{pk}"
+
+
+def category_scope(pk):
+    return f"category:{pk}"
+
+
+def offer_scope(pk):
+    return f"offer:{pk}"
+
+
+class CatalogCache:
+    """
+    Кеш ответов каталога с версионированными ключами и счетчиками
+    попаданий и промахов
+    """
+
+    def __init__(self, alias=None, timeout=None, prefix="catalog"):
+        self.alias = alias or getattr(settings, "CATALOG_CACHE_ALIAS", "default")
+        self.timeout = timeout or getattr(settings, "CATALOG_CACHE_TIMEOUT", 300)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        if len(key) > 200:
+            key = hashlib.md5(key.encode()).hexdigest()
+        return f"{self.prefix}:entry:{key}"
+
+    def _version_key(self, scope):
+        return f"{self.prefix}:version:{scope}"
+
+    def _versions(self, scopes):
+        keys = {self._version_key(scope): scope for scope in scopes}
+        found = self.cache.get_many(keys)
+        missing = self._new_versions(keys, found)
+        if missing:
+            self.cache.set_many(missing, timeout=None)
+        return {keys[key]: version for key, version in {**found, **missing}.items()}
+
+    async def _aversions(self, scopes):
+        keys = {self._version_key(scope): scope for scope in scopes}
+        found = await self.cache.aget_many(keys)
+        missing = self._new_versions(keys, found)
+        if missing:
+            await self.cache.aset_many(missing, timeout=None)
+        return {keys[key]: version for key, version in {**found, **missing}.items()}
+
+    def _new_versions(self, keys, found):
+        return {key: secrets.token_hex(6) for key in keys if key not in found}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _is_fresh(self, versions, current):
+        return all(
+            current.get(self._version_key(scope)) == version
+            for scope, version in versions.items()
+        )
+
+    def _scopes_key(self, key):
+        return f"{self.prefix}:scopes:{self._key(key)}"
+
+    def _entry(self, snapshot, value, scopes):
+        """
+        (запись кеша с версиями, прочитанными до вычисления значения, None)
+        или (None, области значения), если области ``scopes``-функции до
+        вычисления не были известны
+        """
+        if not callable(scopes):
+            return (snapshot, value), None
+        needed = set(scopes(value))
+        if not needed.issubset(snapshot):
+            return None, sorted(needed)
+        return ({scope: snapshot[scope] for scope in needed}, value), None
+
+    def get_or_set(self, key, producer, scopes=()):
+        """
+        Возвращает значение из кеша или вычисляет его через ``producer``.
+        ``scopes`` - области, от которых зависит значение; может быть
+        функцией от вычисленного значения.
+
+        Версии областей читаются до вычисления: инвалидация, пришедшая во
+        время вычисления, оставляет запись устаревшей, а не сохраняет старые
+        данные под новой версией. Области ``scopes``-функции запоминаются
+        отдельно от записи; пока они неизвестны (первое вычисление или
+        значение сменило области), значение не кешируется
+        """
+        entry = self.cache.get(self._key(key), _MISSING)
+        if entry is not _MISSING:
+            versions, value = entry
+            current = self.cache.get_many(map(self._version_key, versions))
+            if self._is_fresh(versions, current):
+                self._count(hit=True)
+                return value
+        self._count(hit=False)
+        known = (
+            self.cache.get(self._scopes_key(key), ()) if callable(scopes) else scopes
+        )
+        snapshot = self._versions(known)
+        value = producer()
+        entry, needed = self._entry(snapshot, value, scopes)
+        if entry is None:
+            self.cache.set(self._scopes_key(key), needed, timeout=None)
+        else:
+            self.cache.set(self._key(key), entry, timeout=self.timeout)
+        return value
+
+    async def aget_or_set(self, key, producer, scopes=()):
+        """
+        Асинхронный ``get_or_set``: ``producer`` - корутинная функция, кеш
+        читается через асинхронный API кеша Django
+        """
+        entry = await self.cache.aget(self._key(key), _MISSING)
+        if entry is not _MISSING:
+            versions, value = entry
+            current = await self.cache.aget_many(map(self._version_key, versions))
+            if self._is_fresh(versions, current):
+                self._count(hit=True)
+                return value
+        self._count(hit=False)
+        if callable(scopes):
+            known = await self.cache.aget(self._scopes_key(key), ())
+        else:
+            known = scopes
+        snapshot = await self._aversions(known)
+        value = await producer()
+        entry, needed = self._entry(snapshot, value, scopes)
+        if entry is None:
+            await self.cache.aset(self._scopes_key(key), needed, timeout=None)
+        else:
+            await self.cache.aset(self._key(key), entry, timeout=self.timeout)
+        return value
+
+    def invalidate(self, *scopes):
+        """
+        Меняет версии областей после фиксации текущей транзакции
+        """
+        scopes = set(scopes)
+        if scopes:
+            transaction.on_commit(lambda: self._bump(scopes))
+
+    def _bump(self, scopes):
+        self.cache.set_many(
+            {self._version_key(scope): secrets.token_hex(6) for scope in scopes},
+            timeout=None,
+        )
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.cache.__class__.__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+catalog_cache = CatalogCache()
+
+
+def _cache_metrics():
+    stats = catalog_cache.stats()
+    return [
+        ("catalog_cache_hits_total", "counter", stats["hits"]),
+        ("catalog_cache_misses_total", "counter", stats["misses"]),
+    ]
+
+
+registry.add_collector(_cache_metrics)
+
+
+def offer_scopes(data):
+    """
+    Области карточки предложения по ее сериализованным данным
+    """
+    return [
+        offer_scope(data["id"]),
+        shop_scope(data["shop"]["id"]),
+        product_scope(data["product"]["id"]),
+        category_scope(data["product"]["category"]["id"]),
+    ]
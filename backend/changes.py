@@ -0,0 +1,212 @@
+"""
+Лента изменений предложений и заказов для внешних систем.
+
+Изменения пишутся в журнал ``ChangeLog`` в той же транзакции, что и сами
+изменения, в том числе массовые (``ProductInfoQuerySet.update``,
+``backend.stock``, ``backend.importer``, ``backend.transitions``).
+Курсор ленты - номер ``seq`` последней выданной строки журнала: клиент
+передает его в следующем запросе (``cursor`` или заголовок
+``Last-Event-ID`` у Server-Sent Events) и получает только изменения после
+него.
+
+Первичный ключ выделяется при вставке, а виден читателям после коммита,
+поэтому строка с меньшим ключом может появиться позже строки с большим, и
+курсор по ключу пропускал бы изменения долгих транзакций (например,
+импорта). Поэтому зафиксированные строки получают номера ``seq`` больше
+уже выданных (``ChangeLogQuerySet.sequence``): номера растут в порядке
+фиксации, и строка не появится позади курсора. Нумерует воркер фоновых
+задач (``manage.py run_jobs``) на каждом опросе очереди, а чтение ленты
+только читает: строка попадает в ленту после очередного опроса воркера.
+
+Журнал читается пакетами по ``CHANGE_FEED_BATCH_SIZE`` строк по индексу
+``(topic, seq)`` или ``(topic, shop_id, seq)``; несколько изменений одного
+объекта в пакете сводятся к одному, а состояние объектов читается одним
+запросом на пакет из основной БД, так что в ответе - текущее состояние,
+а отсутствующий объект выдается как удаленный. Память сервера ограничена
+одним пакетом и на длинном запросе, и на потоке событий.
+"""
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from backend.models import ChangeLog, Order, ProductInfo
+from Py_Diplom_new.enums import ChangeTopic
+
+# поля состояния объектов в ленте
+FIELDS = {
+    ChangeTopic.offer: (
+        "id",
+        "product_id",
+        "shop_id",
+        "model",
+        "quantity",
+        "price",
+        "price_rrc",
+        "available",
+        "updated_at",
+    ),
+    ChangeTopic.order: (
+        "id",
+        "status",
+        "items_count",
+        "total_sum",
+        "shop_ids",
+        "created_at",
+    ),
+}
+
+MODELS = {ChangeTopic.offer: ProductInfo, ChangeTopic.order: Order}
+
+
+def _states(topic, ids):
+    # реплика может отставать от журнала, поэтому состояние - из основной БД
+    return {
+        row["id"]: row
+        for row in MODELS[topic]
+        .objects.using(DEFAULT_DB_ALIAS)
+        .filter(id__in=ids)
+        .values(*FIELDS[topic])
+    }
+
+
+def read_changes(cursor=0, topics=None, shop=None, limit=None):
+    """
+    Пакет изменений после ``cursor``: (новый курсор, изменения по
+    возрастанию курсора). ``shop`` - только изменения предложений и заказов
+    магазина
+    """
+    limit = limit or settings.CHANGE_FEED_BATCH_SIZE
+    entries = ChangeLog.objects.filter(
+        seq__gt=cursor, topic__in=topics or tuple(ChangeTopic)
+    )
+    if shop is not None:
+        entries = entries.filter(shop_id=shop.id)
+    entries = list(
+        entries.order_by("seq").values_list("seq", "topic", "object_id")[:limit]
+    )
+    if not entries:
+        return cursor, []
+    # от нескольких изменений объекта остается последнее
+    latest = {(topic, object_id): seq for seq, topic, object_id in entries}
+    states = {}
+    for topic in {topic for topic, _ in latest}:
+        states[topic] = _states(
+            topic, [object_id for kind, object_id in latest if kind == topic]
+        )
+    changes = [
+        {
+            "id": seq,
+            "topic": topic,
+            "object_id": object_id,
+            "deleted": object_id not in states[topic],
+            "data": states[topic].get(object_id),
+        }
+        for (topic, object_id), seq in sorted(latest.items(), key=lambda item: item[1])
+    ]
+    return entries[-1][0], changes
+
+
+def wait_changes(cursor=0, topics=None, shop=None, wait=0):
+    """
+    ``read_changes``, который до ``wait`` секунд ждет появления изменений
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        result = read_changes(cursor, topics, shop)
+        if result[1] or time.monotonic() >= deadline:
+            return result
+        time.sleep(
+            max(0, min(settings.CHANGE_FEED_POLL_INTERVAL, deadline - time.monotonic()))
+        )
+
+
+def format_event(change):
+    return (
+        f"id: {change['id']}\n"
+        f"event: {change['topic']}\n"
+        f"data: {json.dumps(change, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n"
+    )
+
+
+def format_retry():
+    return f"retry: {int(settings.CHANGE_FEED_POLL_INTERVAL * 1000)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    ``text/event-stream`` для согласования формата; сами события отдает
+    потоковый ответ, а рендерер выводит только ошибки - событием ``error``
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return (
+            f"event: error\n"
+            f"data: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n"
+        ).encode()
+
+
+def stream_changes(cursor=0, topics=None, shop=None, duration=None):
+    """
+    Server-Sent Events: изменения по мере появления, комментарий-пинг, если
+    изменений нет ``CHANGE_FEED_HEARTBEAT`` секунд. Через ``duration``
+    секунд поток закрывается, и клиент переподключается с
+    ``Last-Event-ID``
+    """
+    duration = settings.CHANGE_FEED_STREAM_SECONDS if duration is None else duration
+    deadline = time.monotonic() + duration
+    heartbeat = time.monotonic() + settings.CHANGE_FEED_HEARTBEAT
+    yield format_retry()
+    while True:
+        cursor, changes = read_changes(cursor, topics, shop)
+        now = time.monotonic()
+        if changes:
+            yield "".join(map(format_event, changes))
+            heartbeat = now + settings.CHANGE_FEED_HEARTBEAT
+        if now >= deadline:
+            return
+        # после непустого пакета журнал читается дальше без паузы
+        if changes:
+            continue
+        if now >= heartbeat:
+            yield ": ping\n\n"
+            heartbeat = now + settings.CHANGE_FEED_HEARTBEAT
+        time.sleep(min(settings.CHANGE_FEED_POLL_INTERVAL, deadline - now))
+
+
+def prune_changes(days=None, batch_size=10000):
+    """
+    Удаляет записи журнала старше ``days`` (``CHANGE_FEED_RETENTION_DAYS``)
+    частями по ``batch_size``; возвращает число удаленных. Строка с
+    последним номером ленты остается: от нее продолжается нумерация
+    """
+    days = settings.CHANGE_FEED_RETENTION_DAYS if days is None else days
+    border = timezone.now() - timedelta(days=days)
+    last = (
+        ChangeLog.objects.filter(seq__isnull=False)
+        .order_by("-seq")
+        .values_list("id", flat=True)[:1]
+    )
+    deleted = 0
+    while True:
+        ids = list(
+            ChangeLog.objects.filter(created_at__lt=border)
+            .exclude(id__in=list(last))
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if ids:
+            deleted += ChangeLog.objects.filter(id__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
@@ -0,0 +1,168 @@
+"""
+Условные HTTP-запросы к каталогу.
+
+ETag и Last-Modified считаются до сериализации по времени изменения строк
+и счетчику версий магазинов одним агрегирующим запросом: на
+``If-None-Match``/``If-Modified-Since`` с актуальной версией сразу
+возвращается 304. Удаление строки не меняет максимальное время изменения,
+поэтому удаление предложения увеличивает версию его магазина, а в
+состояние списков входит число строк. У каждой функции состояния есть
+асинхронный вариант для ASGI-представлений.
+
+Время изменения ставится при записи, а видно после коммита: долгая
+транзакция (импорт прайс-листа) может зафиксировать строки со временем
+меньше уже выданного максимума. Поэтому в состояние каталога входит и
+позиция ленты изменений предложений (``backend.changes``) - последний
+номер ``ChangeLog.seq`` и число зафиксированных, но еще не
+пронумерованных строк: любой коммит записи предложений меняет одно из
+них. Last-Modified в этом случае может не измениться, но ETag при
+``If-None-Match`` имеет приоритет.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Subquery, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from backend.models import Category, ChangeLog, Product, ProductInfo, Shop
+from Py_Diplom_new.enums import ChangeTopic
+
+
+def _latest(model):
+    return Max(Subquery(model.objects.order_by("-updated_at").values("updated_at")[:1]))
+
+
+def _offer_changes():
+    changes = ChangeLog.objects.filter(topic=ChangeTopic.offer)
+    return {
+        "changes": Max(
+            Subquery(
+                changes.filter(seq__isnull=False).order_by("-seq").values("seq")[:1]
+            )
+        ),
+        "pending_changes": Max(
+            Subquery(
+                changes.filter(seq__isnull=True)
+                .order_by()
+                .values("topic")
+                .annotate(count=Count("id"))
+                .values("count")
+            )
+        ),
+    }
+
+
+def _catalog_aggregates():
+    return {
+        **_offer_changes(),
+        "shops": Count("id"),
+        "version": Sum("version"),
+        "shops_updated_at": Max("updated_at"),
+        "offers_updated_at": _latest(ProductInfo),
+        "products_updated_at": _latest(Product),
+        "categories_updated_at": _latest(Category),
+    }
+
+
+def _offer_values(pk):
+    return ProductInfo.objects.filter(pk=pk).values(
+        "updated_at",
+        "product__updated_at",
+        "product__category__updated_at",
+        "shop__version",
+        "shop__updated_at",
+    )
+
+
+def catalog_state(request, *args, **kwargs):
+    return Shop.objects.aggregate(**_catalog_aggregates())
+
+
+async def acatalog_state():
+    return await Shop.objects.aaggregate(**_catalog_aggregates())
+
+
+def shops_state(request, *args, **kwargs):
+    return Shop.objects.aggregate(
+        shops=Count("id"), version=Sum("version"), updated_at=Max("updated_at")
+    )
+
+
+def categories_state(request, *args, **kwargs):
+    return Category.objects.aggregate(
+        categories=Count("id"), updated_at=Max("updated_at")
+    )
+
+
+def offer_state(request, *args, pk, **kwargs):
+    return _offer_values(pk).first()
+
+
+async def aoffer_state(pk):
+    return await _offer_values(pk).afirst()
+
+
+def state_etag(request, values):
+    if values is None:
+        return None
+    key = "|".join(f"{name}={values[name]}" for name in sorted(values))
+    return hashlib.md5(f"{request.get_full_path()}|{key}".encode()).hexdigest()
+
+
+def state_last_modified(values):
+    if values is None:
+        return None
+    return max(
+        (
+            value
+            for name, value in values.items()
+            if name.endswith("updated_at") and value is not None
+        ),
+        default=None,
+    )
+
+
+def conditional(state):
+    """
+    Декоратор класса представления: ETag и Last-Modified для ``get`` по
+    состоянию, которое возвращает ``state`` (``None`` - объекта нет)
+    """
+
+    def get_state(request, *args, **kwargs):
+        # ETag и Last-Modified считаются по одному запросу к БД
+        states = request.__dict__.setdefault("_conditional_states", {})
+        if state not in states:
+            states[state] = state(request, *args, **kwargs)
+        return states[state]
+
+    def etag(request, *args, **kwargs):
+        return state_etag(request, get_state(request, *args, **kwargs))
+
+    def last_modified(request, *args, **kwargs):
+        return state_last_modified(get_state(request, *args, **kwargs))
+
+    return method_decorator(
+        condition(etag_func=etag, last_modified_func=last_modified), name="get"
+    )
+
+
+def conditional_response(request, values):
+    """
+    Для представлений без декоратора ``condition`` (асинхронных): ответ 304
+    или ``None`` и заголовки валидаторов для обычного ответа
+    """
+    etag = state_etag(request, values)
+    last_modified = state_last_modified(values)
+    headers = {}
+    if etag is not None:
+        headers["ETag"] = quote_etag(etag)
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified.timestamp())
+    response = get_conditional_response(
+        request,
+        etag=headers.get("ETag"),
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    return response, headers
@@ -0,0 +1,187 @@
+"""
+Потоковая выгрузка каталога и прайс-листов магазинов.
+
+Предложения читаются курсором на стороне сервера (``iterator(chunk_size)``,
+на PostgreSQL - именованный курсор) пакетами по ``chunk_size`` строк,
+параметры продуктов подгружаются одним запросом на пакет, и каждая строка
+сразу превращается в текст. В памяти одновременно находится не больше
+одного пакета, сколько бы предложений ни выгружалось.
+
+Выгрузка магазина в CSV и YAML совпадает с форматом импорта
+(``backend.importer``) и загружается обратно как его прайс-лист. В выгрузке
+всего каталога у каждой строки есть еще колонка ``shop``; JSON Lines -
+одна запись-предложение на строку.
+"""
+import csv
+import io
+import json
+
+import yaml
+from django.db.models import Prefetch
+
+from backend.models import Category, Parameter, ProductInfo, ProductParameter
+
+DEFAULT_CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+FORMATS = ("csv", "jsonl", "yaml")
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "yaml": "application/x-yaml; charset=utf-8",
+}
+
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+_CSV_FIELDS = ("id", "category", "name", "model", "price", "price_rrc", "quantity")
+
+
+class ExportError(ValueError):
+    """
+    Неизвестный формат выгрузки
+    """
+
+
+def export_queryset(shop=None):
+    offers = (
+        ProductInfo.objects.select_related("product__category", "shop")
+        .prefetch_related(
+            Prefetch(
+                "product__products_info",
+                queryset=ProductParameter.objects.select_related("parameter"),
+            )
+        )
+        .order_by("id")
+    )
+    if shop is not None:
+        offers = offers.filter(shop=shop)
+    return offers
+
+
+def _good(offer):
+    product = offer.product
+    return {
+        "id": product.id,
+        "category": product.category_id,
+        "name": product.name,
+        "model": offer.model,
+        "price": offer.price,
+        "price_rrc": offer.price_rrc,
+        "quantity": offer.quantity,
+        "parameters": {
+            parameter.parameter.name: parameter.value
+            for parameter in product.products_info.all()
+        },
+    }
+
+
+class CatalogExporter:
+    """
+    Генераторы текста выгрузки; ``shop=None`` - весь каталог
+    """
+
+    def __init__(self, shop=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.shop = shop
+        self.chunk_size = chunk_size
+        self.offers = export_queryset(shop)
+
+    def export(self, fmt):
+        if fmt not in FORMATS:
+            raise ExportError(f"Неизвестный формат выгрузки: {fmt}")
+        return self._buffered(getattr(self, f"_{fmt}")())
+
+    def _buffered(self, texts):
+        # строки склеиваются во фрагменты около BUFFER_SIZE символов, чтобы
+        # не отдавать серверу по одной строке
+        parts = []
+        size = 0
+        for text in texts:
+            parts.append(text)
+            size += len(text)
+            if size >= BUFFER_SIZE:
+                yield "".join(parts)
+                parts = []
+                size = 0
+        if parts:
+            yield "".join(parts)
+
+    def _iter_offers(self):
+        return self.offers.iterator(chunk_size=self.chunk_size)
+
+    def _categories(self):
+        return Category.objects.filter(
+            id__in=self.offers.values("product__category_id")
+        ).order_by("id")
+
+    def _csv(self):
+        parameters = list(
+            Parameter.objects.filter(
+                product_parameters__product__in=self.offers.values("product_id")
+            )
+            .order_by("name")
+            .values_list("name", flat=True)
+            .distinct()
+        )
+        fields = list(_CSV_FIELDS) + parameters
+        if self.shop is None:
+            fields.insert(0, "shop")
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fields)
+
+        def flush():
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return text
+
+        writer.writeheader()
+        yield flush()
+        for offer in self._iter_offers():
+            good = _good(offer)
+            row = good.pop("parameters")
+            row.update(good, category=offer.product.category.name)
+            if self.shop is None:
+                row["shop"] = offer.shop.name
+            writer.writerow(row)
+            yield flush()
+
+    def _jsonl(self):
+        for offer in self._iter_offers():
+            good = _good(offer)
+            record = {
+                "offer": offer.id,
+                "shop": {"id": offer.shop_id, "name": offer.shop.name},
+                "category": {
+                    "id": good["category"],
+                    "name": offer.product.category.name,
+                },
+            }
+            good.pop("category")
+            record.update(good)
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    def _yaml(self):
+        def dump(value):
+            return yaml.dump(
+                value, Dumper=_YAML_DUMPER, allow_unicode=True, sort_keys=False
+            )
+
+        if self.shop is not None:
+            yield dump({"shop": self.shop.name})
+        yield "categories:\n"
+        for category in self._categories().iterator(chunk_size=self.chunk_size):
+            yield dump([{"id": category.id, "name": category.name}])
+        yield "goods:\n"
+        for offer in self._iter_offers():
+            good = _good(offer)
+            if self.shop is None:
+                good["shop"] = offer.shop.name
+            yield dump([good])
+
+
+def export_catalog(fmt, shop=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Генератор фрагментов текста выгрузки каталога или магазина ``shop``
+    """
+    return CatalogExporter(shop, chunk_size).export(fmt)
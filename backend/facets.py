@@ -0,0 +1,180 @@
+"""
+Индекс фасетов каталога.
+
+Таблица ``ProductFacet`` хранит копию всего, по чему фильтруют каталог:
+категорию, магазин и цену предложения и значения параметров его продукта.
+Фильтрация и подсчет фасетов идут по одной таблице с индексами, без
+соединений с ``ProductParameter``. Индекс обновляется путем импорта и
+сигналами при одиночных изменениях.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, Count, Max, Min, Value, When
+
+from backend.bulk import supports_update_from, update_from_values
+
+from backend.models import (
+    Category,
+    Parameter,
+    ProductFacet,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+
+REFRESH_BATCH_SIZE = 1000
+
+
+def refresh_product_facets(product_ids):
+    """
+    Перестраивает строки индекса для всех предложений указанных продуктов
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    ProductFacet.objects.filter(product_id__in=product_ids).delete()
+    parameters = defaultdict(list)
+    for product_id, parameter_id, value in ProductParameter.objects.filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "parameter_id", "value"):
+        parameters[product_id].append((parameter_id, value))
+    rows = []
+    offers = ProductInfo.objects.filter(product_id__in=product_ids).values_list(
+        "id", "product_id", "shop_id", "product__category_id", "price", "available"
+    )
+    for info_id, product_id, shop_id, category_id, price, available in offers:
+        common = {
+            "product_info_id": info_id,
+            "product_id": product_id,
+            "shop_id": shop_id,
+            "category_id": category_id,
+            "price": price,
+            "available": available,
+        }
+        rows.append(ProductFacet(**common))
+        rows.extend(
+            ProductFacet(parameter_id=parameter_id, value=value, **common)
+            for parameter_id, value in parameters[product_id]
+        )
+    ProductFacet.objects.bulk_create(rows, batch_size=REFRESH_BATCH_SIZE)
+
+
+def update_facet_prices(prices):
+    """
+    Переписывает цены предложений ``{id предложения: цена}`` в строках
+    индекса одним запросом, не перестраивая их
+    """
+    if not prices:
+        return
+    if supports_update_from():
+        update_from_values(
+            ProductFacet, ("product_info_id",), ("price",), list(prices.items())
+        )
+        return
+    ProductFacet.objects.filter(product_info_id__in=prices).update(
+        price=Case(
+            *[
+                When(product_info_id=pk, then=Value(price))
+                for pk, price in prices.items()
+            ]
+        )
+    )
+
+
+def rebuild_facets(batch_size=REFRESH_BATCH_SIZE):
+    """
+    Полная перестройка индекса фасетов
+    """
+    ProductFacet.objects.all().delete()
+    product_ids = (
+        ProductInfo.objects.order_by("product_id")
+        .values_list("product_id", flat=True)
+        .distinct()
+        .iterator(chunk_size=batch_size)
+    )
+    chunk = []
+    for product_id in product_ids:
+        chunk.append(product_id)
+        if len(chunk) >= batch_size:
+            refresh_product_facets(chunk)
+            chunk = []
+    refresh_product_facets(chunk)
+
+
+def filter_offers(
+    category=None, shop=None, price_min=None, price_max=None, parameters=None
+):
+    """
+    Строки индекса без параметра (по одной на предложение), подходящие под
+    фильтр. ``parameters`` - словарь ``{название: [значения]}``: значения
+    одного параметра объединяются через ИЛИ, разные параметры - через И
+    """
+    offers = ProductFacet.objects.filter(parameter__isnull=True, available=True)
+    if category:
+        offers = offers.filter(category_id__in=category)
+    if shop:
+        offers = offers.filter(shop_id__in=shop)
+    if price_min is not None:
+        offers = offers.filter(price__gte=price_min)
+    if price_max is not None:
+        offers = offers.filter(price__lte=price_max)
+    if parameters:
+        ids = defaultdict(list)
+        for pk, name in Parameter.objects.filter(name__in=parameters).values_list(
+            "id", "name"
+        ):
+            ids[name].append(pk)
+        for name, values in parameters.items():
+            offers = offers.filter(
+                product_info_id__in=ProductFacet.objects.filter(
+                    parameter_id__in=ids[name], value__in=values
+                ).values("product_info_id")
+            )
+    return offers
+
+
+def facet_counts(offers):
+    """
+    Число подходящих предложений по категориям, магазинам и значениям
+    параметров, а также диапазон цен
+    """
+    categories = dict(
+        offers.order_by().values_list("category_id").annotate(count=Count("id"))
+    )
+    shops = dict(offers.order_by().values_list("shop_id").annotate(count=Count("id")))
+    values = (
+        ProductFacet.objects.filter(
+            parameter__isnull=False,
+            product_info_id__in=offers.values("product_info_id"),
+        )
+        .order_by()
+        .values_list("parameter_id", "value")
+        .annotate(count=Count("id"))
+    )
+    parameters = defaultdict(list)
+    for parameter_id, value, count in values:
+        parameters[parameter_id].append({"value": value, "count": count})
+    names = dict(Parameter.objects.filter(id__in=parameters).values_list("id", "name"))
+    category_names = dict(
+        Category.objects.filter(id__in=categories).values_list("id", "name")
+    )
+    shop_names = dict(Shop.objects.filter(id__in=shops).values_list("id", "name"))
+    return {
+        "price": offers.aggregate(min=Min("price"), max=Max("price")),
+        "categories": [
+            {"id": pk, "name": category_names.get(pk), "count": count}
+            for pk, count in categories.items()
+        ],
+        "shops": [
+            {"id": pk, "name": shop_names.get(pk), "count": count}
+            for pk, count in shops.items()
+        ],
+        "parameters": [
+            {
+                "id": pk,
+                "name": names.get(pk),
+                "values": sorted(items, key=lambda item: -item["count"]),
+            }
+            for pk, items in parameters.items()
+        ],
+    }
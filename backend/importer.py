@@ -0,0 +1,689 @@
+"""
+Потоковый импорт прайс-листов магазинов.
+
+Файл прайс-листа (YAML, JSON или CSV) читается по одной записи, товары
+накапливаются в пакеты фиксированного размера, и каждый пакет записывается
+постоянным числом запросов: справочники разрешаются через словари в памяти,
+а ``ProductInfo`` и ``ProductParameter`` пишутся через ``bulk_create`` /
+``bulk_update`` по ключу ограничения ``unique_product_info``.
+
+Повторный импорт инкрементален: для каждой строки ``ProductInfo`` хранится
+отпечаток содержимого (``fingerprint``), и строки с неизменившимся
+отпечатком, как и параметры их продуктов, не перезаписываются. Для
+добавленных и измененных строк обновляется только то, что зависит от
+изменившихся полей: параметры и строки фасетов продукта - при новых
+параметрах, поисковые документы - при новых параметрах или модели, цены
+в индексе фасетов - на месте, лучшие предложения продуктов
+(``ProductBestOffer``) - при новых цене или остатке.
+
+Предложения, которых нет в новом прайс-листе, удаляются, если на них нет
+ссылок из позиций заказов и сводок продаж. Остальные снимаются с продажи:
+остаток обнуляется, а отпечаток сбрасывается, - иначе удаление каскадом
+унесло бы позиции оформленных заказов и их сводки. Продукты каждого пакета
+отмечаются в ``ImportMark``, и пропавшие предложения выбираются запросом
+порциями по размеру пакета: память импорта не растет с размером каталога.
+
+Формат YAML/JSON::
+
+    shop: Связной
+    categories:
+      - id: 224
+        name: Смартфоны
+    goods:
+      - id: 4216292
+        category: 224
+        model: apple/iphone/xs-max
+        name: Смартфон Apple iPhone XS Max 512GB (золотистый)
+        price: 110000
+        price_rrc: 116990
+        quantity: 14
+        parameters:
+          "Диагональ (дюйм)": 6.5
+
+В CSV каждая строка - товар: колонки ``category`` (название категории),
+``name``, ``model``, ``price``, ``price_rrc``, ``quantity``, необязательная
+``id``; остальные непустые колонки считаются параметрами товара.
+"""
+import codecs
+import csv
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import asdict, dataclass, field
+
+import yaml
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from backend.cache import (
+    CATALOG,
+    CATEGORIES,
+    SHOPS,
+    catalog_cache,
+    product_scope,
+    shop_scope,
+)
+from backend.facets import refresh_product_facets, update_facet_prices
+from backend.models import (
+    Category,
+    ChangeLog,
+    ImportMark,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductBestOffer,
+    ProductInfo,
+    ProductParameter,
+    ShopProductSales,
+    ShopStock,
+)
+from backend.search import index_products, unindex_offers
+from Py_Diplom_new.enums import ChangeTopic
+
+DEFAULT_BATCH_SIZE = 1000
+
+# сколько идентификаторов продуктов каждого вида попадает в отчет импорта
+REPORT_LIMIT = 1000
+
+FORMATS = ("yaml", "json", "csv")
+
+_EXTENSIONS = {".yaml": "yaml", ".yml": "yaml", ".json": "json", ".csv": "csv"}
+
+_SECTIONS = {"categories": "category", "goods": "good"}
+
+_GOOD_FIELDS = ("id", "category", "name", "model", "price", "price_rrc", "quantity")
+
+_INFO_FIELDS = ("model", "quantity", "price", "price_rrc")
+
+
+class PriceListError(ValueError):
+    """
+    Ошибка формата или содержимого прайс-листа
+    """
+
+
+@dataclass
+class ImportResult:
+    """
+    Итог импорта прайс-листа: счетчики строк, число изменений по полям и
+    идентификаторы продуктов добавленных, измененных и удаленных или снятых
+    с продажи строк - не больше ``REPORT_LIMIT`` каждого вида
+    """
+
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    retired: int = 0
+    batches: int = 0
+    changed_fields: dict = field(default_factory=dict)
+    added: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+
+    def report(self, kind, product_ids):
+        ids = getattr(self, kind)
+        ids.extend(product_ids[: max(REPORT_LIMIT - len(ids), 0)])
+
+    def as_dict(self, details=True):
+        data = asdict(self)
+        if not details:
+            for key in ("added", "changed", "removed"):
+                del data[key]
+        return data
+
+
+def fingerprint(good):
+    """
+    Отпечаток содержимого строки прайс-листа вместе с ее параметрами
+    """
+    payload = [good[name] for name in _INFO_FIELDS]
+    payload.append(sorted(good["parameters"].items()))
+    return hashlib.md5(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+def detect_format(filename):
+    """
+    Определяет формат прайс-листа по расширению файла
+    """
+    ext = os.path.splitext(str(filename))[1].lower()
+    try:
+        return _EXTENSIONS[ext]
+    except KeyError:
+        raise PriceListError(f"Неизвестный формат прайс-листа: {filename}")
+
+
+def _check_length(model, name, value):
+    limit = model._meta.get_field(name).max_length
+    if len(value) > limit:
+        raise PriceListError(
+            f"Значение поля {model.__name__}.{name} длиннее {limit} символов: "
+            f"{value[:limit]}..."
+        )
+
+
+def _text(stream):
+    if isinstance(stream.read(0), bytes):
+        return codecs.getreader("utf-8-sig")(stream)
+    return stream
+
+
+# YAML
+
+
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_yaml_resolver = yaml.resolver.Resolver()
+_yaml_constructor = yaml.constructor.SafeConstructor()
+
+
+def _yaml_scalar(event):
+    tag = event.tag
+    if tag is None or tag == "!":
+        tag = _yaml_resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+    construct = _yaml_constructor.yaml_constructors.get(tag)
+    if construct is None:
+        return event.value
+    return construct(_yaml_constructor, yaml.ScalarNode(tag, event.value))
+
+
+def _yaml_value(event, events):
+    if isinstance(event, yaml.ScalarEvent):
+        return _yaml_scalar(event)
+    if isinstance(event, yaml.SequenceStartEvent):
+        items = []
+        for item in events:
+            if isinstance(item, yaml.SequenceEndEvent):
+                return items
+            items.append(_yaml_value(item, events))
+    if isinstance(event, yaml.MappingStartEvent):
+        mapping = {}
+        for key in events:
+            if isinstance(key, yaml.MappingEndEvent):
+                return mapping
+            mapping[_yaml_value(key, events)] = _yaml_value(next(events), events)
+    raise PriceListError(f"Неподдерживаемая конструкция YAML: {event}")
+
+
+def _iter_yaml(stream):
+    events = yaml.parse(stream, Loader=_YAML_LOADER)
+    for event in events:
+        if isinstance(event, yaml.MappingStartEvent):
+            break
+        if not isinstance(event, (yaml.StreamStartEvent, yaml.DocumentStartEvent)):
+            raise PriceListError("Прайс-лист должен быть словарем")
+    else:
+        return
+    for key in events:
+        if isinstance(key, yaml.MappingEndEvent):
+            return
+        key = _yaml_value(key, events)
+        event = next(events)
+        if key in _SECTIONS and isinstance(event, yaml.SequenceStartEvent):
+            for item in events:
+                if isinstance(item, yaml.SequenceEndEvent):
+                    break
+                yield _SECTIONS[key], _yaml_value(item, events)
+        else:
+            value = _yaml_value(event, events)
+            if key == "shop":
+                yield "shop", value
+
+
+# JSON
+
+
+class _JsonReader:
+    """
+    Посимвольный разбор JSON поверх буфера, дочитываемого порциями
+    """
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise PriceListError(f"Ошибка разбора JSON: ожидался символ {char!r}")
+        self._pos += 1
+
+    def skip(self, char):
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as exc:
+                if self._fill():
+                    continue
+                raise PriceListError(f"Ошибка разбора JSON: {exc}")
+            # число на границе буфера могло быть прочитано не полностью
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def _iter_json(stream):
+    reader = _JsonReader(stream)
+    reader.expect("{")
+    if reader.skip("}"):
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key in _SECTIONS and reader.skip("["):
+            if not reader.skip("]"):
+                while True:
+                    yield _SECTIONS[key], reader.value()
+                    if not reader.skip(","):
+                        reader.expect("]")
+                        break
+        else:
+            value = reader.value()
+            if key == "shop":
+                yield "shop", value
+        if not reader.skip(","):
+            reader.expect("}")
+            return
+
+
+# CSV
+
+
+def _iter_csv(stream):
+    categories = set()
+    for row in csv.DictReader(stream):
+        category = row.get("category")
+        if category and category not in categories:
+            categories.add(category)
+            yield "category", {"id": category, "name": category}
+        good = {key: row.get(key) for key in _GOOD_FIELDS}
+        good["parameters"] = {
+            key: value
+            for key, value in row.items()
+            if key not in _GOOD_FIELDS and key and value not in (None, "")
+        }
+        yield "good", good
+
+
+_READERS = {"yaml": _iter_yaml, "json": _iter_json, "csv": _iter_csv}
+
+
+def iter_price_list(stream, fmt):
+    """
+    Последовательно отдает записи прайс-листа в виде пар ``(вид, данные)``,
+    где вид - ``shop``, ``category`` или ``good``
+    """
+    try:
+        reader = _READERS[fmt]
+    except KeyError:
+        raise PriceListError(f"Неизвестный формат прайс-листа: {fmt}")
+    try:
+        yield from reader(_text(stream))
+    except (yaml.YAMLError, csv.Error, UnicodeDecodeError) as exc:
+        raise PriceListError(f"Ошибка разбора прайс-листа: {exc}")
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа магазина пакетами фиксированного размера
+    """
+
+    def __init__(self, shop, batch_size=DEFAULT_BATCH_SIZE):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self._categories = {}
+        self._pending_categories = {}
+        self._parameters = {}
+        self._token = uuid.uuid4().hex
+
+    def run(self, stream, fmt):
+        with transaction.atomic():
+            goods = []
+            for kind, payload in iter_price_list(stream, fmt):
+                if kind == "category":
+                    external_id, name = self._clean_category(payload)
+                    self._pending_categories[external_id] = name
+                elif kind == "good":
+                    goods.append(self._clean_good(payload))
+                    if len(goods) >= self.batch_size:
+                        self._flush(goods)
+                        goods = []
+            if goods:
+                self._flush(goods)
+            self._delete_missing()
+            ImportMark.objects.filter(token=self._token).delete()
+            # bulk-запись обходит сигналы, поэтому кеш каталога сбрасывается
+            # здесь: весь магазин, а продукты - по пакетам
+            catalog_cache.invalidate(
+                shop_scope(self.shop.id), SHOPS, CATEGORIES, CATALOG
+            )
+        return self.result
+
+    def _clean_category(self, category):
+        try:
+            external_id, name = str(category["id"]), str(category["name"])
+        except (KeyError, TypeError) as exc:
+            raise PriceListError(f"Некорректная запись категории: {exc}")
+        _check_length(Category, "name", name)
+        return external_id, name
+
+    def _clean_good(self, good):
+        if not isinstance(good, dict):
+            raise PriceListError(f"Некорректная запись товара: {good!r}")
+        try:
+            cleaned = {
+                "category": str(good["category"]),
+                "name": str(good["name"]),
+                "model": str(good["model"]) if good.get("model") else None,
+                "price": int(good["price"]),
+                "price_rrc": int(good["price_rrc"]),
+                "quantity": int(good["quantity"]),
+            }
+        except (KeyError, TypeError, ValueError) as exc:
+            raise PriceListError(f"Некорректная запись товара {good.get('id')}: {exc}")
+        cleaned["parameters"] = {
+            str(name): str(value)
+            for name, value in (good.get("parameters") or {}).items()
+        }
+        _check_length(Product, "name", cleaned["name"])
+        if cleaned["model"]:
+            _check_length(ProductInfo, "model", cleaned["model"])
+        for name, value in cleaned["parameters"].items():
+            _check_length(Parameter, "name", name)
+            _check_length(ProductParameter, "value", value)
+        return cleaned
+
+    def _flush_categories(self):
+        pending = self._pending_categories
+        self._pending_categories = {}
+        names = set(pending.values())
+        lookup = Category.objects.filter(name__in=names).order_by("id")
+        by_name = {}
+        for category in lookup:
+            by_name.setdefault(category.name, category)
+        missing = [Category(name=name) for name in names if name not in by_name]
+        if missing:
+            Category.objects.bulk_create(missing)
+            for category in lookup.all():
+                by_name.setdefault(category.name, category)
+        self.shop.categories.add(*by_name.values())
+        for external_id, name in pending.items():
+            self._categories[external_id] = by_name[name]
+
+    def _resolve_parameters(self, goods):
+        names = {name for good in goods for name in good["parameters"]}
+        missing = names.difference(self._parameters)
+        if missing:
+            for name, pk in Parameter.objects.filter(name__in=missing).values_list(
+                "name", "id"
+            ):
+                self._parameters.setdefault(name, pk)
+            created = [
+                Parameter(name=name) for name in missing if name not in self._parameters
+            ]
+            if created:
+                Parameter.objects.bulk_create(created)
+                for name, pk in Parameter.objects.filter(
+                    name__in=[parameter.name for parameter in created]
+                ).values_list("name", "id"):
+                    self._parameters.setdefault(name, pk)
+
+    def _resolve_products(self, goods):
+        keys = set()
+        for good in goods:
+            try:
+                category = self._categories[good["category"]]
+            except KeyError:
+                raise PriceListError(f"Неизвестная категория: {good['category']}")
+            keys.add((good["name"], category.id))
+        lookup = Product.objects.filter(
+            name__in={name for name, _ in keys},
+            category_id__in={category_id for _, category_id in keys},
+        ).order_by("id")
+        products = {}
+        for product in lookup:
+            products.setdefault((product.name, product.category_id), product)
+        missing = [
+            Product(name=name, category_id=category_id)
+            for name, category_id in keys
+            if (name, category_id) not in products
+        ]
+        if missing:
+            Product.objects.bulk_create(missing)
+            # не все СУБД возвращают первичные ключи из bulk_create
+            if any(product.pk is None for product in missing):
+                missing = lookup.all()
+            for product in missing:
+                products.setdefault((product.name, product.category_id), product)
+        return products
+
+    def _flush(self, goods):
+        if self._pending_categories:
+            self._flush_categories()
+        products = self._resolve_products(goods)
+        self._resolve_parameters(goods)
+
+        rows = {}
+        for good in goods:
+            category = self._categories[good["category"]]
+            product = products[(good["name"], category.id)]
+            rows[product.id] = good
+
+        existing = {
+            info.product_id: info
+            for info in ProductInfo.objects.filter(shop=self.shop, product_id__in=rows)
+        }
+        to_create = []
+        to_update = []
+        added = []
+        changed = []
+        stock = 0
+        # продукты, у которых меняются параметры, поисковые документы и
+        # лучшие предложения, и новые цены строк для индекса фасетов
+        parameters = {}
+        documents = set()
+        offers = set()
+        prices = {}
+        for product_id, good in rows.items():
+            digest = fingerprint(good)
+            info = existing.get(product_id)
+            if info is None:
+                to_create.append(
+                    ProductInfo(
+                        shop=self.shop,
+                        product_id=product_id,
+                        available=self.shop.state,
+                        fingerprint=digest,
+                        **{name: good[name] for name in _INFO_FIELDS},
+                    )
+                )
+                added.append(product_id)
+                stock += good["quantity"]
+                fields = ["parameters", *_INFO_FIELDS]
+            elif info.fingerprint == digest:
+                self.result.unchanged += 1
+                continue
+            else:
+                fields = [
+                    name for name in _INFO_FIELDS if getattr(info, name) != good[name]
+                ]
+                # у строк, импортированных до появления отпечатков, его нет
+                if info.fingerprint and not fields:
+                    fields = ["parameters"]
+                stock += good["quantity"] - info.quantity
+                for name in fields:
+                    self.result.changed_fields[name] = (
+                        self.result.changed_fields.get(name, 0) + 1
+                    )
+                    if name != "parameters":
+                        setattr(info, name, good[name])
+                info.fingerprint = digest
+                to_update.append(info)
+                changed.append(product_id)
+                if "price" in fields and "parameters" not in fields:
+                    prices[info.id] = good["price"]
+            if "parameters" in fields:
+                parameters[product_id] = good
+            if "parameters" in fields or "model" in fields:
+                documents.add(product_id)
+            if "price" in fields or "quantity" in fields:
+                offers.add(product_id)
+        if to_create:
+            ProductInfo.objects.bulk_create(to_create)
+            # изменения bulk_update журнал пишет сам, а вставку - нет
+            ChangeLog.objects.record_query(
+                ChangeTopic.offer,
+                ProductInfo.objects.filter(
+                    shop=self.shop,
+                    product_id__in=[info.product_id for info in to_create],
+                ).values_list("id", "shop_id"),
+            )
+        if to_update:
+            ProductInfo.objects.bulk_update(to_update, [*_INFO_FIELDS, "fingerprint"])
+        ShopStock.objects.add({self.shop.id: stock})
+        # индексы фасетов и поиска не хранят остатков, а поиск - и цен:
+        # строки с новыми ценой и остатком не перестраиваются
+        if parameters:
+            self._sync_parameters(parameters)
+            # параметры общие для всех магазинов продукта
+            Product.objects.filter(id__in=parameters).touch()
+            refresh_product_facets(parameters)
+        update_facet_prices(prices)
+        index_products(documents)
+        ProductBestOffer.objects.refresh(offers)
+        catalog_cache.invalidate(*map(product_scope, added + changed))
+        ImportMark.objects.bulk_create(
+            [ImportMark(token=self._token, product_id=pk) for pk in rows],
+            ignore_conflicts=True,
+        )
+
+        self.result.report("added", added)
+        self.result.report("changed", changed)
+        self.result.created += len(to_create)
+        self.result.updated += len(to_update)
+        self.result.batches += 1
+
+    def _sync_parameters(self, rows):
+        existing = {
+            (item.product_id, item.parameter_id): item
+            for item in ProductParameter.objects.filter(product_id__in=rows)
+        }
+        to_create = []
+        to_update = []
+        for product_id, good in rows.items():
+            for name, value in good["parameters"].items():
+                parameter_id = self._parameters[name]
+                item = existing.get((product_id, parameter_id))
+                if item is None:
+                    to_create.append(
+                        ProductParameter(
+                            product_id=product_id,
+                            parameter_id=parameter_id,
+                            value=value,
+                        )
+                    )
+                elif item.value != value:
+                    item.value = value
+                    to_update.append(item)
+        if to_create:
+            ProductParameter.objects.bulk_create(to_create)
+        if to_update:
+            ProductParameter.objects.bulk_update(to_update, ["value"])
+
+    def _delete_missing(self):
+        stale = (
+            ProductInfo.objects.filter(shop=self.shop)
+            .filter(
+                ~Exists(
+                    ImportMark.objects.filter(
+                        token=self._token, product_id=OuterRef("product_id")
+                    )
+                )
+            )
+            .order_by("id")
+            .values_list("id", "product_id", "quantity", "fingerprint")
+        )
+        last = 0
+        while True:
+            rows = list(stale.filter(id__gt=last)[: self.batch_size])
+            if not rows:
+                break
+            last = rows[-1][0]
+            products = {pk: product_id for pk, product_id, _, _ in rows}
+            quantities = {pk: quantity for pk, _, quantity, _ in rows}
+            # снятые с продажи прошлым импортом не перезаписываются
+            retired = {
+                pk for pk, _, quantity, digest in rows if not quantity and not digest
+            }
+            kept = set(
+                OrderItem.objects.filter(product_info_id__in=products).values_list(
+                    "product_info_id", flat=True
+                )
+            )
+            kept.update(
+                ShopProductSales.objects.filter(
+                    product_info_id__in=products
+                ).values_list("product_info_id", flat=True)
+            )
+            removed = [pk for pk in products if pk not in kept]
+            if removed:
+                ProductInfo.objects.filter(id__in=removed).delete()
+                unindex_offers(removed)
+            retire = sorted(kept.difference(retired))
+            if retire:
+                # UPDATE пишет журнал изменений сам
+                ProductInfo.objects.filter(id__in=retire).update(
+                    quantity=0, fingerprint=""
+                )
+                ShopStock.objects.add(
+                    {self.shop.id: -sum(quantities[pk] for pk in retire)}
+                )
+                ProductBestOffer.objects.refresh(products[pk] for pk in retire)
+            product_ids = [products[pk] for pk in (*removed, *retire)]
+            catalog_cache.invalidate(*map(product_scope, product_ids))
+            self.result.report("removed", product_ids)
+            self.result.deleted += len(removed)
+            self.result.retired += len(retire)
+
+
+def import_price_list(shop, stream=None, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Импортирует прайс-лист магазина; по умолчанию читается ``Shop.filename``
+    """
+    importer = PriceListImporter(shop, batch_size=batch_size)
+    if stream is not None:
+        return importer.run(stream, fmt or detect_format(getattr(stream, "name", "")))
+    if not shop.filename:
+        raise PriceListError("У магазина не загружен прайс-лист")
+    with shop.filename.open("rb") as stream:
+        return importer.run(stream, fmt or detect_format(shop.filename.name))
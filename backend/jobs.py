@@ -0,0 +1,372 @@
+"""
+Фоновые задачи на таблице ``Job`` без внешнего брокера.
+
+Задача ставится в очередь в той же транзакции, что и данные, из-за которых
+она возникла: при откате задачи не будет, а воркер не увидит ее раньше
+фиксации. Воркер (``manage.py run_jobs``) забирает готовые задачи условным
+UPDATE ``queued -> running`` (на PostgreSQL кандидаты выбираются через
+``SELECT ... FOR UPDATE SKIP LOCKED``), поэтому несколько процессов и
+потоков не выполняют одну задачу дважды. Исключение в обработчике
+приводит к повтору с экспоненциальной задержкой, после ``max_attempts``
+попыток или при ``JobError`` задача помечается ``failed``. Пока
+обработчик работает, воркер раз в ``JOBS_HEARTBEAT_INTERVAL`` секунд
+продлевает блокировку задачи (``locked_at``), и задачи упавшего воркера
+возвращаются в очередь, когда блокировку не продлевали дольше
+``JOBS_LOCK_TIMEOUT``. Итог записывается только при сохраненной
+блокировке: воркер, у которого задачу забрали, не перезапишет ее.
+Ключ идемпотентности не дает поставить одну и ту же работу дважды.
+На каждом опросе очереди воркер также нумерует новые строки журнала
+изменений (``ChangeLogQuerySet.sequence``) для ленты ``backend.changes``.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from backend import metrics
+from backend.models import ChangeLog, Job
+from Py_Diplom_new.enums import JobState
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+class JobError(ValueError):
+    """
+    Ошибка задачи, которую бессмысленно повторять
+    """
+
+
+def handler(name):
+    """
+    Регистрирует ``func(payload)`` обработчиком задачи ``name``; результат
+    обработчика сохраняется в ``Job.result`` и должен сериализоваться в JSON
+    """
+
+    def register(func):
+        _handlers[name] = func
+        return func
+
+    return register
+
+
+def enqueue(
+    name, payload=None, user=None, idempotency_key=None, run_at=None, max_attempts=None
+):
+    """
+    Ставит задачу в очередь; повторная постановка с тем же ключом
+    идемпотентности возвращает уже созданную задачу
+    """
+    if name not in _handlers:
+        raise JobError(f"Неизвестная задача: {name}")
+    fields = {
+        "name": name,
+        "payload": payload or {},
+        "user": user,
+        "run_at": run_at or timezone.now(),
+        "max_attempts": max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    }
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    job, _ = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+    return job
+
+
+def enqueue_many(name, jobs, max_attempts=None):
+    """
+    Ставит в очередь пакет задач одним INSERT; ``jobs`` - пары (параметры,
+    ключ идемпотентности), задачи с уже занятым ключом пропускаются
+    """
+    if name not in _handlers:
+        raise JobError(f"Неизвестная задача: {name}")
+    now = timezone.now()
+    Job.objects.bulk_create(
+        [
+            Job(
+                name=name,
+                payload=payload,
+                idempotency_key=idempotency_key,
+                run_at=now,
+                max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+            )
+            for payload, idempotency_key in jobs
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def claim(worker, limit=1):
+    """
+    Забирает до ``limit`` готовых задач; ``worker`` - уникальное имя потока
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(state=JobState.queued, run_at__lte=now)
+            .order_by("run_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # на SQLite блокировки строк нет: задачу получает тот, чей UPDATE
+        # застал ее в очереди
+        Job.objects.filter(id__in=ids, state=JobState.queued).update(
+            state=JobState.running,
+            locked_by=worker,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(
+        Job.objects.filter(id__in=ids, state=JobState.running, locked_by=worker)
+    )
+
+
+def retry_delay(attempts):
+    """
+    Экспоненциальная задержка перед повтором со случайным разбросом, чтобы
+    задачи, упавшие вместе, не повторялись одновременно
+    """
+    delay = min(
+        settings.JOBS_RETRY_BACKOFF * 2 ** max(attempts - 1, 0),
+        settings.JOBS_RETRY_BACKOFF_MAX,
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def _locked(job):
+    return Job.objects.filter(
+        id=job.id, state=JobState.running, locked_by=job.locked_by
+    )
+
+
+@contextmanager
+def heartbeat(job):
+    """
+    Продлевает блокировку задачи из отдельного потока, пока выполняется
+    блок; продление прекращается, если задачу забрал другой воркер
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.JOBS_HEARTBEAT_INTERVAL):
+                try:
+                    if not _locked(job).update(locked_at=timezone.now()):
+                        return
+                except DatabaseError as exc:
+                    logger.warning(
+                        "Не удалось продлить задачу %s#%s: %s", job.name, job.id, exc
+                    )
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f"jobs-heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Выполняет взятую задачу и записывает результат; возвращает, успешно ли
+    """
+    func = _handlers.get(job.name)
+    try:
+        if func is None:
+            raise JobError(f"Неизвестная задача: {job.name}")
+        with heartbeat(job):
+            result = func(job.payload)
+    except Exception as exc:
+        _fail(job, exc)
+        return False
+    if not _finish(
+        job,
+        state=JobState.done,
+        result=result,
+        last_error="",
+        finished_at=timezone.now(),
+    ):
+        return False
+    metrics.jobs_total.inc(job.name, JobState.done)
+    return True
+
+
+def _finish(job, **fields):
+    if _locked(job).update(locked_by="", locked_at=None, **fields):
+        return True
+    logger.warning(
+        "Задача %s#%s уже не принадлежит воркеру %s, итог не записан",
+        job.name,
+        job.id,
+        job.locked_by,
+    )
+    return False
+
+
+def _fail(job, exc):
+    error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    final = isinstance(exc, JobError) or job.attempts >= job.max_attempts
+    now = timezone.now()
+    if final:
+        logger.exception("Задача %s#%s завершилась ошибкой", job.name, job.id)
+        fields = {"state": JobState.failed, "finished_at": now}
+    else:
+        logger.warning(
+            "Задача %s#%s, попытка %s: %s", job.name, job.id, job.attempts, error
+        )
+        fields = {"state": JobState.queued, "run_at": now + retry_delay(job.attempts)}
+    if _finish(job, last_error=error, **fields):
+        metrics.jobs_total.inc(job.name, fields["state"])
+
+
+def requeue_stale(timeout=None):
+    """
+    Возвращает в очередь задачи воркеров, не продлевавших блокировку
+    ``timeout`` секунд; задачи с исчерпанными попытками помечаются ``failed``
+    """
+    timeout = settings.JOBS_LOCK_TIMEOUT if timeout is None else timeout
+    now = timezone.now()
+    stale = Job.objects.filter(
+        state=JobState.running, locked_at__lt=now - timedelta(seconds=timeout)
+    )
+    error = "Воркер не завершил задачу"
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        state=JobState.failed,
+        last_error=error,
+        locked_by="",
+        locked_at=None,
+        finished_at=now,
+    )
+    requeued = stale.update(
+        state=JobState.queued,
+        last_error=error,
+        locked_by="",
+        locked_at=None,
+        run_at=now,
+    )
+    return requeued + failed
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def run_pending():
+    """
+    Выполняет готовые задачи в текущем потоке и возвращает их число
+    """
+    worker = _worker_name()
+    processed = 0
+    while True:
+        jobs = claim(worker)
+        if not jobs:
+            return processed
+        for job in jobs:
+            run_job(job)
+        processed += len(jobs)
+
+
+def work(stop, poll_interval=1.0, burst=False):
+    """
+    Цикл потока воркера: выполняет задачи, пока не выставлен ``stop``; с
+    ``burst`` завершается, когда готовых задач не осталось
+    """
+    worker = _worker_name()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            jobs = claim(worker)
+            for job in jobs:
+                run_job(job)
+            ChangeLog.objects.sequence()
+            if jobs or requeue_stale():
+                continue
+            if burst or stop.wait(poll_interval):
+                break
+    finally:
+        connections.close_all()
+
+
+def _run_threads(threads, poll_interval, burst, stop):
+    pool = [
+        threading.Thread(
+            target=work, args=(stop, poll_interval, burst), name=f"jobs-{number}"
+        )
+        for number in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+def _run_process(threads, poll_interval, burst):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    _run_threads(threads, poll_interval, burst, stop)
+
+
+def run_workers(processes=1, threads=1, poll_interval=1.0, burst=False):
+    """
+    Пул воркеров: ``processes`` процессов по ``threads`` потоков. SIGTERM и
+    SIGINT завершают текущие задачи и останавливают пул
+    """
+    if processes <= 1:
+        _run_process(threads, poll_interval, burst)
+        return
+    # соединения с БД не должны наследоваться дочерними процессами
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    children = [
+        context.Process(
+            target=_run_process,
+            args=(threads, poll_interval, burst),
+            name=f"jobs-worker-{number}",
+        )
+        for number in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def terminate(*args):
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for child in children:
+        child.join()
+
+
+def _queue_metrics():
+    depth = dict(
+        Job.objects.filter(state__in=(JobState.queued, JobState.running))
+        .order_by()
+        .values_list("state")
+        .annotate(count=Count("id"))
+    )
+    return [
+        ("jobs_queued", "gauge", depth.get(JobState.queued, 0)),
+        ("jobs_running", "gauge", depth.get(JobState.running, 0)),
+    ]
+
+
+metrics.registry.add_collector(_queue_metrics)
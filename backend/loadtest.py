@@ -0,0 +1,119 @@
+"""
+Нагрузочный клиент для сравнения WSGI- и ASGI-развертывания.
+
+Клиент на asyncio замеряет запросы из заданного числа соединений, пока
+фоновые медленные клиенты держат свои соединения: их заголовки
+отправляются с паузой, и все это время синхронный воркер занят
+соединением, а асинхронный - нет. Работает на сокетах стандартной
+библиотеки, без внешних зависимостей.
+"""
+import asyncio
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from backend.benchmark import percentile
+
+
+async def _request(host, port, path, slow, headers):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n".encode())
+        await writer.drain()
+        if slow:
+            await asyncio.sleep(slow)
+        extra = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(f"{extra}Connection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _run(url, paths, concurrency, requests, slow_clients, slow, headers, timeout):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    timings = []
+    statuses = Counter()
+    counter = iter(range(requests))
+    done = asyncio.Event()
+
+    async def worker():
+        for index in counter:
+            path = paths[index % len(paths)]
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    _request(host, port, path, 0, headers), timeout
+                )
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                status = "error"
+            timings.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    async def slow_client(number):
+        # медленные клиенты занимают соединения, пока идут замеры
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(
+                    _request(host, port, paths[number % len(paths)], slow, headers),
+                    timeout + slow,
+                )
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                await asyncio.sleep(slow)
+
+    background = [asyncio.create_task(slow_client(n)) for n in range(slow_clients)]
+    if background:
+        await asyncio.sleep(slow / 2)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    return {
+        "url": url,
+        "paths": paths,
+        "concurrency": concurrency,
+        "requests": requests,
+        "slow_clients": slow_clients,
+        "slow_client_ms": round(slow * 1000),
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50) * 1000, 1),
+        "p95_ms": round(percentile(timings, 95) * 1000, 1),
+        "p99_ms": round(percentile(timings, 99) * 1000, 1),
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+
+
+def run_load(
+    url,
+    paths,
+    concurrency=10,
+    requests=1000,
+    slow_clients=0,
+    slow_ms=1000,
+    headers=None,
+    timeout=30,
+):
+    """
+    Выполняет ``requests`` GET-запросов по ``paths`` к серверу ``url`` из
+    ``concurrency`` одновременных соединений, пока ``slow_clients``
+    медленных клиентов держат свои соединения
+    """
+    return asyncio.run(
+        _run(
+            url,
+            list(paths),
+            concurrency,
+            requests,
+            slow_clients,
+            slow_ms / 1000,
+            headers or {},
+            timeout,
+        )
+    )
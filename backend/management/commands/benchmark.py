@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.benchmark import benchmark_endpoints, compare_reports
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеры сценариев каталога, корзины, оформления и импорта: перцентили "
+        "времени ответа, пропускная способность и число SQL-запросов в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--import-runs", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--cold-cache",
+            action="store_true",
+            help="Очищать кеш каталога перед каждым запросом",
+        )
+        parser.add_argument("--output", help="Файл для отчета в JSON")
+        parser.add_argument("--baseline", help="Отчет прошлого релиза для сравнения")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Допустимый относительный рост p95 при сравнении",
+        )
+
+    def handle(self, output, baseline, threshold, **options):
+        try:
+            report = benchmark_endpoints(
+                iterations=options["iterations"],
+                import_runs=options["import_runs"],
+                seed=options["seed"],
+                cold_cache=options["cold_cache"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if baseline:
+            with open(baseline, encoding="utf-8") as file:
+                report["comparison"] = compare_reports(
+                    json.load(file), report, threshold
+                )
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output:
+            with open(output, "w", encoding="utf-8") as file:
+                file.write(text)
+        else:
+            self.stdout.write(text)
+        if baseline and report["comparison"]["regressions"]:
+            raise CommandError(
+                "Регрессия: " + ", ".join(report["comparison"]["regressions"])
+            )
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from backend.benchmark import benchmark_indexes
+from backend.synthetic import MarketplaceSize, generate_marketplace
+
+
+class Command(BaseCommand):
+    help = "Планы EXPLAIN и время горячих запросов с индексами горячих путей и без них"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed-products",
+            type=int,
+            default=0,
+            help="Перед замером создать синтетический каталог такого размера",
+        )
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--output", help="Файл для отчета в JSON")
+
+    def handle(self, seed_products, repeat, output, **options):
+        if seed_products:
+            generate_marketplace(
+                MarketplaceSize(
+                    products=seed_products,
+                    users=max(10, seed_products // 20),
+                    orders=seed_products,
+                )
+            )
+        report = json.dumps(benchmark_indexes(repeat), ensure_ascii=False, indent=2)
+        if output:
+            with open(output, "w", encoding="utf-8") as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
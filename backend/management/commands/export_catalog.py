@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.exporter import DEFAULT_CHUNK_SIZE, FORMATS, export_catalog
+from backend.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка каталога или предложений магазина в файл"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="fmt", choices=FORMATS, default="csv")
+        parser.add_argument("--shop", dest="shop_id", type=int)
+        parser.add_argument(
+            "--output", dest="path", help="Путь к файлу, по умолчанию stdout"
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, fmt, shop_id, path, chunk_size, **options):
+        shop = None
+        if shop_id is not None:
+            try:
+                shop = Shop.objects.get(pk=shop_id)
+            except Shop.DoesNotExist:
+                raise CommandError(f"Магазин {shop_id} не найден")
+        chunks = export_catalog(fmt, shop, chunk_size)
+        if not path:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        with open(path, "w", encoding="utf-8", newline="") as output:
+            for chunk in chunks:
+                output.write(chunk)
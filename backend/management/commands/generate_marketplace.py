@@ -0,0 +1,23 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from backend.synthetic import BATCH_SIZE, MarketplaceSize, generate_marketplace
+
+
+class Command(BaseCommand):
+    help = "Генерация синтетического маркетплейса для замеров производительности"
+
+    def add_arguments(self, parser):
+        defaults = MarketplaceSize()
+        for name, value in defaults.as_dict().items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, seed, batch_size, **options):
+        size = MarketplaceSize(
+            **{name: options[name] for name in MarketplaceSize().as_dict()}
+        )
+        counts = generate_marketplace(size, seed=seed, batch_size=batch_size)
+        self.stdout.write(json.dumps(counts, ensure_ascii=False, indent=2))
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.importer import (
+    DEFAULT_BATCH_SIZE,
+    FORMATS,
+    PriceListError,
+    detect_format,
+    import_price_list,
+)
+from backend.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Импорт прайс-листа магазина из Shop.filename или указанного файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("shop_id", type=int)
+        parser.add_argument("--file", dest="path", help="Путь к файлу прайс-листа")
+        parser.add_argument("--format", dest="fmt", choices=FORMATS)
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, shop_id, path, fmt, batch_size, verbosity, **options):
+        try:
+            shop = Shop.objects.get(pk=shop_id)
+        except Shop.DoesNotExist:
+            raise CommandError(f"Магазин {shop_id} не найден")
+        try:
+            if path:
+                with open(path, "rb") as stream:
+                    result = import_price_list(
+                        shop, stream, fmt or detect_format(path), batch_size
+                    )
+            else:
+                result = import_price_list(shop, fmt=fmt, batch_size=batch_size)
+        except PriceListError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(json.dumps(result.as_dict(details=verbosity > 1)))
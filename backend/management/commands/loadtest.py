@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from backend.loadtest import run_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузка на запущенный сервер (WSGI или ASGI): пропускная способность "
+        "и перцентили времени ответа, в том числе при медленных клиентах"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Адрес сервера, например http://127.0.0.1:8000")
+        parser.add_argument(
+            "--path", action="append", dest="paths", help="Путь запроса (несколько)"
+        )
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument(
+            "--slow-clients",
+            type=int,
+            default=0,
+            help="Число медленных клиентов, держащих соединения во время замера",
+        )
+        parser.add_argument(
+            "--slow-ms",
+            type=int,
+            default=1000,
+            help="Пауза медленного клиента при отправке заголовков",
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, url, paths, **options):
+        report = run_load(
+            url,
+            paths or ["/product/"],
+            concurrency=options["concurrency"],
+            requests=options["requests"],
+            slow_clients=options["slow_clients"],
+            slow_ms=options["slow_ms"],
+            timeout=options["timeout"],
+        )
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
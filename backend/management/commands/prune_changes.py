@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from backend.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = "Удаление устаревших записей журнала изменений"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, days, batch_size, **options):
+        deleted = prune_changes(days, batch_size)
+        self.stdout.write(f"Удалено записей журнала: {deleted}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.facets import REFRESH_BATCH_SIZE, rebuild_facets
+
+
+class Command(BaseCommand):
+    help = "Полная перестройка индекса фасетов каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REFRESH_BATCH_SIZE)
+
+    def handle(self, batch_size, **options):
+        with transaction.atomic():
+            rebuild_facets(batch_size)
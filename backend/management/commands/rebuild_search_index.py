@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.search import INDEX_BATCH_SIZE, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Полная перестройка поисковых документов каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+
+    def handle(self, batch_size, **options):
+        with transaction.atomic():
+            rebuild_search_index(batch_size)
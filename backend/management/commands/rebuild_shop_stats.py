@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from backend.stats import REBUILD_BATCH_SIZE, rebuild_shop_stats
+
+
+class Command(BaseCommand):
+    help = "Полный пересчет сводок продаж магазинов по позициям заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, batch_size, **options):
+        rebuild_shop_stats(batch_size)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер фоновых задач: пул процессов и потоков, забирающих задачи из "
+        "таблицы Job"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=settings.JOBS_WORKER_PROCESSES
+        )
+        parser.add_argument("--threads", type=int, default=settings.JOBS_WORKER_THREADS)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Пауза между опросами пустой очереди, секунды",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Выполнить готовые задачи и завершиться",
+        )
+
+    def handle(self, processes, threads, poll_interval, burst, **options):
+        run_workers(processes, threads, poll_interval, burst)
@@ -0,0 +1,188 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Реестр живет в памяти процесса: каждый процесс отдает свои значения, а
+суммирует их Prometheus. Гистограммы хранят накопленные счетчики по
+границам корзин, поэтому запись значения - это несколько сложений под
+блокировкой.
+"""
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_IN_LIST_RE = re.compile(r"\((?:%s, )+%s\)")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+
+
+def fingerprint(sql):
+    """
+    Отпечаток SQL без параметров: списки ``IN`` любой длины и числовые
+    литералы схлопываются, поэтому запросы в цикле дают один отпечаток
+    """
+    return _NUMBER_RE.sub("N", _IN_LIST_RE.sub("(...)", sql))
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield self.name, self.labelnames, labels, value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for index in range(position, len(counts)):
+                counts[index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        with self._lock:
+            series = sorted(
+                (labels, (list(counts), count, total))
+                for labels, (counts, count, total) in self._series.items()
+            )
+        for labels, (counts, count, total) in series:
+            for bound, value in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", names, labels + (_number(bound),), value
+            yield f"{self.name}_bucket", names, labels + ("+Inf",), count
+            yield f"{self.name}_count", self.labelnames, labels, count
+            yield f"{self.name}_sum", self.labelnames, labels, total
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        ``collector()`` возвращает тройки (имя, тип, значение) для метрик,
+        которые считаются в других модулях
+        """
+        self._collectors.append(collector)
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labelnames, labels, value in metric.samples():
+                lines.append(f"{name}{_labels(labelnames, labels)} {_number(value)}")
+        for collector in self._collectors:
+            for name, kind, value in collector():
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+_ROUTE = ("method", "route")
+
+requests_total = registry.register(
+    Counter("http_requests_total", "Число обработанных запросов", _ROUTE + ("status",))
+)
+request_duration = registry.register(
+    Histogram("http_request_duration_seconds", "Полное время обработки запроса", _ROUTE)
+)
+db_duration = registry.register(
+    Histogram(
+        "http_request_db_duration_seconds",
+        "Время SQL-запросов в выборке запросов",
+        _ROUTE,
+    )
+)
+serialize_duration = registry.register(
+    Histogram(
+        "http_request_serialize_duration_seconds",
+        "Время отрисовки ответа в выборке запросов",
+        _ROUTE,
+    )
+)
+db_queries = registry.register(
+    Histogram(
+        "http_request_db_queries",
+        "Число SQL-запросов в выборке запросов",
+        _ROUTE,
+        buckets=QUERY_BUCKETS,
+    )
+)
+duplicate_queries = registry.register(
+    Counter(
+        "http_request_duplicate_queries_total",
+        "Повторы SQL-запросов с одинаковым отпечатком (кандидаты N+1)",
+        _ROUTE,
+    )
+)
+jobs_total = registry.register(
+    Counter(
+        "background_jobs_total",
+        "Попытки выполнения фоновых задач по итоговому состоянию",
+        ("name", "state"),
+    )
+)
@@ -0,0 +1,213 @@
+"""
+Инструментирование запросов (время, SQL и повторяющиеся запросы) и
+закрепление пользователя за основной БД после записи.
+
+Полное время и число запросов учитываются всегда - это два вызова
+``perf_counter``. SQL перехватывается через ``connection.execute_wrapper``
+только в выборке запросов (``REQUEST_METRICS_SAMPLE_RATE``), чтобы под
+нагрузкой накладные расходы оставались пренебрежимыми. Для запросов из
+выборки считаются число и время SQL, повторы запросов с одинаковым
+отпечатком (N+1), время представления без SQL и время отрисовки ответа;
+они отдаются в заголовке ``Server-Timing`` и в метриках Prometheus.
+"""
+import logging
+import random
+import time
+from asyncio import iscoroutinefunction
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from backend import metrics
+from backend.routers import PIN_COOKIE, SAFE_METHODS, pin_to_primary, replica_alias
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class QueryRecorder:
+    """
+    Обертка выполнения SQL: время и отпечатки запросов
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[metrics.fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.fingerprints.values())
+
+
+def _install(recorder):
+    for connection in connections.all():
+        connection.execute_wrappers.append(recorder)
+
+
+def _uninstall(recorder):
+    for connection in connections.all():
+        connection.execute_wrappers.remove(recorder)
+
+
+class RequestMetricsMiddleware:
+    """
+    Работает и в синхронной, и в асинхронной цепочке middleware. В ASGI
+    синхронный ORM выполняется в отдельном потоке запроса, поэтому обертка
+    SQL ставится на соединения этого потока
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 1.0)
+        self.server_timing = getattr(settings, "REQUEST_METRICS_SERVER_TIMING", True)
+        self.n_plus_one_threshold = getattr(
+            settings, "REQUEST_METRICS_N_PLUS_ONE_THRESHOLD", 5
+        )
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if not self._sampled():
+            response = self.get_response(request)
+            self._record_total(request, response, time.perf_counter() - started)
+            return response
+
+        recorder = QueryRecorder()
+        request._metrics_render = 0.0
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        return self._finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        if not self._sampled():
+            response = await self.get_response(request)
+            self._record_total(request, response, time.perf_counter() - started)
+            return response
+
+        recorder = QueryRecorder()
+        request._metrics_render = 0.0
+        await sync_to_async(_install)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_uninstall)(recorder)
+        return self._finish(request, response, recorder, started)
+
+    def _finish(self, request, response, recorder, started):
+        total = time.perf_counter() - started
+        route = self._record_total(request, response, total)
+
+        render = request._metrics_render
+        view = max(0.0, total - render - recorder.duration)
+        labels = (request.method, route)
+        metrics.db_duration.observe(recorder.duration, *labels)
+        metrics.db_queries.observe(recorder.count, *labels)
+        metrics.serialize_duration.observe(render, *labels)
+        if recorder.duplicates:
+            metrics.duplicate_queries.inc(*labels, amount=recorder.duplicates)
+            statement, repeats = recorder.fingerprints.most_common(1)[0]
+            if repeats >= self.n_plus_one_threshold:
+                logger.warning(
+                    "Возможный N+1: %s %s, запрос повторен %s раз: %s",
+                    request.method,
+                    route,
+                    repeats,
+                    statement,
+                )
+        if self.server_timing:
+            response["Server-Timing"] = ", ".join(
+                (
+                    f"db;dur={recorder.duration * 1000:.2f};"
+                    f'desc="queries={recorder.count} duplicated={recorder.duplicates}"',
+                    f"view;dur={view * 1000:.2f}",
+                    f"serialize;dur={render * 1000:.2f}",
+                    f"total;dur={total * 1000:.2f}",
+                )
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF отрисовывает ответ после выхода из представления
+        if hasattr(request, "_metrics_render"):
+            started = time.perf_counter()
+
+            def rendered(response):
+                request._metrics_render += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _record_total(self, request, response, total):
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else UNMATCHED_ROUTE
+        metrics.requests_total.inc(request.method, route, response.status_code)
+        metrics.request_duration.observe(total, request.method, route)
+        return route
+
+
+class ReplicaPinningMiddleware:
+    """
+    Изменяющий запрос целиком идет в основную БД и выставляет cookie, по
+    которой следующие запросы пользователя тоже читают из основной БД
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with pin_to_primary(self._pinned(request)):
+            response = self.get_response(request)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        with pin_to_primary(self._pinned(request)):
+            response = await self.get_response(request)
+        return self._pin(request, response)
+
+    def _pinned(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def _pin(self, request, response):
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and replica_alias()
+        ):
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=self.pin_seconds, httponly=True, samesite="Lax"
+            )
+        return response
@@ -0,0 +1,560 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:14
+
+import backend.models
+from django.conf import settings
+import django.contrib.auth.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="User",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("password", models.CharField(max_length=128, verbose_name="password")),
+                (
+                    "last_login",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="last login"
+                    ),
+                ),
+                (
+                    "is_superuser",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Designates that this user has all permissions without explicitly assigning them.",
+                        verbose_name="superuser status",
+                    ),
+                ),
+                (
+                    "first_name",
+                    models.CharField(
+                        blank=True, max_length=150, verbose_name="first name"
+                    ),
+                ),
+                (
+                    "last_name",
+                    models.CharField(
+                        blank=True, max_length=150, verbose_name="last name"
+                    ),
+                ),
+                (
+                    "is_staff",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Designates whether the user can log into this admin site.",
+                        verbose_name="staff status",
+                    ),
+                ),
+                (
+                    "date_joined",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="date joined"
+                    ),
+                ),
+                (
+                    "email",
+                    models.EmailField(
+                        max_length=254, unique=True, verbose_name="email address"
+                    ),
+                ),
+                (
+                    "company",
+                    models.CharField(
+                        blank=True, max_length=40, verbose_name="Компания"
+                    ),
+                ),
+                (
+                    "position",
+                    models.CharField(
+                        blank=True, max_length=40, verbose_name="Должность"
+                    ),
+                ),
+                (
+                    "username",
+                    models.CharField(
+                        error_messages={
+                            "unique": "A user with that username already exists."
+                        },
+                        help_text="Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.",
+                        max_length=150,
+                        validators=[
+                            django.contrib.auth.validators.UnicodeUsernameValidator()
+                        ],
+                        verbose_name="username",
+                    ),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Designates whether this user should be treated as active. Unselect this instead of deleting accounts.",
+                        verbose_name="active",
+                    ),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("shop", "Магазин"), ("buyer", "Покупатель")],
+                        default="buyer",
+                        max_length=10,
+                        verbose_name="Тип пользователя",
+                    ),
+                ),
+                (
+                    "groups",
+                    models.ManyToManyField(
+                        blank=True,
+                        help_text="The groups this user belongs to. A user will get all permissions granted to each of their groups.",
+                        related_name="user_set",
+                        related_query_name="user",
+                        to="auth.group",
+                        verbose_name="groups",
+                    ),
+                ),
+                (
+                    "user_permissions",
+                    models.ManyToManyField(
+                        blank=True,
+                        help_text="Specific permissions for this user.",
+                        related_name="user_set",
+                        related_query_name="user",
+                        to="auth.permission",
+                        verbose_name="user permissions",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Пользователь",
+                "verbose_name_plural": "Список пользователей",
+                "ordering": ("email",),
+            },
+            managers=[
+                ("objects", backend.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Category",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=10, verbose_name="название категории"),
+                ),
+            ],
+            options={
+                "verbose_name": "Категория",
+                "verbose_name_plural": "Категории",
+            },
+        ),
+        migrations.CreateModel(
+            name="Contact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "city",
+                    models.CharField(
+                        default="Москва", max_length=50, null=True, verbose_name="Город"
+                    ),
+                ),
+                (
+                    "street",
+                    models.CharField(max_length=100, null=True, verbose_name="Улица"),
+                ),
+                (
+                    "house",
+                    models.CharField(
+                        blank=True, max_length=15, null=True, verbose_name="Дом"
+                    ),
+                ),
+                (
+                    "structure",
+                    models.CharField(
+                        blank=True, max_length=15, null=True, verbose_name="Корпус"
+                    ),
+                ),
+                (
+                    "building",
+                    models.CharField(
+                        blank=True, max_length=15, null=True, verbose_name="Строение"
+                    ),
+                ),
+                (
+                    "apartment",
+                    models.CharField(
+                        blank=True, max_length=15, null=True, verbose_name="Квартира"
+                    ),
+                ),
+                (
+                    "phone",
+                    models.CharField(max_length=12, null=True, verbose_name="Телефон"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="contacts",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Контакты пользователя",
+                "verbose_name_plural": "Список контактов пользователя",
+            },
+        ),
+        migrations.CreateModel(
+            name="Order",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("basket", "Статус корзины"),
+                            ("new", "Новый"),
+                            ("confirmed", "Подтвержден"),
+                            ("assembled", "Собран"),
+                            ("sent", "Отправлен"),
+                            ("delivered", "Доставлен"),
+                            ("canceled", "Отменен"),
+                        ],
+                        max_length=15,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="Контакт",
+                        to="backend.contact",
+                        verbose_name="Контакт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="orders",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заказ",
+                "verbose_name_plural": "Список заказов",
+            },
+        ),
+        migrations.CreateModel(
+            name="Parameter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=100, verbose_name="название параметра"),
+                ),
+            ],
+            options={
+                "verbose_name": "Название параметра",
+                "verbose_name_plural": "Список названий параметров",
+            },
+        ),
+        migrations.CreateModel(
+            name="Product",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=50, verbose_name="Название продукта"),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="products",
+                        to="backend.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Продукт",
+                "verbose_name_plural": "Продукты",
+            },
+        ),
+        migrations.CreateModel(
+            name="Shop",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, verbose_name="Магазин")),
+                (
+                    "url",
+                    models.URLField(
+                        blank=True, null=True, verbose_name="Сайт магазина"
+                    ),
+                ),
+                ("filename", models.FileField(blank=True, null=True, upload_to="")),
+                (
+                    "state",
+                    models.BooleanField(
+                        default=True, verbose_name="Статус получения заказов"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Магазин",
+                "verbose_name_plural": "Магазины",
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductParameter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=100, verbose_name="Значение")),
+                (
+                    "parameter",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_parameters",
+                        to="backend.parameter",
+                        verbose_name="parameter",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="products_info",
+                        to="backend.product",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Параметр продукта",
+                "verbose_name_plural": "Параметры продукта",
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductInfo",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        blank=True, max_length=100, null=True, verbose_name="Модель"
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(verbose_name="Количество")),
+                ("price", models.PositiveIntegerField(verbose_name="Цена")),
+                (
+                    "price_rrc",
+                    models.PositiveIntegerField(
+                        verbose_name="Рекомендованная розничная цена"
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        blank=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="products",
+                        to="backend.product",
+                        verbose_name="Продукт",
+                    ),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        blank=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_infos",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Информация о продукте",
+                "verbose_name_plural": "Информация о продуктах",
+            },
+        ),
+        migrations.CreateModel(
+            name="OrderItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(default=1, verbose_name=" Количество"),
+                ),
+                ("price", models.PositiveIntegerField(default=0, verbose_name="Цена")),
+                (
+                    "total_amount",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Общая стоимость"
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ordered_items",
+                        to="backend.order",
+                        verbose_name="Заказ",
+                    ),
+                ),
+                (
+                    "product_info",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ordered_items",
+                        to="backend.productinfo",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заказанная позиция",
+                "verbose_name_plural": "Список заказанных позиций",
+            },
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="shops",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="categories",
+                to="backend.shop",
+                verbose_name="Магазины",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productparameter",
+            constraint=models.UniqueConstraint(
+                fields=("product", "parameter"), name="unique_product_parameter"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productinfo",
+            constraint=models.UniqueConstraint(
+                fields=("product", "shop"), name="unique_product_info"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="orderitem",
+            constraint=models.UniqueConstraint(
+                fields=("order_id", "product_info"), name="unique_order_item"
+            ),
+        ),
+    ]
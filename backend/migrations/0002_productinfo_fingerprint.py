@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productinfo",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                max_length=32,
+                verbose_name="Отпечаток строки прайс-листа",
+            ),
+        ),
+    ]
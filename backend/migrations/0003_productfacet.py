@@ -0,0 +1,102 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0002_productinfo_fingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductFacet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("price", models.PositiveIntegerField(verbose_name="Цена")),
+                (
+                    "value",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Значение"
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "parameter",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.parameter",
+                        verbose_name="parameter",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.product",
+                        verbose_name="Продукт",
+                    ),
+                ),
+                (
+                    "product_info",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="facets",
+                        to="backend.productinfo",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Фасет каталога",
+                "verbose_name_plural": "Индекс фасетов каталога",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="productfacet",
+            index=models.Index(
+                fields=["parameter", "value", "product_info"],
+                name="facet_parameter_value_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productfacet",
+            index=models.Index(
+                fields=["category", "price"], name="facet_category_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productfacet",
+            index=models.Index(fields=["shop", "price"], name="facet_shop_price_idx"),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:19
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.deletion
+
+# GIN-индексы нужны только на PostgreSQL, на остальных СУБД поиск идет
+# по индексу в памяти процесса
+GIN_INDEXES = (
+    "CREATE INDEX search_document_vector_idx "
+    "ON backend_searchdocument USING gin (vector)",
+    "CREATE INDEX search_document_name_trgm_idx "
+    "ON backend_searchdocument USING gin (name gin_trgm_ops)",
+)
+
+
+def create_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for sql in GIN_INDEXES:
+            schema_editor.execute(sql)
+
+
+def drop_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS search_document_vector_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS search_document_name_trgm_idx")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0003_productfacet"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "product_info",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="backend.productinfo",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=50, verbose_name="Название продукта"),
+                ),
+                (
+                    "model",
+                    models.CharField(blank=True, max_length=100, verbose_name="Модель"),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        blank=True, max_length=50, verbose_name="Категория"
+                    ),
+                ),
+                (
+                    "parameters",
+                    models.TextField(blank=True, verbose_name="Значения параметров"),
+                ),
+                (
+                    "vector",
+                    django.contrib.postgres.search.SearchVectorField(
+                        editable=False, null=True
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.product",
+                        verbose_name="Продукт",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Поисковый документ",
+                "verbose_name_plural": "Поисковые документы",
+            },
+        ),
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:28
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model("backend", "Order")
+    OrderItem = apps.get_model("backend", "OrderItem")
+    orders = {}
+    lines = (
+        OrderItem.objects.order_by()
+        .values_list("order_id", "product_info__shop_id")
+        .annotate(count=Count("id"), amount=Sum("total_amount"))
+    )
+    for order_id, shop_id, count, amount in lines.iterator():
+        order = orders.setdefault(
+            order_id, Order(id=order_id, items_count=0, total_sum=0, shop_ids=[])
+        )
+        order.items_count += count
+        order.total_sum += amount or 0
+        if shop_id is not None:
+            order.shop_ids.append(shop_id)
+    Order.objects.bulk_update(
+        orders.values(), ["items_count", "total_sum", "shop_ids"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0004_searchdocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="items_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество позиций"
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="shop_ids",
+            field=models.JSONField(
+                default=list, editable=False, verbose_name="Магазины заказа"
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_sum",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Сумма заказа"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "-created_at"], name="order_user_created_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0005_order_totals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Время изменения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Время изменения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="productinfo",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Время изменения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Время изменения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=1, editable=False, verbose_name="Версия каталога магазина"
+            ),
+        ),
+    ]
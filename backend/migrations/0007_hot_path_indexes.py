@@ -0,0 +1,79 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0006_catalog_versions"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="order",
+            name="order_user_created_idx",
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="orders",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="productinfo",
+            name="product",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="products",
+                to="backend.product",
+                verbose_name="Продукт",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="productinfo",
+            name="shop",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_infos",
+                to="backend.shop",
+                verbose_name="Магазин",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "status", "-created_at"],
+                name="order_user_status_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status", "basket"), _negated=True),
+                fields=["user", "-created_at", "-id"],
+                name="order_history_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(fields=["shop", "id"], name="productinfo_shop_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(
+                fields=["product", "price"], name="productinfo_product_price_idx"
+            ),
+        ),
+    ]
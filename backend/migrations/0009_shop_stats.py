@@ -0,0 +1,147 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0008_jobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShopStatusCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("basket", "Статус корзины"),
+                            ("new", "Новый"),
+                            ("confirmed", "Подтвержден"),
+                            ("assembled", "Собран"),
+                            ("sent", "Отправлен"),
+                            ("delivered", "Доставлен"),
+                            ("canceled", "Отменен"),
+                        ],
+                        max_length=15,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("orders", models.IntegerField(default=0, verbose_name="Заказов")),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="status_counts",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заказы магазина в статусе",
+                "verbose_name_plural": "Заказы магазинов по статусам",
+            },
+        ),
+        migrations.CreateModel(
+            name="ShopProductSales",
+            fields=[
+                (
+                    "product_info",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="sales",
+                        serialize=False,
+                        to="backend.productinfo",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+                ("orders", models.IntegerField(default=0, verbose_name="Заказов")),
+                (
+                    "quantity",
+                    models.IntegerField(default=0, verbose_name="Продано единиц"),
+                ),
+                ("revenue", models.BigIntegerField(default=0, verbose_name="Выручка")),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Продажи предложения",
+                "verbose_name_plural": "Продажи предложений",
+            },
+        ),
+        migrations.CreateModel(
+            name="ShopDailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                ("orders", models.IntegerField(default=0, verbose_name="Заказов")),
+                (
+                    "items_sold",
+                    models.IntegerField(default=0, verbose_name="Продано единиц"),
+                ),
+                ("revenue", models.BigIntegerField(default=0, verbose_name="Выручка")),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_sales",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Продажи магазина за день",
+                "verbose_name_plural": "Продажи магазинов по дням",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="shopstatuscount",
+            constraint=models.UniqueConstraint(
+                fields=("shop", "status"), name="unique_shop_status_count"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="shopproductsales",
+            index=models.Index(
+                fields=["shop", "-revenue"], name="shop_product_sales_top_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="shopdailysales",
+            constraint=models.UniqueConstraint(
+                fields=("shop", "date"), name="unique_shop_daily_sales"
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+def backfill_availability(apps, schema_editor):
+    Shop = apps.get_model("backend", "Shop")
+    disabled = Shop.objects.filter(state=False).values("id")
+    for name, lookup in (
+        ("ProductInfo", "shop_id__in"),
+        ("ProductFacet", "shop_id__in"),
+        ("SearchDocument", "product_info__shop_id__in"),
+    ):
+        apps.get_model("backend", name).objects.filter(**{lookup: disabled}).update(
+            available=False
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0009_shop_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productfacet",
+            name="available",
+            field=models.BooleanField(
+                default=True, verbose_name="Магазин принимает заказы"
+            ),
+        ),
+        migrations.AddField(
+            model_name="productinfo",
+            name="available",
+            field=models.BooleanField(
+                default=True, editable=False, verbose_name="Магазин принимает заказы"
+            ),
+        ),
+        migrations.AddField(
+            model_name="searchdocument",
+            name="available",
+            field=models.BooleanField(
+                default=True, verbose_name="Магазин принимает заказы"
+            ),
+        ),
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+    ]
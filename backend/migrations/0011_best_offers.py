@@ -0,0 +1,86 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_best_offers(apps, schema_editor):
+    ProductInfo = apps.get_model("backend", "ProductInfo")
+    ProductBestOffer = apps.get_model("backend", "ProductBestOffer")
+    offers = (
+        ProductInfo.objects.filter(available=True, quantity__gt=0)
+        .order_by("product_id", "price", "id")
+        .values_list("product_id", "id", "shop_id", "price")
+    )
+    batch = []
+    for product_id, offer_id, shop_id, price in offers.iterator(chunk_size=2000):
+        # первое предложение продукта в порядке цены - самое дешевое
+        if batch and batch[-1].product_id == product_id:
+            batch[-1].offers += 1
+            continue
+        if len(batch) >= 1000:
+            ProductBestOffer.objects.bulk_create(batch)
+            batch = []
+        batch.append(
+            ProductBestOffer(
+                product_id=product_id,
+                offer_id=offer_id,
+                shop_id=shop_id,
+                price=price,
+                offers=1,
+            )
+        )
+    ProductBestOffer.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0010_availability"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductBestOffer",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="best_offer",
+                        serialize=False,
+                        to="backend.product",
+                        verbose_name="Продукт",
+                    ),
+                ),
+                ("price", models.PositiveIntegerField(verbose_name="Минимальная цена")),
+                (
+                    "offers",
+                    models.PositiveIntegerField(verbose_name="Число предложений"),
+                ),
+                (
+                    "offer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.productinfo",
+                        verbose_name="Самое дешевое предложение",
+                    ),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Лучшее предложение",
+                "verbose_name_plural": "Лучшие предложения продуктов",
+            },
+        ),
+        migrations.RunPython(backfill_best_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0011_best_offers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "from_status",
+                    models.CharField(
+                        choices=[
+                            ("basket", "Статус корзины"),
+                            ("new", "Новый"),
+                            ("confirmed", "Подтвержден"),
+                            ("assembled", "Собран"),
+                            ("sent", "Отправлен"),
+                            ("delivered", "Доставлен"),
+                            ("canceled", "Отменен"),
+                        ],
+                        max_length=15,
+                        verbose_name="Прежний статус",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("basket", "Статус корзины"),
+                            ("new", "Новый"),
+                            ("confirmed", "Подтвержден"),
+                            ("assembled", "Собран"),
+                            ("sent", "Отправлен"),
+                            ("delivered", "Доставлен"),
+                            ("canceled", "Отменен"),
+                        ],
+                        max_length=15,
+                        verbose_name="Новый статус",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Время"
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="events",
+                        to="backend.order",
+                        verbose_name="Заказ",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Инициатор",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Событие заказа",
+                "verbose_name_plural": "Журнал событий заказов",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="orderevent",
+            index=models.Index(fields=["order", "id"], name="order_event_timeline_idx"),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0012_order_events"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "topic",
+                    models.CharField(
+                        choices=[("offer", "Предложение"), ("order", "Заказ")],
+                        max_length=10,
+                        verbose_name="Тип объекта",
+                    ),
+                ),
+                ("object_id", models.BigIntegerField(verbose_name="Объект")),
+                (
+                    "shop_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Магазин"
+                    ),
+                ),
+                ("deleted", models.BooleanField(default=False, verbose_name="Удален")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Время"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Изменение",
+                "verbose_name_plural": "Журнал изменений",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(fields=["topic", "id"], name="changelog_topic_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(
+                fields=["topic", "shop_id", "id"], name="changelog_shop_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0013_change_log"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="changelog",
+            name="changelog_topic_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="changelog",
+            name="changelog_shop_idx",
+        ),
+        migrations.AddField(
+            model_name="changelog",
+            name="seq",
+            field=models.BigIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Номер в ленте"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(fields=["topic", "seq"], name="changelog_topic_seq_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(
+                fields=["topic", "shop_id", "seq"], name="changelog_shop_seq_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(fields=["seq"], name="changelog_seq_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(
+                condition=models.Q(("seq__isnull", True)),
+                fields=["id"],
+                name="changelog_pending_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_shop_stock(apps, schema_editor):
+    ProductInfo = apps.get_model("backend", "ProductInfo")
+    ShopStock = apps.get_model("backend", "ShopStock")
+    ShopStock.objects.bulk_create(
+        ShopStock(shop_id=shop_id, quantity=total or 0)
+        for shop_id, total in ProductInfo.objects.order_by()
+        .values_list("shop_id")
+        .annotate(total=models.Sum("quantity"))
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0014_change_feed_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShopStock",
+            fields=[
+                (
+                    "shop",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock",
+                        serialize=False,
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+                ("quantity", models.BigIntegerField(default=0, verbose_name="Остаток")),
+            ],
+            options={
+                "verbose_name": "Остаток магазина",
+                "verbose_name_plural": "Остатки магазинов",
+            },
+        ),
+        migrations.RunPython(backfill_shop_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0015_shop_stock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportMark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token", models.CharField(max_length=32, verbose_name="Импорт")),
+                ("product_id", models.BigIntegerField(verbose_name="Продукт")),
+            ],
+            options={
+                "verbose_name": "Отметка импорта",
+                "verbose_name_plural": "Отметки импорта",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="importmark",
+            constraint=models.UniqueConstraint(
+                fields=("token", "product_id"), name="unique_import_mark"
+            ),
+        ),
+    ]
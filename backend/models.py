@@ -1,11 +1,15 @@
 from django.contrib.auth.models import User
 
-from Py_Diplom_new.enums import Role, Status
+from Py_Diplom_new.enums import ChangeTopic, JobState, Role, Status
 
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models, transaction
+from django.db.models import Count, F, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -93,6 +97,75 @@ class User(AbstractUser):
         ordering = ("email",)
 
 
+class TouchQuerySet(models.QuerySet):
+    """
+    Массовые обновления (в том числе ``bulk_update``) проставляют время
+    изменения так же, как ``auto_now`` при ``save()``
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault("updated_at", timezone.now())
+        return super().update(**kwargs)
+
+    def touch(self):
+        """
+        Отмечает строки измененными без изменения данных
+        """
+        return self.update()
+
+
+class ShopQuerySet(TouchQuerySet):
+    """
+    ``Shop.state`` копируется в поле ``available`` предложений, индекса
+    фасетов и поисковых документов: каталог, фильтры, поиск и оформление
+    заказа отбирают доступные предложения по своей таблице, без соединения
+    с ``Shop``. Копии обновляются вместе с магазином одним UPDATE на таблицу
+    и только там, где значение отличается, - без работы по отдельным
+    продуктам
+    """
+
+    def update(self, **kwargs):
+        self._for_write = True
+        kwargs.setdefault("version", F("version") + 1)
+        if "state" not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            shop_ids = list(self.values_list("id", flat=True))
+            rows = super().update(**kwargs)
+            self.model.objects.using(self.db).filter(
+                id__in=shop_ids
+            ).sync_availability()
+        return rows
+
+    def sync_availability(self):
+        """
+        Приводит ``available`` предложений магазинов к их ``state`` и
+        пересчитывает лучшие предложения затронутых продуктов; возвращает
+        продукты, у которых лучшее предложение изменилось
+        """
+        states = dict(self.values_list("id", "state"))
+        product_ids = set()
+        for state in (True, False):
+            ids = [pk for pk, value in states.items() if value == state]
+            if not ids:
+                continue
+            product_ids.update(
+                ProductInfo.objects.using(self.db)
+                .filter(shop_id__in=ids)
+                .exclude(available=state)
+                .values_list("product_id", flat=True)
+            )
+            for model, lookup in (
+                (ProductInfo, "shop_id__in"),
+                (ProductFacet, "shop_id__in"),
+                (SearchDocument, "product_info__shop_id__in"),
+            ):
+                model.objects.using(self.db).filter(**{lookup: ids}).exclude(
+                    available=state
+                ).update(available=state)
+        return ProductBestOffer.objects.using(self.db).refresh(product_ids)
+
+
 class Shop(models.Model):
     name = models.CharField(max_length=50, verbose_name="Магазин")
     url = models.URLField(verbose_name="Сайт магазина", null=True, blank=True)
@@ -101,6 +174,14 @@ class Shop(models.Model):
         User, verbose_name="Пользователь", on_delete=models.CASCADE
     )
     state = models.BooleanField(verbose_name="Статус получения заказов", default=True)
+    version = models.PositiveIntegerField(
+        verbose_name="Версия каталога магазина", default=1, editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="Время изменения", auto_now=True, db_index=True
+    )
+
+    objects = ShopQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Магазин"
@@ -109,12 +190,28 @@ class Shop(models.Model):
     def __str__(self):
         return f"{self.name} - {self.user}"
 
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            self.version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {
+                    *kwargs["update_fields"],
+                    "version",
+                    "updated_at",
+                }
+        super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=10, verbose_name="название категории")
     shops = models.ManyToManyField(
         Shop, verbose_name="Магазины", related_name="categories", blank=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Время изменения", auto_now=True, db_index=True
+    )
+
+    objects = TouchQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Категория"
@@ -133,6 +230,11 @@ class Product(models.Model):
         related_name="products",
         blank=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Время изменения", auto_now=True, db_index=True
+    )
+
+    objects = TouchQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Продукт"
@@ -142,6 +244,50 @@ class Product(models.Model):
         return f"{self.category}-{self.name}"
 
 
+class ProductInfoQuerySet(TouchQuerySet):
+    """
+    Удаление предложений увеличивает версию их магазинов: по максимальному
+    времени изменения удаление строки не заметно. Лучшие предложения
+    продуктов и остатки магазинов (``ShopStock``) пересчитываются в той же
+    транзакции. Измененные и удаленные
+    предложения записываются в журнал изменений до самого UPDATE/DELETE:
+    после него условие запроса может уже не выбирать эти строки
+    """
+
+    def _log_changes(self, deleted=False):
+        ChangeLog.objects.using(self.db).record_query(
+            ChangeTopic.offer,
+            self.order_by().values_list("id", "shop_id"),
+            deleted=deleted,
+        )
+
+    def update(self, **kwargs):
+        self._for_write = True
+        with transaction.atomic(using=self.db, savepoint=False):
+            self._log_changes()
+            return super().update(**kwargs)
+
+    def delete(self):
+        self._for_write = True
+        with transaction.atomic(using=self.db, savepoint=False):
+            keys = list(self.order_by().values_list("shop_id", "product_id").distinct())
+            stock = dict(
+                self.order_by().values_list("shop_id").annotate(total=Sum("quantity"))
+            )
+            self._log_changes(deleted=True)
+            deleted = super().delete()
+            ShopStock.objects.using(self.db).add(
+                {shop_id: -total for shop_id, total in stock.items()}
+            )
+            Shop.objects.using(self.db).filter(
+                id__in={shop_id for shop_id, _ in keys}
+            ).touch()
+            ProductBestOffer.objects.using(self.db).refresh(
+                {product_id for _, product_id in keys}
+            )
+        return deleted
+
+
 class ProductInfo(models.Model):
     model = models.CharField(
         max_length=100, verbose_name="Модель", null=True, blank=True
@@ -157,6 +303,8 @@ class ProductInfo(models.Model):
         related_name="products",
         on_delete=models.CASCADE,
         blank=True,
+        # покрыт индексами (product, shop) и (product, price)
+        db_index=False,
     )
     shop = models.ForeignKey(
         Shop,
@@ -164,11 +312,36 @@ class ProductInfo(models.Model):
         related_name="product_infos",
         blank=True,
         on_delete=models.CASCADE,
+        # покрыт индексом (shop, id)
+        db_index=False,
+    )
+    available = models.BooleanField(
+        verbose_name="Магазин принимает заказы", default=True, editable=False
+    )
+    fingerprint = models.CharField(
+        max_length=32,
+        verbose_name="Отпечаток строки прайс-листа",
+        blank=True,
+        default="",
+        editable=False,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Время изменения", auto_now=True, db_index=True
+    )
+
+    objects = ProductInfoQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Информация о продукте"
         verbose_name_plural = "Информация о продуктах"
+        indexes = [
+            # предложения магазина в порядке курсора каталога
+            models.Index(fields=["shop", "id"], name="productinfo_shop_id_idx"),
+            # предложения продукта по цене (сравнение цен магазинов)
+            models.Index(
+                fields=["product", "price"], name="productinfo_product_price_idx"
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["product", "shop"], name="unique_product_info"
@@ -178,6 +351,34 @@ class ProductInfo(models.Model):
     def __str__(self):
         return f"{self.shop.name}-{self.product.name}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.available = self.shop.state
+        super().save(*args, **kwargs)
+
+
+class ImportMark(models.Model):
+    """
+    Продукты, встреченные идущим импортом прайс-листа: предложения магазина,
+    которых нет в файле, находятся запросом, а не по множеству в памяти.
+    Строки живут только внутри транзакции импорта
+    """
+
+    token = models.CharField(max_length=32, verbose_name="Импорт")
+    product_id = models.BigIntegerField(verbose_name="Продукт")
+
+    class Meta:
+        verbose_name = "Отметка импорта"
+        verbose_name_plural = "Отметки импорта"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["token", "product_id"], name="unique_import_mark"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.token}: {self.product_id}"
+
 
 class Parameter(models.Model):
     name = models.CharField(max_length=100, verbose_name="название параметра")
@@ -220,6 +421,212 @@ class ProductParameter(models.Model):
         return f"здесь модель - {self.parameter.name}"
 
 
+class ProductBestOfferQuerySet(models.QuerySet):
+    def refresh(self, product_ids, batch_size=1000):
+        """
+        Пересчитывает лучшие предложения продуктов пакетами по
+        ``batch_size``: один запрос предложений по индексу (продукт, цена) и
+        запись только изменившихся строк. Время изменения таких продуктов
+        обновляется; возвращает их идентификаторы
+        """
+        product_ids = sorted(set(product_ids))
+        changed = []
+        for start in range(0, len(product_ids), batch_size):
+            chunk = product_ids[start : start + batch_size]
+            best = {}
+            for product_id, offer_id, shop_id, price in (
+                ProductInfo.objects.using(self.db)
+                .filter(product_id__in=chunk, available=True, quantity__gt=0)
+                .order_by("product_id", "price", "id")
+                .values_list("product_id", "id", "shop_id", "price")
+            ):
+                row = best.get(product_id)
+                if row is None:
+                    best[product_id] = self.model(
+                        product_id=product_id,
+                        offer_id=offer_id,
+                        shop_id=shop_id,
+                        price=price,
+                        offers=1,
+                    )
+                else:
+                    row.offers += 1
+            current = {
+                row[0]: row[1:]
+                for row in self.filter(product_id__in=chunk).values_list(
+                    "product_id", "offer_id", "price", "offers"
+                )
+            }
+            stale = [
+                pk
+                for pk in chunk
+                if current.get(pk)
+                != (
+                    (best[pk].offer_id, best[pk].price, best[pk].offers)
+                    if pk in best
+                    else None
+                )
+            ]
+            if stale:
+                self.filter(product_id__in=stale).delete()
+                self.bulk_create([best[pk] for pk in stale if pk in best])
+                changed.extend(stale)
+        if changed:
+            Product.objects.using(self.db).filter(id__in=changed).touch()
+        return changed
+
+
+class ProductBestOffer(models.Model):
+    """
+    Самое дешевое предложение продукта среди магазинов, принимающих заказы,
+    с ненулевым остатком, и число таких предложений. Строки нет, если
+    купить продукт негде
+    """
+
+    product = models.OneToOneField(
+        Product,
+        verbose_name="Продукт",
+        related_name="best_offer",
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    offer = models.ForeignKey(
+        ProductInfo,
+        verbose_name="Самое дешевое предложение",
+        related_name="+",
+        on_delete=models.CASCADE,
+    )
+    shop = models.ForeignKey(
+        Shop, verbose_name="Магазин", related_name="+", on_delete=models.CASCADE
+    )
+    price = models.PositiveIntegerField(verbose_name="Минимальная цена")
+    offers = models.PositiveIntegerField(verbose_name="Число предложений")
+
+    objects = ProductBestOfferQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Лучшее предложение"
+        verbose_name_plural = "Лучшие предложения продуктов"
+
+    def __str__(self):
+        return f"{self.product_id}: {self.price} ({self.offers})"
+
+
+class ProductFacet(models.Model):
+    """
+    Денормализованный индекс фасетов каталога: для каждого предложения
+    строка без параметра и по строке на каждое значение параметра продукта
+    """
+
+    product_info = models.ForeignKey(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="facets",
+        on_delete=models.CASCADE,
+    )
+    product = models.ForeignKey(
+        Product, verbose_name="Продукт", related_name="+", on_delete=models.CASCADE
+    )
+    shop = models.ForeignKey(
+        Shop, verbose_name="Магазин", related_name="+", on_delete=models.CASCADE
+    )
+    category = models.ForeignKey(
+        Category, verbose_name="Категория", related_name="+", on_delete=models.CASCADE
+    )
+    price = models.PositiveIntegerField(verbose_name="Цена")
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name="parameter",
+        related_name="+",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    value = models.CharField(max_length=100, verbose_name="Значение", blank=True)
+    available = models.BooleanField(
+        verbose_name="Магазин принимает заказы", default=True
+    )
+
+    class Meta:
+        verbose_name = "Фасет каталога"
+        verbose_name_plural = "Индекс фасетов каталога"
+        indexes = [
+            models.Index(
+                fields=["parameter", "value", "product_info"],
+                name="facet_parameter_value_idx",
+            ),
+            models.Index(fields=["category", "price"], name="facet_category_price_idx"),
+            models.Index(fields=["shop", "price"], name="facet_shop_price_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_info_id}: {self.parameter_id}={self.value}"
+
+
+class SearchDocument(models.Model):
+    """
+    Поисковый документ предложения каталога
+    """
+
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="search_document",
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    product = models.ForeignKey(
+        Product, verbose_name="Продукт", related_name="+", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=50, verbose_name="Название продукта")
+    model = models.CharField(max_length=100, verbose_name="Модель", blank=True)
+    category = models.CharField(max_length=50, verbose_name="Категория", blank=True)
+    parameters = models.TextField(verbose_name="Значения параметров", blank=True)
+    vector = SearchVectorField(null=True, editable=False)
+    available = models.BooleanField(
+        verbose_name="Магазин принимает заказы", default=True
+    )
+
+    class Meta:
+        verbose_name = "Поисковый документ"
+        verbose_name_plural = "Поисковые документы"
+
+    def __str__(self):
+        return self.name
+
+
+class OrderQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """
+        Пересчитывает денормализованные итоги заказов: позиции агрегируются
+        в SQL одним запросом с группировкой по заказу и магазину, итоги
+        записываются одним ``bulk_update``
+        """
+        orders = {
+            pk: self.model(id=pk, items_count=0, total_sum=0, shop_ids=[])
+            for pk in self.order_by().values_list("id", flat=True)
+        }
+        if not orders:
+            return
+        lines = (
+            OrderItem.objects.filter(order_id__in=orders)
+            .order_by()
+            .values_list("order_id", "product_info__shop_id")
+            .annotate(count=Count("id"), amount=Sum("total_amount"))
+        )
+        for order_id, shop_id, count, amount in lines:
+            order = orders[order_id]
+            order.items_count += count
+            order.total_sum += amount or 0
+            if shop_id is not None:
+                order.shop_ids.append(shop_id)
+        for order in orders.values():
+            order.shop_ids.sort()
+        self.model.objects.bulk_update(
+            orders.values(), ["items_count", "total_sum", "shop_ids"]
+        )
+
+
 class Order(models.Model):
     user = models.ForeignKey(
         User,
@@ -227,6 +634,8 @@ class Order(models.Model):
         related_name="orders",
         blank=True,
         on_delete=models.CASCADE,
+        # покрыт индексом (user, status, created_at)
+        db_index=False,
     )
     contact = models.ForeignKey(
         "Contact",
@@ -240,15 +649,94 @@ class Order(models.Model):
     status = models.CharField(
         max_length=15, verbose_name="Статус", choices=Status.choices
     )
+    items_count = models.PositiveIntegerField(
+        verbose_name="Количество позиций", default=0, editable=False
+    )
+    total_sum = models.PositiveIntegerField(
+        verbose_name="Сумма заказа", default=0, editable=False
+    )
+    shop_ids = models.JSONField(
+        verbose_name="Магазины заказа", default=list, editable=False
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Список заказов"
+        indexes = [
+            models.Index(
+                fields=["user", "status", "-created_at"],
+                name="order_user_status_created_idx",
+            ),
+            # история заказов: корзина в индекс не попадает
+            models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="order_history_idx",
+                condition=~models.Q(status=Status.basket),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user}-{self.created_at}"
 
 
+def _expression(value):
+    return value if hasattr(value, "resolve_expression") else Value(value)
+
+
+class OrderItemQuerySet(models.QuerySet):
+    """
+    Массовые операции с позициями заказа, сохраняющие
+    ``total_amount = price * quantity`` в обход ``OrderItem.save()`` и
+    обновляющие итоги затронутых заказов в той же транзакции
+    """
+
+    def _order_ids(self):
+        return list(self.order_by().values_list("order_id", flat=True).distinct())
+
+    def _refresh_orders(self, order_ids):
+        Order.objects.using(self.db).filter(id__in=order_ids).refresh_totals()
+
+    def update(self, **kwargs):
+        # в UPDATE правая часть ссылается на старые значения строки, поэтому
+        # сумма считается из новых выражений цены и количества
+        if "price" in kwargs or "quantity" in kwargs:
+            kwargs["total_amount"] = models.ExpressionWrapper(
+                _expression(kwargs.get("price", F("price")))
+                * _expression(kwargs.get("quantity", F("quantity"))),
+                output_field=models.PositiveIntegerField(),
+            )
+        with transaction.atomic(using=self.db, savepoint=False):
+            order_ids = self._order_ids()
+            # позиции, перенесенные в другой заказ, меняют и его итоги
+            target = kwargs.get("order_id", kwargs.get("order"))
+            if target is not None:
+                order_ids.append(getattr(target, "pk", target))
+            rows = super().update(**kwargs)
+            self._refresh_orders(order_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.total_amount = obj.price * obj.quantity
+        with transaction.atomic(using=self.db, savepoint=False):
+            created = super().bulk_create(objs, *args, **kwargs)
+            self._refresh_orders({obj.order_id for obj in objs})
+        return created
+
+    def delete(self):
+        with transaction.atomic(using=self.db, savepoint=False):
+            order_ids = self._order_ids()
+            deleted = super().delete()
+            self._refresh_orders(order_ids)
+        return deleted
+
+    def recalculate_totals(self):
+        return self.update(total_amount=F("price") * F("quantity"))
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order,
@@ -272,6 +760,8 @@ class OrderItem(models.Model):
         default=0, verbose_name="Общая стоимость"
     )
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Заказанная позиция"
         verbose_name_plural = "Список заказанных позиций"
@@ -286,7 +776,336 @@ class OrderItem(models.Model):
 
     def save(self, *args, **kwargs):
         self.total_amount = self.price * self.quantity
-        super(OrderItem, self).save(*args, **kwargs)
+        with transaction.atomic():
+            super(OrderItem, self).save(*args, **kwargs)
+            Order.objects.filter(pk=self.order_id).refresh_totals()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Order.objects.filter(pk=self.order_id).refresh_totals()
+        return deleted
+
+
+class OrderEvent(models.Model):
+    """
+    Журнал смены статусов заказов: строки только добавляются. Хронология
+    заказа читается по индексу (заказ, id), поток изменений для внешних
+    потребителей - по возрастанию первичного ключа
+    """
+
+    order = models.ForeignKey(
+        Order,
+        verbose_name="Заказ",
+        related_name="events",
+        on_delete=models.CASCADE,
+        # покрыт индексом (order, id)
+        db_index=False,
+    )
+    from_status = models.CharField(
+        max_length=15, verbose_name="Прежний статус", choices=Status.choices
+    )
+    status = models.CharField(
+        max_length=15, verbose_name="Новый статус", choices=Status.choices
+    )
+    user = models.ForeignKey(
+        User,
+        verbose_name="Инициатор",
+        related_name="+",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    created_at = models.DateTimeField(verbose_name="Время", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Событие заказа"
+        verbose_name_plural = "Журнал событий заказов"
+        indexes = [
+            models.Index(fields=["order", "id"], name="order_event_timeline_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id}: {self.from_status} -> {self.status}"
+
+
+# ключ рекомендательной блокировки PostgreSQL, под которой нумеруется лента
+CHANGE_FEED_LOCK = 0x636C6F67
+
+
+class ChangeLogQuerySet(models.QuerySet):
+    def record(self, topic, keys, deleted=False):
+        """
+        Записывает изменения объектов; ``keys`` - пары (id объекта, id
+        магазина)
+        """
+        now = timezone.now()
+        self.bulk_create(
+            self.model(
+                topic=topic,
+                object_id=object_id,
+                shop_id=shop_id,
+                deleted=deleted,
+                created_at=now,
+            )
+            for object_id, shop_id in keys
+        )
+
+    def record_query(self, topic, keys, deleted=False):
+        """
+        То же для ``keys`` - запроса ``values_list(id объекта, id магазина)``:
+        строки журнала вставляются одним INSERT ... SELECT, без чтения
+        ключей в Python
+        """
+        self._for_write = True
+        connection = connections[self.db]
+        sql, params = keys.query.get_compiler(connection=connection).as_sql()
+        quote = connection.ops.quote_name
+        columns = ", ".join(
+            map(quote, ("topic", "deleted", "created_at", "object_id", "shop_id"))
+        )
+        created_at = self.model._meta.get_field("created_at").get_db_prep_save(
+            timezone.now(), connection
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(self.model._meta.db_table)} ({columns}) "
+                f"SELECT %s, %s, %s, k.* FROM ({sql}) AS k",
+                (topic, deleted, created_at, *params),
+            )
+
+    def sequence(self):
+        """
+        Нумерует строки журнала без номера ленты (``seq``) по возрастанию
+        первичного ключа, продолжая уже выданные номера, и возвращает их
+        число. Строка получает номер только после фиксации своей
+        транзакции, поэтому номера растут в порядке фиксации, а строка,
+        зафиксированная позже, - даже с меньшим первичным ключом - получает
+        номер больше уже выданных. Вызывается воркером фоновых задач
+        (``backend.jobs.work``), а не чтением ленты
+        """
+        self._for_write = True
+        # без новых строк - один запрос по частичному индексу, без блокировки
+        if not self.filter(seq__isnull=True).exists():
+            return 0
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db):
+            if connection.vendor == "postgresql":
+                # SQLite и так выполняет записи по одной
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT pg_advisory_xact_lock(%s)", [CHANGE_FEED_LOCK]
+                    )
+            pending = self.filter(seq__isnull=True)
+            last = Coalesce(
+                Subquery(
+                    self.filter(seq__isnull=False).order_by("-seq").values("seq")[:1]
+                ),
+                Value(0),
+                output_field=models.BigIntegerField(),
+            )
+            first = Subquery(pending.order_by("id").values("id")[:1])
+            # номера с пропусками, но без повторов: id + (последний - первый
+            # ожидающий + 1)
+            return pending.update(seq=F("id") + last + 1 - first)
+
+    def record_orders(self, order_ids):
+        """
+        Записывает изменения заказов - по строке на магазин их позиций
+        """
+        self._for_write = True
+        self.record_query(
+            ChangeTopic.order,
+            OrderItem.objects.using(self.db)
+            .filter(order_id__in=order_ids)
+            .order_by()
+            .values_list("order_id", "product_info__shop_id")
+            .distinct(),
+        )
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений (outbox) предложений и заказов для внешних систем:
+    строка добавляется в транзакции изменения, в том числе массового, а
+    номер ленты ``seq`` - курсор ленты изменений (``backend.changes``) -
+    присваивается ей после фиксации (``ChangeLogQuerySet.sequence``).
+    Заказ записывается отдельной строкой для каждого магазина своих позиций
+    """
+
+    topic = models.CharField(
+        max_length=10, verbose_name="Тип объекта", choices=ChangeTopic.choices
+    )
+    object_id = models.BigIntegerField(verbose_name="Объект")
+    # без внешнего ключа: записи об удаленных магазинах и объектах остаются
+    shop_id = models.BigIntegerField(verbose_name="Магазин", blank=True, null=True)
+    deleted = models.BooleanField(verbose_name="Удален", default=False)
+    created_at = models.DateTimeField(verbose_name="Время", default=timezone.now)
+    seq = models.BigIntegerField(
+        verbose_name="Номер в ленте", blank=True, null=True, editable=False
+    )
+
+    objects = ChangeLogQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Изменение"
+        verbose_name_plural = "Журнал изменений"
+        indexes = [
+            models.Index(fields=["topic", "seq"], name="changelog_topic_seq_idx"),
+            models.Index(
+                fields=["topic", "shop_id", "seq"], name="changelog_shop_seq_idx"
+            ),
+            models.Index(fields=["seq"], name="changelog_seq_idx"),
+            # строки, еще не получившие номер: их немного
+            models.Index(
+                fields=["id"],
+                name="changelog_pending_idx",
+                condition=models.Q(seq__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.topic} {self.object_id}"
+
+
+class ShopDailySales(models.Model):
+    """
+    Сводка продаж магазина за день по дате создания заказа: учитываются
+    оформленные и не отмененные заказы
+    """
+
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="daily_sales",
+        on_delete=models.CASCADE,
+        # покрыт ограничением (shop, date)
+        db_index=False,
+    )
+    date = models.DateField(verbose_name="Дата")
+    orders = models.IntegerField(verbose_name="Заказов", default=0)
+    items_sold = models.IntegerField(verbose_name="Продано единиц", default=0)
+    revenue = models.BigIntegerField(verbose_name="Выручка", default=0)
+
+    class Meta:
+        verbose_name = "Продажи магазина за день"
+        verbose_name_plural = "Продажи магазинов по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "date"], name="unique_shop_daily_sales"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.shop_id} {self.date}: {self.revenue}"
+
+
+class ShopProductSales(models.Model):
+    """
+    Продажи предложения магазина за все время
+    """
+
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="sales",
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="+",
+        on_delete=models.CASCADE,
+        # покрыт индексом (shop, revenue)
+        db_index=False,
+    )
+    orders = models.IntegerField(verbose_name="Заказов", default=0)
+    quantity = models.IntegerField(verbose_name="Продано единиц", default=0)
+    revenue = models.BigIntegerField(verbose_name="Выручка", default=0)
+
+    class Meta:
+        verbose_name = "Продажи предложения"
+        verbose_name_plural = "Продажи предложений"
+        indexes = [
+            models.Index(fields=["shop", "-revenue"], name="shop_product_sales_top_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.product_info_id}: {self.revenue}"
+
+
+class ShopStatusCount(models.Model):
+    """
+    Число заказов с позициями магазина в каждом статусе
+    """
+
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="status_counts",
+        on_delete=models.CASCADE,
+        # покрыт ограничением (shop, status)
+        db_index=False,
+    )
+    status = models.CharField(
+        max_length=15, verbose_name="Статус", choices=Status.choices
+    )
+    orders = models.IntegerField(verbose_name="Заказов", default=0)
+
+    class Meta:
+        verbose_name = "Заказы магазина в статусе"
+        verbose_name_plural = "Заказы магазинов по статусам"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "status"], name="unique_shop_status_count"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.shop_id} {self.status}: {self.orders}"
+
+
+class ShopStockQuerySet(models.QuerySet):
+    def add(self, deltas):
+        """
+        Прибавляет к остаткам магазинов ``{id магазина: приращение}``:
+        недостающие строки создаются нулевыми, затем по UPDATE на магазин в
+        порядке ключа - в пакете записи магазин обычно один
+        """
+        deltas = {shop_id: delta for shop_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.bulk_create(
+            [self.model(shop_id=shop_id) for shop_id in deltas], ignore_conflicts=True
+        )
+        for shop_id, delta in sorted(deltas.items()):
+            self.filter(shop_id=shop_id).update(quantity=F("quantity") + delta)
+
+
+class ShopStock(models.Model):
+    """
+    Суммарный остаток предложений магазина для панели владельца;
+    обновляется приращениями в транзакциях, меняющих остатки
+    """
+
+    shop = models.OneToOneField(
+        Shop,
+        verbose_name="Магазин",
+        related_name="stock",
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    quantity = models.BigIntegerField(verbose_name="Остаток", default=0)
+
+    objects = ShopStockQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Остаток магазина"
+        verbose_name_plural = "Остатки магазинов"
+
+    def __str__(self):
+        return f"{self.shop_id}: {self.quantity}"
 
 
 # убрать null-True
@@ -321,3 +1140,60 @@ class Contact(models.Model):
 
     def __str__(self):
         return f"{self.city} {self.street} {self.house}"
+
+
+class Job(models.Model):
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    payload = models.JSONField(verbose_name="Параметры", default=dict)
+    state = models.CharField(
+        max_length=10,
+        verbose_name="Состояние",
+        choices=JobState.choices,
+        default=JobState.queued,
+    )
+    user = models.ForeignKey(
+        User,
+        verbose_name="Пользователь",
+        related_name="jobs",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    idempotency_key = models.CharField(
+        max_length=255,
+        verbose_name="Ключ идемпотентности",
+        unique=True,
+        blank=True,
+        null=True,
+    )
+    attempts = models.PositiveIntegerField(verbose_name="Попыток", default=0)
+    max_attempts = models.PositiveIntegerField(verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(verbose_name="Выполнить после", default=timezone.now)
+    locked_by = models.CharField(max_length=100, verbose_name="Воркер", blank=True)
+    locked_at = models.DateTimeField(
+        verbose_name="Взята в работу", blank=True, null=True
+    )
+    result = models.JSONField(verbose_name="Результат", blank=True, null=True)
+    last_error = models.TextField(verbose_name="Последняя ошибка", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name="Завершена", blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Список фоновых задач"
+        indexes = [
+            # выборка воркера: только задачи в очереди
+            models.Index(
+                fields=["run_at", "id"],
+                name="job_queue_idx",
+                condition=models.Q(state=JobState.queued),
+            ),
+            models.Index(
+                fields=["locked_at"],
+                name="job_running_idx",
+                condition=models.Q(state=JobState.running),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name}#{self.id} ({self.state})"
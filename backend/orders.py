@@ -0,0 +1,253 @@
+"""
+Корзина и оформление заказа.
+
+Корзина - это заказ пользователя в статусе ``basket``. При оформлении
+заказ переводится в статус ``new``, а остатки ``ProductInfo`` списываются в
+одной транзакции: строки предложений блокируются ``select_for_update`` в
+порядке первичного ключа (без взаимных блокировок), после чего для каждого
+магазина выполняется один условный UPDATE, который уменьшает остаток только
+там, где его хватает. Если хотя бы одна строка не обновилась, транзакция
+откатывается, поэтому продать больше остатка невозможно. Сводки продаж
+магазинов (``backend.stats``), журнал событий заказа и письмо о новом
+заказе обновляются в той же транзакции. Доступность предложений
+проверяется по их полю ``available`` (``ShopQuerySet``), без соединения с
+магазинами. Дальнейшие статусы заказа меняет ``backend.transitions``.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+
+from backend.cache import (
+    CATALOG,
+    catalog_cache,
+    offer_scope,
+    product_scope,
+    shop_scope,
+)
+from backend.models import (
+    ChangeLog,
+    Contact,
+    Order,
+    OrderEvent,
+    OrderItem,
+    ProductBestOffer,
+    ProductInfo,
+    ShopStock,
+)
+from backend.stats import record_status_change
+from backend.tasks import queue_order_status_email
+from Py_Diplom_new.enums import Status
+
+LINES_BATCH_SIZE = 500
+
+
+class OrderError(ValueError):
+    """
+    Ошибка операции с корзиной или заказом
+    """
+
+
+class InsufficientStock(OrderError):
+    """
+    Остатка предложения не хватает для оформления заказа
+    """
+
+    def __init__(self, product_info_ids):
+        self.product_info_ids = sorted(product_info_ids)
+        super().__init__(
+            f"Недостаточно товара на складе: {', '.join(map(str, self.product_info_ids))}"
+        )
+
+
+def get_basket(user, create=False):
+    basket = Order.objects.filter(user=user, status=Status.basket).first()
+    if basket is None and create:
+        basket = Order.objects.create(user=user, status=Status.basket)
+    return basket
+
+
+def _offers(product_info_ids):
+    offers = {
+        offer.id: offer
+        for offer in ProductInfo.objects.filter(
+            id__in=product_info_ids, available=True
+        ).only("id", "price")
+    }
+    missing = set(product_info_ids).difference(offers)
+    if missing:
+        raise OrderError(
+            f"Предложения недоступны для заказа: {', '.join(map(str, sorted(missing)))}"
+        )
+    return offers
+
+
+@transaction.atomic
+def update_basket(user, items, replace=False):
+    """
+    Добавляет позиции в корзину; ``items`` - словарь ``{product_info_id:
+    количество}``. При ``replace`` количество заменяется, а не суммируется
+    """
+    basket = get_basket(user, create=True)
+    offers = _offers(items)
+    existing = {
+        item.product_info_id: item
+        for item in basket.ordered_items.filter(product_info_id__in=items)
+    }
+    to_create = []
+    to_update = []
+    for product_info_id, quantity in items.items():
+        price = offers[product_info_id].price
+        item = existing.get(product_info_id)
+        if item is None:
+            to_create.append(
+                OrderItem(
+                    order=basket,
+                    product_info_id=product_info_id,
+                    quantity=quantity,
+                    price=price,
+                )
+            )
+        else:
+            item.quantity = quantity if replace else item.quantity + quantity
+            item.price = price
+            to_update.append(item)
+    # суммы позиций считает OrderItemQuerySet
+    if to_create:
+        OrderItem.objects.bulk_create(to_create, batch_size=LINES_BATCH_SIZE)
+    if to_update:
+        OrderItem.objects.bulk_update(
+            to_update, ["quantity", "price"], batch_size=LINES_BATCH_SIZE
+        )
+    return basket
+
+
+def remove_from_basket(user, product_info_ids):
+    basket = get_basket(user)
+    if basket is None:
+        return None
+    basket.ordered_items.filter(product_info_id__in=product_info_ids).delete()
+    return basket
+
+
+def _reserve_stock(shop_id, quantities):
+    """
+    Один UPDATE на магазин: остаток уменьшается только у строк, где его
+    хватает; возвращает, удалось ли списать все позиции
+    """
+    condition = Q()
+    for product_info_id, quantity in quantities.items():
+        condition |= Q(id=product_info_id, quantity__gte=quantity)
+    updated = ProductInfo.objects.filter(condition, shop_id=shop_id).update(
+        quantity=F("quantity")
+        - Case(
+            *[
+                When(id=product_info_id, then=Value(quantity))
+                for product_info_id, quantity in quantities.items()
+            ]
+        )
+    )
+    return updated == len(quantities)
+
+
+def checkout(user, contact_id=None, split=False):
+    """
+    Оформляет корзину пользователя: списывает остатки и переводит заказ в
+    статус ``new``. Позиции магазинов, не принимающих заказы, отклоняют
+    оформление, а с ``split`` остаются в новой корзине
+    """
+    basket = get_basket(user)
+    if basket is None:
+        raise OrderError("Корзина пуста")
+    if (
+        contact_id is not None
+        and not Contact.objects.filter(id=contact_id, user=user).exists()
+    ):
+        raise OrderError("Контакт не найден")
+    with transaction.atomic():
+        return _checkout(basket, contact_id, split)
+
+
+def _defer_items(basket, product_info_ids):
+    """
+    Переносит позиции в новую корзину пользователя одним UPDATE
+    """
+    rest = Order.objects.create(user_id=basket.user_id, status=Status.basket)
+    basket.ordered_items.filter(product_info_id__in=product_info_ids).update(order=rest)
+    return rest
+
+
+def _checkout(basket, contact_id, split=False):
+    # транзакция начинается с записи: на PostgreSQL она блокирует строку
+    # корзины от повторного оформления, а на SQLite сразу берет блокировку
+    # на запись вместо повышения блокировки чтения (иначе - взаимоблокировка)
+    if not Order.objects.filter(id=basket.id, status=Status.basket).update(
+        status=Status.new, contact_id=contact_id
+    ):
+        raise OrderError("Корзина уже оформлена")
+
+    items = list(basket.ordered_items.all())
+    if not items:
+        raise OrderError("Корзина пуста")
+    quantities = {item.product_info_id: item.quantity for item in items}
+    offers = {
+        offer.id: offer
+        for offer in ProductInfo.objects.select_for_update(of=("self",))
+        .filter(id__in=quantities, available=True)
+        .order_by("pk")
+        .only("id", "product_id", "shop_id", "price", "quantity")
+    }
+    unavailable = set(quantities).difference(offers)
+    if unavailable and split and len(unavailable) < len(quantities):
+        _defer_items(basket, unavailable)
+        items = [item for item in items if item.product_info_id in offers]
+        quantities = {pk: quantities[pk] for pk in offers}
+    elif unavailable:
+        raise OrderError(
+            f"Предложения недоступны для заказа: {', '.join(map(str, sorted(unavailable)))}"
+        )
+
+    by_shop = defaultdict(dict)
+    for product_info_id, quantity in quantities.items():
+        by_shop[offers[product_info_id].shop_id][product_info_id] = quantity
+    short = [
+        pk for pk, quantity in quantities.items() if offers[pk].quantity < quantity
+    ]
+    if short:
+        raise InsufficientStock(short)
+    for shop_id in sorted(by_shop):
+        if not _reserve_stock(shop_id, by_shop[shop_id]):
+            raise InsufficientStock(by_shop[shop_id])
+    ShopStock.objects.add(
+        {shop_id: -sum(reserved.values()) for shop_id, reserved in by_shop.items()}
+    )
+    # лучшее предложение продукта меняется, только если остаток кончился
+    ProductBestOffer.objects.refresh(
+        offers[pk].product_id
+        for pk, quantity in quantities.items()
+        if offers[pk].quantity == quantity
+    )
+    # условный UPDATE меняет остаток и время изменения всех списанных
+    # предложений: кешированные ответы с ними устарели, как и их ETag
+    catalog_cache.invalidate(
+        CATALOG,
+        *map(shop_scope, by_shop),
+        *map(offer_scope, quantities),
+        *map(product_scope, {offers[pk].product_id for pk in quantities}),
+    )
+
+    for item in items:
+        item.price = offers[item.product_info_id].price
+    OrderItem.objects.bulk_update(items, ["price"], batch_size=LINES_BATCH_SIZE)
+    basket.status = Status.new
+    basket.contact_id = contact_id
+    OrderEvent.objects.create(
+        order=basket,
+        from_status=Status.basket,
+        status=Status.new,
+        user_id=basket.user_id,
+    )
+    record_status_change([basket.id], Status.basket, Status.new)
+    ChangeLog.objects.record_orders([basket.id])
+    queue_order_status_email(basket)
+    return basket
@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CatalogPagination(CursorPagination):
+    """
+    Курсорная пагинация каталога: страница ищется по ключу, а не через OFFSET
+    """
+
+    ordering = "id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class OrderHistoryPagination(CursorPagination):
+    ordering = ("-created_at", "-id")
+    page_size = 20
+
+
+class JobPagination(CursorPagination):
+    ordering = "-id"
+    page_size = 20
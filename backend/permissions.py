@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from rest_framework.permissions import BasePermission
+
+
+class IsShopOwner(BasePermission):
+    """
+    Доступ к магазину только для его владельца или персонала
+    """
+
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_staff or obj.user_id == request.user.id
+
+
+class IsMetricsScraper(BasePermission):
+    """
+    Метрики доступны персоналу и сборщику с токеном ``METRICS_TOKEN``
+    """
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        token = getattr(settings, "METRICS_TOKEN", "")
+        header = request.headers.get("Authorization", "")
+        return bool(token) and constant_time_compare(header, f"Bearer {token}")
@@ -0,0 +1,74 @@
+"""
+Маршрутизация запросов между основной БД и репликой.
+
+Чтение каталога идет в реплику (``REPLICA_DATABASE``), все записи, заказы,
+пользователи и чтение внутри транзакции - в основную БД. Пользователь,
+который только что что-то изменил, на ``REPLICA_PIN_SECONDS`` закрепляется
+за основной БД (cookie от ``ReplicaPinningMiddleware``) и не видит
+отстающую реплику: read-your-writes.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_pinned = contextvars.ContextVar("db_pinned", default=False)
+
+
+@contextmanager
+def pin_to_primary(pinned=True):
+    """
+    Все чтения внутри блока идут в основную БД
+    """
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def replica_alias():
+    alias = getattr(settings, "REPLICA_DATABASE", None)
+    return alias if alias in connections else None
+
+
+class PrimaryReplicaRouter:
+    replica_models = {
+        "shop",
+        "category",
+        "product",
+        "productinfo",
+        "parameter",
+        "productparameter",
+        "productfacet",
+        "searchdocument",
+    }
+
+    def db_for_read(self, model, **hints):
+        replica = replica_alias()
+        if (
+            replica is None
+            or model._meta.app_label != "backend"
+            or model._meta.model_name not in self.replica_models
+            or _pinned.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # основная БД и реплика хранят одни и те же данные
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,360 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Для каждого предложения хранится поисковый документ ``SearchDocument`` с
+названием продукта, моделью, категорией и значениями параметров. На
+PostgreSQL поиск идет по хранимому ``tsvector`` с GIN-индексом и по
+триграммам названия (опечатки); на остальных СУБД - по инвертированному
+индексу в памяти процесса с нечетким сопоставлением слов по триграммам.
+Оба индекса обновляются инкрементально через ``index_products``.
+
+Индекс в памяти - запасной вариант для разработки и тестов на SQLite: он
+свой у каждого процесса, и изменения, сделанные другим процессом (например,
+импорт в фоновой задаче), он видит только после перестройки раз в
+``SEARCH_INDEX_TTL`` секунд. Доступность предложений индекс не хранит:
+она проверяется по таблице документов при отборе результатов, поэтому
+выдача совпадает с PostgreSQL и не короче ``limit``, пока совпадений
+хватает.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connection, connections, router, transaction
+from django.db.models import F, Q
+
+from backend.models import ProductInfo, ProductParameter, SearchDocument
+
+INDEX_BATCH_SIZE = 1000
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# вес поля документа: название, модель, категория, параметры
+_WEIGHTS = (("name", 1.0), ("model", 0.6), ("category", 0.6), ("parameters", 0.3))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower().replace("ё", "е"))
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс в памяти с ранжированием по TF-IDF и нечетким
+    сопоставлением слов запроса со словарем по сходству триграмм
+    """
+
+    similarity_threshold = 0.35
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._trigrams = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id, fields):
+        """
+        Добавляет или заменяет документ; ``fields`` - пары (текст, вес)
+        """
+        terms = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                terms[token] = terms.get(token, 0) + weight
+        with self._lock:
+            self._remove(doc_id)
+            self._documents[doc_id] = terms
+            for token, weight in terms.items():
+                postings = self._postings[token]
+                if not postings:
+                    for trigram in trigrams(token):
+                        self._trigrams[trigram].add(token)
+                postings[doc_id] = weight
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for token in self._documents.pop(doc_id, ()):
+            postings = self._postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[token]
+                for trigram in trigrams(token):
+                    self._trigrams[trigram].discard(token)
+
+    def _expand(self, token):
+        if token in self._postings:
+            return [(token, 1.0)]
+        query = trigrams(token)
+        shared = defaultdict(int)
+        for trigram in query:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        terms = []
+        for candidate, count in shared.items():
+            similarity = count / (len(query) + len(trigrams(candidate)) - count)
+            if similarity >= self.similarity_threshold:
+                terms.append((candidate, similarity))
+        return terms
+
+    def search(self, query, limit, allowed=None):
+        """
+        Возвращает до ``limit`` пар (идентификатор, ранг) по убыванию ранга;
+        документы, совпавшие с большим числом слов запроса, идут выше.
+        ``allowed`` получает список идентификаторов и возвращает те из них,
+        которые можно выдавать
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores = defaultdict(float)
+        matches = defaultdict(int)
+        with self._lock:
+            total = len(self._documents)
+            for token in tokens:
+                best = {}
+                for term, factor in self._expand(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for doc_id, weight in postings.items():
+                        score = factor * weight * idf
+                        if score > best.get(doc_id, 0):
+                            best[doc_id] = score
+                for doc_id, score in best.items():
+                    scores[doc_id] += score
+                    matches[doc_id] += 1
+
+        def rank(doc_id):
+            return matches[doc_id], scores[doc_id]
+
+        if allowed is None:
+            hits = heapq.nlargest(limit, scores, key=rank)
+        else:
+            # кандидаты проверяются пакетами в порядке ранга, пока не
+            # наберется limit подходящих
+            ranked = sorted(scores, key=rank, reverse=True)
+            hits = []
+            step = max(limit, INDEX_BATCH_SIZE)
+            for start in range(0, len(ranked), step):
+                chunk = ranked[start : start + step]
+                accepted = allowed(chunk)
+                hits.extend(doc_id for doc_id in chunk if doc_id in accepted)
+                if len(hits) >= limit:
+                    break
+            hits = hits[:limit]
+        return [
+            (doc_id, scores[doc_id] * matches[doc_id] / len(tokens)) for doc_id in hits
+        ]
+
+
+class PythonSearchBackend:
+    """
+    Поиск по инвертированному индексу в памяти процесса; индекс строится
+    из таблицы документов при первом запросе, дальше обновляется
+    инкрементально и перестраивается через ``SEARCH_INDEX_TTL`` секунд,
+    чтобы увидеть изменения других процессов
+    """
+
+    def __init__(self):
+        self._index = None
+        self._built = 0
+        self._lock = threading.Lock()
+
+    def _get_index(self):
+        with self._lock:
+            if (
+                self._index is not None
+                and time.monotonic() - self._built > settings.SEARCH_INDEX_TTL
+            ):
+                self._index = None
+            if self._index is None:
+                index = InvertedIndex()
+                for document in SearchDocument.objects.iterator(
+                    chunk_size=INDEX_BATCH_SIZE
+                ):
+                    index.add(document.product_info_id, _fields(document))
+                self._index = index
+                self._built = time.monotonic()
+            return self._index
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+
+    def update(self, documents):
+        if self._index is not None:
+            for document in documents:
+                self._index.add(document.product_info_id, _fields(document))
+
+    def remove(self, info_ids):
+        if self._index is not None:
+            for info_id in info_ids:
+                self._index.remove(info_id)
+
+    def search(self, query, limit):
+        return self._get_index().search(query, limit, _available)
+
+
+class PostgresSearchBackend:
+    """
+    Поиск PostgreSQL по хранимому ``tsvector`` и триграммам названия.
+    Оба условия - операторы с GIN-индексами (``@@`` и ``%>``), и
+    PostgreSQL объединяет их через BitmapOr; сходство и ранг считаются
+    только для найденных документов. Порог оператора ``%>`` задается
+    параметром ``pg_trgm.word_similarity_threshold`` на время транзакции
+    """
+
+    config = "russian"
+    similarity_threshold = 0.4
+
+    def reset(self):
+        pass
+
+    def update(self, documents):
+        SearchDocument.objects.filter(
+            product_info_id__in=[document.product_info_id for document in documents]
+        ).update(
+            vector=SearchVector("name", weight="A", config=self.config)
+            + SearchVector("model", "category", weight="B", config=self.config)
+            + SearchVector("parameters", weight="C", config=self.config)
+        )
+
+    def remove(self, info_ids):
+        pass
+
+    def search(self, query, limit):
+        search_query = SearchQuery(query, config=self.config, search_type="websearch")
+        using = router.db_for_read(SearchDocument)
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                    [str(self.similarity_threshold)],
+                )
+            return list(
+                SearchDocument.objects.using(using)
+                .filter(
+                    Q(vector=search_query) | Q(TrigramWordSimilar(F("name"), query)),
+                    available=True,
+                )
+                .annotate(
+                    rank=SearchRank(F("vector"), search_query)
+                    + TrigramWordSimilarity(query, "name")
+                )
+                .order_by("-rank")
+                .values_list("product_info_id", "rank")[:limit]
+            )
+
+
+_python_backend = PythonSearchBackend()
+_postgres_backend = PostgresSearchBackend()
+
+
+def get_search_backend():
+    if connection.vendor == "postgresql":
+        return _postgres_backend
+    return _python_backend
+
+
+def _available(info_ids):
+    return set(
+        SearchDocument.objects.filter(
+            product_info_id__in=info_ids, available=True
+        ).values_list("product_info_id", flat=True)
+    )
+
+
+def _fields(document):
+    return [(getattr(document, name), weight) for name, weight in _WEIGHTS]
+
+
+def index_products(product_ids):
+    """
+    Перестраивает поисковые документы всех предложений указанных продуктов
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    parameters = defaultdict(list)
+    for product_id, value in ProductParameter.objects.filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "value"):
+        parameters[product_id].append(value)
+    documents = [
+        SearchDocument(
+            product_info_id=info_id,
+            product_id=product_id,
+            name=name,
+            model=model or "",
+            category=category or "",
+            parameters=" ".join(parameters[product_id]),
+            available=available,
+        )
+        for info_id, product_id, name, model, category, available in (
+            ProductInfo.objects.filter(product_id__in=product_ids).values_list(
+                "id",
+                "product_id",
+                "product__name",
+                "model",
+                "product__category__name",
+                "available",
+            )
+        )
+    ]
+    SearchDocument.objects.filter(product_id__in=product_ids).delete()
+    SearchDocument.objects.bulk_create(documents, batch_size=INDEX_BATCH_SIZE)
+    get_search_backend().update(documents)
+
+
+def unindex_offers(info_ids):
+    """
+    Убирает удаленные предложения из индекса в памяти
+    """
+    get_search_backend().remove(info_ids)
+
+
+def rebuild_search_index(batch_size=INDEX_BATCH_SIZE):
+    """
+    Полная перестройка поисковых документов
+    """
+    SearchDocument.objects.all().delete()
+    get_search_backend().reset()
+    product_ids = (
+        ProductInfo.objects.order_by("product_id")
+        .values_list("product_id", flat=True)
+        .distinct()
+        .iterator(chunk_size=batch_size)
+    )
+    chunk = []
+    for product_id in product_ids:
+        chunk.append(product_id)
+        if len(chunk) >= batch_size:
+            index_products(chunk)
+            chunk = []
+    index_products(chunk)
+
+
+def search_products(query, limit):
+    """
+    Пары (идентификатор предложения, ранг) по убыванию релевантности
+    """
+    return get_search_backend().search(query, limit)
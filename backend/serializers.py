@@ -1,6 +1,19 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from backend.models import Shop, Product
+from backend.models import (
+    Category,
+    Job,
+    Order,
+    OrderEvent,
+    OrderItem,
+    Product,
+    ProductBestOffer,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from Py_Diplom_new.enums import ChangeTopic, Status
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -9,9 +22,215 @@ class ShopSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "state")
 
 
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ("id", "name")
+
+
+class CategoryListSerializer(serializers.ModelSerializer):
+    shops = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Category
+        fields = ("id", "name", "shops")
+
+
+class ProductParameterSerializer(serializers.ModelSerializer):
+    parameter = serializers.CharField(source="parameter.name", read_only=True)
+
+    class Meta:
+        model = ProductParameter
+        fields = ("parameter", "value")
+
+
+class BestOfferSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductBestOffer
+        fields = ("offer", "shop", "price", "offers")
+
+
 class ProductSerializer(serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    parameters = ProductParameterSerializer(
+        source="products_info", many=True, read_only=True
+    )
+    best_offer = BestOfferSerializer(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ("id", "name", "category", "parameters", "best_offer")
+
+
+class ProductInfoSerializer(serializers.ModelSerializer):
+    product = ProductSerializer(read_only=True)
     shop = ShopSerializer(read_only=True)
 
+    class Meta:
+        model = ProductInfo
+        fields = ("id", "model", "quantity", "price", "price_rrc", "product", "shop")
+
+
+class PriceOfferSerializer(serializers.ModelSerializer):
+    shop = ShopSerializer(read_only=True)
+
+    class Meta:
+        model = ProductInfo
+        fields = ("id", "model", "quantity", "price", "price_rrc", "shop")
+
+
+class ProductPricesSerializer(serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    best_offer = BestOfferSerializer(read_only=True)
+    offers = PriceOfferSerializer(source="offers_in_stock", many=True, read_only=True)
+
     class Meta:
         model = Product
-        fields = ("id", "name", "category", "quantity", "price", "shop")
+        fields = ("id", "name", "category", "best_offer", "offers")
+
+
+class CatalogFilterSerializer(serializers.Serializer):
+    """
+    Параметры фильтрации каталога; значение параметра продукта задается
+    как ``param=название:значение``
+    """
+
+    category = serializers.ListField(child=serializers.IntegerField(), required=False)
+    shop = serializers.ListField(child=serializers.IntegerField(), required=False)
+    price_min = serializers.IntegerField(min_value=0, required=False)
+    price_max = serializers.IntegerField(min_value=0, required=False)
+    param = serializers.ListField(child=serializers.CharField(), required=False)
+
+    def validate_param(self, value):
+        parameters = {}
+        for item in value:
+            name, separator, parameter_value = item.partition(":")
+            if not separator:
+                raise serializers.ValidationError("Ожидается формат название:значение")
+            parameters.setdefault(name.strip(), []).append(parameter_value.strip())
+        return parameters
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class SearchResultSerializer(ProductInfoSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(ProductInfoSerializer.Meta):
+        fields = ProductInfoSerializer.Meta.fields + ("rank",)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ("id", "product_info", "quantity", "price", "total_amount")
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    ordered_items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = (
+            "id",
+            "status",
+            "created_at",
+            "contact",
+            "items_count",
+            "total_sum",
+            "shop_ids",
+            "ordered_items",
+        )
+
+
+class OrderTotalsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ("id", "status", "created_at", "items_count", "total_sum", "shop_ids")
+
+
+class OrderEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderEvent
+        fields = ("id", "from_status", "status", "created_at")
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    orders = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=10000
+    )
+    expected = serializers.ChoiceField(choices=Status.choices)
+    status = serializers.ChoiceField(choices=Status.choices)
+
+
+class BasketItemSerializer(serializers.Serializer):
+    product_info = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class BasketUpdateSerializer(serializers.Serializer):
+    items = BasketItemSerializer(many=True, allow_empty=False, max_length=1000)
+
+    def validate_items(self, value):
+        items = {}
+        for item in value:
+            items[item["product_info"]] = (
+                items.get(item["product_info"], 0) + item["quantity"]
+            )
+        return items
+
+
+class BasketRemoveSerializer(serializers.Serializer):
+    items = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    contact = serializers.IntegerField(required=False)
+    split = serializers.BooleanField(default=False)
+
+
+class ShopStateSerializer(serializers.Serializer):
+    state = serializers.BooleanField()
+
+
+class DashboardQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+    top = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    cursor = serializers.IntegerField(min_value=0, default=0)
+    topics = serializers.CharField(required=False)
+    wait = serializers.FloatField(min_value=0, default=0)
+
+    def validate_topics(self, value):
+        topics = tuple(dict.fromkeys(value.split(",")))
+        unknown = set(topics).difference(ChangeTopic.values)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Неизвестные типы изменений: {', '.join(sorted(unknown))}"
+            )
+        return topics
+
+    def validate_wait(self, value):
+        return min(value, settings.CHANGE_FEED_WAIT_MAX)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = (
+            "id",
+            "name",
+            "state",
+            "attempts",
+            "max_attempts",
+            "run_at",
+            "created_at",
+            "finished_at",
+            "result",
+            "last_error",
+        )
@@ -0,0 +1,264 @@
+from collections import defaultdict
+
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django_rest_passwordreset.signals import reset_password_token_created
+
+from backend.cache import (
+    CATALOG,
+    CATEGORIES,
+    SHOPS,
+    catalog_cache,
+    category_scope,
+    offer_scope,
+    product_scope,
+    shop_scope,
+)
+from backend.facets import refresh_product_facets
+from backend.models import (
+    Category,
+    ChangeLog,
+    Order,
+    Parameter,
+    Product,
+    ProductBestOffer,
+    ProductInfo,
+    ProductInfoQuerySet,
+    ProductParameter,
+    Shop,
+    ShopStock,
+)
+from backend.search import index_products
+from backend.tasks import queue_order_status_email, queue_password_reset_email
+from Py_Diplom_new.enums import ChangeTopic, Status
+
+
+def refresh_product_indexes(product_ids):
+    """
+    Обновляет индексы каталога (фасеты и поиск) для указанных продуктов
+    """
+    product_ids = list(product_ids)
+    refresh_product_facets(product_ids)
+    index_products(product_ids)
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_indexes(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        index_products(instance.products.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_record_indexes(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        refresh_product_indexes([instance.id])
+
+
+@receiver(post_save, sender=ProductInfo)
+def refresh_offer_indexes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_product_indexes([instance.product_id])
+
+
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def refresh_parameter_indexes(sender, instance, raw=False, **kwargs):
+    if not raw and instance.product_id:
+        refresh_product_indexes([instance.product_id])
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_shop_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog_cache.invalidate(shop_scope(instance.id), SHOPS, CATEGORIES, CATALOG)
+
+
+@receiver(post_save, sender=Shop)
+def sync_shop_availability(
+    sender, instance, created, raw=False, update_fields=None, **kwargs
+):
+    if raw or created:
+        return
+    if update_fields is None or "state" in update_fields:
+        changed = Shop.objects.filter(id=instance.id).sync_availability()
+        catalog_cache.invalidate(*map(product_scope, changed))
+
+
+def refresh_best_offers(product_ids):
+    changed = ProductBestOffer.objects.refresh(product_ids)
+    catalog_cache.invalidate(*map(product_scope, changed))
+
+
+@receiver(post_save, sender=ProductInfo)
+def refresh_offer_best_offer(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_best_offers([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def refresh_deleted_offer_best_offer(sender, instance, origin=None, **kwargs):
+    # удаление через QuerySet пересчитывает лучшие предложения само, а
+    # удаление магазина - одним пересчетом в refresh_shop_best_offers
+    if isinstance(origin, ProductInfo):
+        refresh_best_offers([instance.product_id])
+
+
+@receiver(pre_delete, sender=Shop)
+def remember_shop_products(sender, instance, **kwargs):
+    instance._offer_keys = list(instance.product_infos.values_list("id", "product_id"))
+
+
+@receiver(post_delete, sender=Shop)
+def refresh_shop_best_offers(sender, instance, **kwargs):
+    keys = getattr(instance, "_offer_keys", ())
+    refresh_best_offers(product_id for _, product_id in keys)
+    ChangeLog.objects.record(
+        ChangeTopic.offer, ((pk, instance.id) for pk, _ in keys), deleted=True
+    )
+
+
+@receiver(pre_save, sender=ProductInfo)
+def remember_offer_stock(sender, instance, raw=False, using=None, **kwargs):
+    instance._stock = None
+    if not raw and instance.pk:
+        instance._stock = (
+            ProductInfo.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list("shop_id", "quantity")
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductInfo)
+def update_offer_shop_stock(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    stock = defaultdict(int)
+    if getattr(instance, "_stock", None):
+        shop_id, quantity = instance._stock
+        stock[shop_id] -= quantity
+    stock[instance.shop_id] += instance.quantity
+    ShopStock.objects.using(using).add(stock)
+
+
+@receiver(post_delete, sender=ProductInfo)
+def update_deleted_offer_shop_stock(sender, instance, origin=None, **kwargs):
+    # удаление через QuerySet предложений вычитает остатки само, а строка
+    # остатка удаляемого магазина удаляется вместе с ним
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is not Shop and not isinstance(origin, ProductInfoQuerySet):
+        ShopStock.objects.add({instance.shop_id: -instance.quantity})
+
+
+@receiver(post_save, sender=ProductInfo)
+def log_offer_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ChangeLog.objects.record(ChangeTopic.offer, [(instance.id, instance.shop_id)])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def log_offer_delete(sender, instance, origin=None, **kwargs):
+    # массовые удаления пишут журнал сами
+    if isinstance(origin, ProductInfo):
+        ChangeLog.objects.record(
+            ChangeTopic.offer, [(instance.id, instance.shop_id)], deleted=True
+        )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog_cache.invalidate(category_scope(instance.id), CATEGORIES, CATALOG)
+
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def invalidate_category_shops_cache(sender, **kwargs):
+    if kwargs["action"].startswith("post_"):
+        catalog_cache.invalidate(CATEGORIES)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog_cache.invalidate(product_scope(instance.id), CATALOG)
+
+
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_delete, sender=ProductInfo)
+def invalidate_offer_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog_cache.invalidate(offer_scope(instance.id), CATALOG)
+
+
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def invalidate_parameter_cache(sender, instance, raw=False, **kwargs):
+    if not raw and instance.product_id:
+        catalog_cache.invalidate(product_scope(instance.product_id), CATALOG)
+
+
+@receiver(post_delete, sender=ProductInfo)
+def touch_offer_shop(sender, instance, origin=None, **kwargs):
+    # удаление через QuerySet обновляет версии магазинов одним запросом
+    if not isinstance(origin, ProductInfoQuerySet):
+        Shop.objects.filter(id=instance.shop_id).touch()
+
+
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def touch_parameter_product(sender, instance, raw=False, **kwargs):
+    if not raw and instance.product_id:
+        Product.objects.filter(id=instance.product_id).touch()
+
+
+@receiver(post_save, sender=Parameter)
+def touch_parameter_products(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        Product.objects.filter(products_info__parameter=instance).touch()
+
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def touch_category_shops(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        categories = Category.objects.filter(id=instance.id)
+    elif action == "pre_clear":
+        categories = Category.objects.filter(shops=instance)
+    else:
+        categories = Category.objects.filter(id__in=pk_set)
+    categories.touch()
+
+
+@receiver(post_save, sender=Order)
+def log_order_change(sender, instance, raw=False, **kwargs):
+    if not raw and instance.status != Status.basket:
+        ChangeLog.objects.record(
+            ChangeTopic.order,
+            [(instance.id, shop_id) for shop_id in instance.shop_ids or [None]],
+        )
+
+
+@receiver(post_save, sender=Order)
+def queue_order_status_notification(
+    sender, instance, raw=False, update_fields=None, **kwargs
+):
+    if raw or instance.status == Status.basket:
+        return
+    if update_fields is None or "status" in update_fields:
+        queue_order_status_email(instance)
+
+
+@receiver(reset_password_token_created)
+def queue_password_reset_notification(sender, reset_password_token, **kwargs):
+    queue_password_reset_email(reset_password_token)
@@ -0,0 +1,243 @@
+"""
+Сводки продаж магазинов для панели владельца.
+
+Панель читает только сводные таблицы: продажи по дням (``ShopDailySales``),
+продажи предложений (``ShopProductSales``), число заказов по статусам
+(``ShopStatusCount``) и остаток магазина (``ShopStock``), поэтому время
+ответа не зависит ни от длины истории заказов, ни от размера каталога
+магазина. Продажами считаются заказы в статусах ``SOLD_STATUSES`` по дате
+создания заказа.
+
+Сводки обновляются инкрементально в транзакции смены статуса заказа
+(``record_status_change``) постоянным числом запросов на пакет заказов:
+недостающие строки создаются нулевыми, затем каждая таблица обновляется
+одним UPDATE с приращениями (``backend.bulk``, на других СУБД - через
+``CASE``). Остаток магазина меняется приращением в транзакциях, которые
+меняют остатки предложений: оформление заказа, возврат на склад,
+``backend.stock``, импорт прайс-листа, сохранение и удаление предложений.
+Команда ``rebuild_shop_stats`` пересчитывает сводки целиком по позициям
+заказов и предложениям.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from backend.bulk import supports_update_from, update_from_values
+from backend.models import (
+    OrderItem,
+    ProductInfo,
+    ShopDailySales,
+    ShopProductSales,
+    ShopStatusCount,
+    ShopStock,
+)
+from Py_Diplom_new.enums import Status
+
+SOLD_STATUSES = frozenset(
+    (Status.new, Status.confirmed, Status.assembled, Status.sent, Status.delivered)
+)
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _increment(model, key_fields, deltas):
+    """
+    ``deltas`` - словарь ``{ключ: {поле: приращение}}``, ключ - значения
+    ``key_fields``
+    """
+    if not deltas:
+        return
+    keys = [dict(zip(key_fields, key)) for key in deltas]
+    model.objects.bulk_create([model(**key) for key in keys], ignore_conflicts=True)
+    fields = sorted({field for values in deltas.values() for field in values})
+    if supports_update_from():
+        update_from_values(
+            model,
+            key_fields,
+            fields,
+            [
+                (*key, *(values.get(field, 0) for field in fields))
+                for key, values in deltas.items()
+            ],
+            increment=True,
+        )
+        return
+    condition = Q()
+    for key in keys:
+        condition |= Q(**key)
+    model.objects.filter(condition).update(
+        **{
+            field: F(field)
+            + Case(
+                *[
+                    When(Q(**key), then=Value(values.get(field, 0)))
+                    for key, values in zip(keys, deltas.values())
+                ],
+                default=Value(0),
+            )
+            for field in fields
+        }
+    )
+
+
+def record_status_change(order_ids, old_status, new_status):
+    """
+    Обновляет сводки для заказов ``order_ids``, перешедших из статуса
+    ``old_status`` в ``new_status``
+    """
+    if old_status == new_status:
+        return
+    sign = (new_status in SOLD_STATUSES) - (old_status in SOLD_STATUSES)
+    lines = (
+        OrderItem.objects.filter(order_id__in=order_ids, product_info__isnull=False)
+        .order_by()
+        .values_list(
+            "order_id",
+            "product_info_id",
+            "product_info__shop_id",
+            "order__created_at",
+            "quantity",
+            "total_amount",
+        )
+    )
+    daily = defaultdict(lambda: defaultdict(int))
+    products = defaultdict(lambda: defaultdict(int))
+    shop_orders = defaultdict(set)
+    for order_id, info_id, shop_id, created_at, quantity, amount in lines:
+        shop_orders[shop_id].add(order_id)
+        if not sign:
+            continue
+        day = daily[(shop_id, timezone.localdate(created_at))]
+        day["items_sold"] += sign * quantity
+        day["revenue"] += sign * amount
+        day.setdefault("_orders", set()).add(order_id)
+        product = products[(info_id, shop_id)]
+        product["orders"] += sign
+        product["quantity"] += sign * quantity
+        product["revenue"] += sign * amount
+    for values in daily.values():
+        values["orders"] = sign * len(values.pop("_orders"))
+
+    statuses = {}
+    for shop_id, orders in shop_orders.items():
+        if old_status != Status.basket:
+            statuses[(shop_id, old_status)] = {"orders": -len(orders)}
+        if new_status != Status.basket:
+            statuses[(shop_id, new_status)] = {"orders": len(orders)}
+    _increment(ShopDailySales, ("shop_id", "date"), daily)
+    _increment(ShopProductSales, ("product_info_id", "shop_id"), products)
+    _increment(ShopStatusCount, ("shop_id", "status"), statuses)
+
+
+@transaction.atomic
+def rebuild_shop_stats(batch_size=REBUILD_BATCH_SIZE):
+    """
+    Полный пересчет сводок по позициям заказов и остатков магазинов по
+    предложениям
+    """
+    for model in (ShopDailySales, ShopProductSales, ShopStatusCount, ShopStock):
+        model.objects.all().delete()
+    ShopStock.objects.bulk_create(
+        (
+            ShopStock(shop_id=shop_id, quantity=total or 0)
+            for shop_id, total in ProductInfo.objects.order_by()
+            .values_list("shop_id")
+            .annotate(total=Sum("quantity"))
+        ),
+        batch_size=batch_size,
+    )
+    lines = OrderItem.objects.filter(product_info__isnull=False).order_by()
+    sold = lines.filter(order__status__in=SOLD_STATUSES)
+    daily = sold.values(
+        shop=F("product_info__shop_id"), date=TruncDate("order__created_at")
+    ).annotate(
+        orders=Count("order_id", distinct=True),
+        items_sold=Sum("quantity"),
+        revenue=Sum("total_amount"),
+    )
+    ShopDailySales.objects.bulk_create(
+        (ShopDailySales(shop_id=row.pop("shop"), **row) for row in daily),
+        batch_size=batch_size,
+    )
+    products = sold.values("product_info_id", shop=F("product_info__shop_id")).annotate(
+        orders=Count("order_id", distinct=True),
+        sold=Sum("quantity"),
+        revenue=Sum("total_amount"),
+    )
+    ShopProductSales.objects.bulk_create(
+        (
+            ShopProductSales(
+                product_info_id=row["product_info_id"],
+                shop_id=row["shop"],
+                orders=row["orders"],
+                quantity=row["sold"],
+                revenue=row["revenue"],
+            )
+            for row in products
+        ),
+        batch_size=batch_size,
+    )
+    statuses = (
+        lines.exclude(order__status=Status.basket)
+        .values(shop=F("product_info__shop_id"), state=F("order__status"))
+        .annotate(orders=Count("order_id", distinct=True))
+    )
+    ShopStatusCount.objects.bulk_create(
+        (
+            ShopStatusCount(
+                shop_id=row["shop"], status=row["state"], orders=row["orders"]
+            )
+            for row in statuses
+        ),
+        batch_size=batch_size,
+    )
+
+
+def shop_dashboard(shop, days=30, top=10):
+    """
+    Данные панели магазина: продажи за ``days`` дней, ``top`` предложений
+    по выручке за все время, заказы по статусам и оборачиваемость остатка
+    (продано за период / текущий остаток из ``ShopStock``)
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    daily = list(
+        ShopDailySales.objects.filter(shop=shop, date__gte=since)
+        .order_by("date")
+        .values("date", "orders", "items_sold", "revenue")
+    )
+    top_products = list(
+        ShopProductSales.objects.filter(shop=shop)
+        .order_by("-revenue")
+        .values(
+            "product_info_id",
+            "orders",
+            "quantity",
+            "revenue",
+            name=F("product_info__product__name"),
+            stock=F("product_info__quantity"),
+        )[:top]
+    )
+    statuses = dict(
+        ShopStatusCount.objects.filter(shop=shop, orders__gt=0).values_list(
+            "status", "orders"
+        )
+    )
+    stock = (
+        ShopStock.objects.filter(shop=shop).values_list("quantity", flat=True).first()
+    )
+    sold = sum(day["items_sold"] for day in daily)
+    return {
+        "days": days,
+        "revenue": sum(day["revenue"] for day in daily),
+        "orders": sum(day["orders"] for day in daily),
+        "items_sold": sold,
+        "daily": daily,
+        "top_products": top_products,
+        "statuses": statuses,
+        "stock": stock or 0,
+        "turnover": round(sold / stock, 4) if stock else None,
+    }
@@ -0,0 +1,302 @@
+"""
+Массовое обновление остатков и цен предложений магазина.
+
+Магазин присылает пакет строк: предложение задается своим ``id`` или
+``product`` (идентификатор продукта, он же ``id`` товара в выгрузке
+прайс-листа), и для него - новые ``quantity``, ``price`` и ``price_rrc``
+(любые из трех). Пакет применяется в одной транзакции частями по
+``CHUNK_SIZE`` строк: текущие значения части читаются одним запросом с
+блокировкой строк в порядке первичного ключа (как при оформлении заказа),
+после чего изменившиеся строки записываются одним
+``UPDATE ... FROM (VALUES ...)``, а цены в индексе фасетов - еще одним
+(на СУБД без ``UPDATE ... FROM`` - через ``bulk_update``), после чего
+пересчитываются лучшие предложения продуктов. Запись идет в обход
+сигналов, поэтому кеш каталога сбрасывается здесь же.
+
+У измененных строк сбрасывается отпечаток прайс-листа: следующий импорт
+сравнит их по значениям и вернет цены из файла.
+
+``change_prices`` меняет цены выбранных предложений на процент (действие
+админки) - по UPDATE на таблицу для каждой части, без чтения строк в Python.
+``restore_stock`` возвращает на склад товар отмененных заказов.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from backend.bulk import supports_update_from, update_from_values
+from backend.cache import CATALOG, catalog_cache, offer_scope, product_scope, shop_scope
+from backend.facets import update_facet_prices
+from backend.models import (
+    ChangeLog,
+    ProductBestOffer,
+    ProductFacet,
+    ProductInfo,
+    ShopStock,
+)
+from Py_Diplom_new.enums import ChangeTopic
+
+CHUNK_SIZE = 1000
+MAX_ROWS = 50000
+
+FIELDS = ("quantity", "price", "price_rrc")
+
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+
+
+class StockUpdateError(ValueError):
+    """
+    Некорректный пакет обновления; ``rows`` - ошибки по номерам строк
+    """
+
+    def __init__(self, message, rows=()):
+        self.rows = list(rows)
+        super().__init__(message)
+
+
+def _clean_row(row):
+    if not isinstance(row, dict):
+        raise ValueError("ожидается объект")
+    keys = [name for name in ("id", "product") if row.get(name) is not None]
+    if len(keys) != 1:
+        raise ValueError("нужно указать ровно одно из полей id и product")
+    cleaned = {}
+    for name in (keys[0], *FIELDS):
+        value = row.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"{name}: ожидается неотрицательное целое число")
+        cleaned[name] = value
+    if len(cleaned) == 1:
+        raise ValueError(f"нужно указать хотя бы одно из полей {', '.join(FIELDS)}")
+    return keys[0], cleaned
+
+
+def clean_rows(rows):
+    """
+    Проверяет пакет целиком до записи; возвращает строки
+    ``(номер, ключ, значения)``
+    """
+    if not isinstance(rows, list) or not rows:
+        raise StockUpdateError("Ожидается непустой список строк")
+    if len(rows) > MAX_ROWS:
+        raise StockUpdateError(f"Не больше {MAX_ROWS} строк за запрос")
+    cleaned = []
+    errors = []
+    seen = set()
+    for index, row in enumerate(rows):
+        try:
+            key, values = _clean_row(row)
+            if (key, values[key]) in seen:
+                raise ValueError("предложение уже указано в пакете")
+        except ValueError as exc:
+            errors.append({"index": index, "error": str(exc)})
+            continue
+        seen.add((key, values[key]))
+        cleaned.append((index, key, values))
+    if errors:
+        raise StockUpdateError("Некорректные строки пакета", errors)
+    return cleaned
+
+
+def _write(shop, offers, prices):
+    """
+    ``offers`` - новые значения ``FIELDS`` по ``id`` предложения,
+    ``prices`` - новые цены для индекса фасетов
+    """
+    if supports_update_from():
+        update_from_values(
+            ProductInfo,
+            ("id",),
+            FIELDS,
+            [(pk, *values) for pk, values in offers.items()],
+            fingerprint="",
+            updated_at=timezone.now(),
+        )
+        # bulk_update ниже пишет журнал через ProductInfoQuerySet.update
+        ChangeLog.objects.record(ChangeTopic.offer, ((pk, shop.id) for pk in offers))
+    else:
+        ProductInfo.objects.bulk_update(
+            [
+                ProductInfo(
+                    id=pk,
+                    fingerprint="",
+                    updated_at=timezone.now(),
+                    **dict(zip(FIELDS, values)),
+                )
+                for pk, values in offers.items()
+            ],
+            [*FIELDS, "fingerprint", "updated_at"],
+        )
+    update_facet_prices(prices)
+
+
+def _apply_chunk(shop, rows, seen):
+    ids = [values["id"] for _, key, values in rows if key == "id"]
+    product_ids = [values["product"] for _, key, values in rows if key == "product"]
+    current = list(
+        ProductInfo.objects.select_for_update(of=("self",))
+        .filter(Q(id__in=ids) | Q(product_id__in=product_ids), shop=shop)
+        .order_by("pk")
+        .values_list("id", "product_id", *FIELDS)
+    )
+    by_id = {row[0]: row for row in current}
+    by_product = {row[1]: row for row in current}
+    results = []
+    offers = {}
+    prices = {}
+    changed = {}
+    for index, key, values in rows:
+        row = (by_id if key == "id" else by_product).get(values[key])
+        if row is None:
+            results.append({key: values[key], "status": NOT_FOUND})
+            continue
+        pk, product_id = row[:2]
+        if pk in seen:
+            # одно предложение указано и по id, и по продукту
+            raise StockUpdateError(
+                "Некорректные строки пакета",
+                [{"index": index, "error": "предложение уже указано в пакете"}],
+            )
+        seen.add(pk)
+        old = dict(zip(FIELDS, row[2:]))
+        fields = [
+            name for name in FIELDS if name in values and values[name] != old[name]
+        ]
+        if fields:
+            offers[pk] = [values.get(name, old[name]) for name in FIELDS]
+            changed[pk] = product_id
+            if "price" in fields:
+                prices[pk] = values["price"]
+        results.append(
+            {
+                "id": pk,
+                "product": product_id,
+                "status": UPDATED if fields else UNCHANGED,
+                "fields": fields,
+            }
+        )
+    if offers:
+        _write(shop, offers, prices)
+        ShopStock.objects.add(
+            {shop.id: sum(offers[pk][0] - by_id[pk][2] for pk in offers)}
+        )
+        # лучшее предложение зависит только от цены и остатка
+        ProductBestOffer.objects.refresh(
+            product_id
+            for pk, product_id in changed.items()
+            if by_id[pk][2:4] != tuple(offers[pk][:2])
+        )
+    return results, changed
+
+
+def update_stock(shop, rows, chunk_size=CHUNK_SIZE):
+    """
+    Применяет пакет изменений остатков и цен магазина ``shop``; возвращает
+    результат по каждой строке в порядке пакета
+    """
+    rows = clean_rows(rows)
+    results = []
+    changed = {}
+    seen = set()
+    with transaction.atomic():
+        for start in range(0, len(rows), chunk_size):
+            chunk_results, chunk_changed = _apply_chunk(
+                shop, rows[start : start + chunk_size], seen
+            )
+            results.extend(chunk_results)
+            changed.update(chunk_changed)
+        if changed:
+            catalog_cache.invalidate(
+                shop_scope(shop.id),
+                CATALOG,
+                *map(offer_scope, changed),
+                *map(product_scope, set(changed.values())),
+            )
+    return results
+
+
+def change_prices(offers, percent, chunk_size=CHUNK_SIZE):
+    """
+    Меняет цены предложений ``offers`` на ``percent`` процентов (с
+    округлением вниз); возвращает число измененных предложений
+    """
+    keys = list(offers.order_by("pk").values_list("id", "shop_id", "product_id"))
+    ids = [pk for pk, _, _ in keys]
+    with transaction.atomic():
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start : start + chunk_size]
+            ProductInfo.objects.filter(id__in=chunk).update(
+                price=F("price") * (100 + percent) / 100, fingerprint=""
+            )
+            ProductFacet.objects.filter(product_info_id__in=chunk).update(
+                price=Subquery(
+                    ProductInfo.objects.filter(id=OuterRef("product_info_id")).values(
+                        "price"
+                    )
+                )
+            )
+        product_ids = {product_id for _, _, product_id in keys}
+        ProductBestOffer.objects.refresh(product_ids)
+        if keys:
+            catalog_cache.invalidate(
+                CATALOG,
+                *map(shop_scope, {shop_id for _, shop_id, _ in keys}),
+                *map(offer_scope, ids),
+                *map(product_scope, product_ids),
+            )
+    return len(ids)
+
+
+def restore_stock(quantities, chunk_size=CHUNK_SIZE):
+    """
+    Прибавляет к остаткам предложений количества ``{id предложения:
+    количество}`` одним UPDATE на часть и пересчитывает лучшие предложения
+    продуктов, у которых остаток появился
+    """
+    items = sorted(quantities.items())
+    raw = supports_update_from()
+    with transaction.atomic():
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start : start + chunk_size]
+            if raw:
+                update_from_values(
+                    ProductInfo,
+                    ("id",),
+                    ("quantity",),
+                    chunk,
+                    increment=True,
+                    updated_at=timezone.now(),
+                )
+            else:
+                ProductInfo.objects.filter(id__in=dict(chunk)).update(
+                    quantity=F("quantity")
+                    + Case(*[When(id=pk, then=Value(value)) for pk, value in chunk])
+                )
+        keys = list(
+            ProductInfo.objects.filter(id__in=quantities).values_list(
+                "id", "shop_id", "product_id"
+            )
+        )
+        if raw:
+            ChangeLog.objects.record(
+                ChangeTopic.offer, ((pk, shop_id) for pk, shop_id, _ in keys)
+            )
+        stock = defaultdict(int)
+        for pk, shop_id, _ in keys:
+            stock[shop_id] += quantities[pk]
+        ShopStock.objects.add(stock)
+        product_ids = {product_id for _, _, product_id in keys}
+        ProductBestOffer.objects.refresh(product_ids)
+        if keys:
+            catalog_cache.invalidate(
+                CATALOG,
+                *map(shop_scope, {shop_id for _, shop_id, _ in keys}),
+                *map(offer_scope, quantities),
+                *map(product_scope, product_ids),
+            )
@@ -0,0 +1,221 @@
+"""
+Генератор синтетического маркетплейса для нагрузочных замеров.
+
+Все строки вставляются пачками ``bulk_create``; генератор детерминирован
+при одинаковом ``seed``. После вставки перестраиваются индексы фасетов и
+поиска и остатки магазинов, которые ``bulk_create`` не обновляет
+сигналами.
+"""
+import random
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from backend.facets import rebuild_facets
+from backend.models import (
+    Category,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+    ShopStock,
+    User,
+)
+from backend.search import rebuild_search_index
+from Py_Diplom_new.enums import Status
+
+BATCH_SIZE = 2000
+
+_COLORS = ("черный", "белый", "синий", "красный", "серебристый", "золотой")
+_WORDS = ("Смартфон", "Ноутбук", "Планшет", "Наушники", "Часы", "Колонка")
+
+
+@dataclass
+class MarketplaceSize:
+    users: int = 100
+    shops: int = 10
+    categories: int = 20
+    products: int = 2000
+    parameters: int = 8
+    offers_per_product: int = 3
+    orders: int = 500
+    items_per_order: int = 5
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _ids(model, start):
+    return list(
+        model.objects.filter(id__gt=start).order_by("id").values_list("id", flat=True)
+    )
+
+
+def _last_id(model):
+    return model.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+@transaction.atomic
+def generate_marketplace(size, seed=0, batch_size=BATCH_SIZE, prefix="bench"):
+    """
+    Создает пользователей, магазины, категории, продукты с параметрами,
+    предложения магазинов и заказы; возвращает число созданных строк
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    counts = {}
+
+    start = _last_id(User)
+    password = make_password("bench")
+    User.objects.bulk_create(
+        [
+            User(
+                email=f"{prefix}{start + i}@example.com",
+                username=f"{prefix}{start + i}",
+                password=password,
+                is_active=True,
+            )
+            for i in range(size.users + size.shops)
+        ],
+        batch_size=batch_size,
+    )
+    user_ids = _ids(User, start)
+    owners, buyers = user_ids[: size.shops], user_ids[size.shops :]
+    counts["users"] = len(user_ids)
+
+    start = _last_id(Shop)
+    Shop.objects.bulk_create(
+        [
+            Shop(name=f"Магазин {i}", user_id=owner, state=rng.random() > 0.1)
+            for i, owner in enumerate(owners)
+        ],
+        batch_size=batch_size,
+    )
+    shop_ids = _ids(Shop, start)
+    counts["shops"] = len(shop_ids)
+
+    start = _last_id(Category)
+    Category.objects.bulk_create(
+        [Category(name=f"Кат {i}") for i in range(size.categories)],
+        batch_size=batch_size,
+    )
+    category_ids = _ids(Category, start)
+    Category.shops.through.objects.bulk_create(
+        [
+            Category.shops.through(category_id=category_id, shop_id=shop_id)
+            for category_id in category_ids
+            for shop_id in rng.sample(shop_ids, k=max(1, len(shop_ids) // 2))
+        ],
+        batch_size=batch_size,
+    )
+    counts["categories"] = len(category_ids)
+
+    start = _last_id(Parameter)
+    Parameter.objects.bulk_create(
+        [Parameter(name=f"Параметр {i}") for i in range(size.parameters)],
+        batch_size=batch_size,
+    )
+    parameter_ids = _ids(Parameter, start)
+
+    start = _last_id(Product)
+    Product.objects.bulk_create(
+        [
+            Product(
+                name=f"{rng.choice(_WORDS)} {i}", category_id=rng.choice(category_ids)
+            )
+            for i in range(size.products)
+        ],
+        batch_size=batch_size,
+    )
+    product_ids = _ids(Product, start)
+    counts["products"] = len(product_ids)
+
+    ProductParameter.objects.bulk_create(
+        [
+            ProductParameter(
+                product_id=product_id,
+                parameter_id=parameter_id,
+                value=rng.choice(_COLORS),
+            )
+            for product_id in product_ids
+            for parameter_id in rng.sample(
+                parameter_ids, k=rng.randint(1, len(parameter_ids))
+            )
+        ],
+        batch_size=batch_size,
+    )
+
+    open_shops = set(
+        Shop.objects.filter(id__in=shop_ids, state=True).values_list("id", flat=True)
+    )
+    start = _last_id(ProductInfo)
+    offers = []
+    for product_id in product_ids:
+        shops = rng.sample(shop_ids, k=min(size.offers_per_product, len(shop_ids)))
+        for shop_id in shops:
+            price = rng.randint(100, 200000)
+            offers.append(
+                ProductInfo(
+                    product_id=product_id,
+                    shop_id=shop_id,
+                    available=shop_id in open_shops,
+                    model=f"m-{product_id}-{shop_id}",
+                    quantity=rng.randint(0, 100),
+                    price=price,
+                    price_rrc=int(price * 1.1),
+                )
+            )
+    ProductInfo.objects.bulk_create(offers, batch_size=batch_size)
+    stock = defaultdict(int)
+    for offer in offers:
+        stock[offer.shop_id] += offer.quantity
+    ShopStock.objects.add(stock)
+    offer_ids = _ids(ProductInfo, start)
+    counts["offers"] = len(offer_ids)
+
+    start = _last_id(Order)
+    statuses = [choice for choice, _ in Status.choices if choice != Status.basket]
+    Order.objects.bulk_create(
+        [
+            Order(user_id=rng.choice(buyers), status=rng.choice(statuses))
+            for _ in range(size.orders)
+        ]
+        + [Order(user_id=user_id, status=Status.basket) for user_id in buyers],
+        batch_size=batch_size,
+    )
+    orders = list(Order.objects.filter(id__gt=start).only("id"))
+    # auto_now_add не дает задать дату при вставке
+    for order in orders:
+        order.created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+    Order.objects.bulk_update(orders, ["created_at"], batch_size=batch_size)
+    counts["orders"] = len(orders)
+
+    prices = dict(
+        ProductInfo.objects.filter(id__in=offer_ids).values_list("id", "price")
+    )
+    items = []
+    for order in orders:
+        for offer_id in rng.sample(
+            offer_ids, k=min(size.items_per_order, len(offer_ids))
+        ):
+            items.append(
+                OrderItem(
+                    order_id=order.id,
+                    product_info_id=offer_id,
+                    quantity=rng.randint(1, 5),
+                    price=prices[offer_id],
+                )
+            )
+    OrderItem.objects.bulk_create(items, batch_size=batch_size)
+    counts["order_items"] = len(items)
+
+    rebuild_facets()
+    rebuild_search_index()
+    return counts
@@ -0,0 +1,128 @@
+"""
+Обработчики фоновых задач: импорт прайс-листов и письма покупателям.
+"""
+from django.core.mail import send_mail
+from django_rest_passwordreset.models import ResetPasswordToken
+
+from backend.importer import PriceListError, detect_format, import_price_list
+from backend.jobs import JobError, enqueue, enqueue_many, handler
+from backend.models import Job, Order, Shop
+from Py_Diplom_new.enums import Status
+
+IMPORT_PRICE_LIST = "import_price_list"
+ORDER_STATUS_EMAIL = "order_status_email"
+PASSWORD_RESET_EMAIL = "password_reset_email"
+
+
+@handler(IMPORT_PRICE_LIST)
+def import_shop_price_list(payload):
+    shop = Shop.objects.filter(id=payload["shop_id"]).first()
+    if shop is None:
+        raise JobError("Магазин не найден")
+    path = payload.get("path")
+    try:
+        if path is None:
+            result = import_price_list(shop)
+        else:
+            with shop.filename.storage.open(path, "rb") as stream:
+                result = import_price_list(shop, stream, detect_format(path))
+    except PriceListError as exc:
+        raise JobError(str(exc)) from exc
+    if path is not None:
+        # загруженный файл становится текущим прайс-листом магазина
+        Shop.objects.filter(id=shop.id).update(filename=path)
+    # без идентификаторов продуктов: у большого магазина их сотни тысяч,
+    # а результат хранится в задаче и отдается через /jobs/
+    return result.as_dict(details=False)
+
+
+@handler(ORDER_STATUS_EMAIL)
+def send_order_status_email(payload):
+    order = Order.objects.select_related("user").filter(id=payload["order_id"]).first()
+    if order is None:
+        raise JobError("Заказ не найден")
+    status = Status(payload["status"])
+    send_mail(
+        f"Заказ №{order.id}: {status.label}",
+        f"Статус вашего заказа №{order.id} изменен: {status.label}.",
+        None,
+        [order.user.email],
+    )
+    return {"email": order.user.email}
+
+
+@handler(PASSWORD_RESET_EMAIL)
+def send_password_reset_email(payload):
+    token = (
+        ResetPasswordToken.objects.select_related("user")
+        .filter(pk=payload["token_id"])
+        .first()
+    )
+    if token is None:
+        # токен уже использован или удален как просроченный
+        return {"sent": False}
+    send_mail(
+        "Сброс пароля",
+        f"Токен для сброса пароля: {token.key}",
+        None,
+        [token.user.email],
+    )
+    return {"sent": True}
+
+
+def queue_price_list_import(shop, user=None, idempotency_key=None, upload=None):
+    """
+    Импорт прайс-листа магазина: загруженного файла ``upload`` или, без
+    него, текущего ``Shop.filename``. Файл сохраняется отдельно, и задача
+    получает его путь в параметрах; повтор с тем же ключом идемпотентности
+    возвращает прежнюю задачу, не сохраняя файл
+    """
+    if idempotency_key is not None:
+        idempotency_key = f"import:{shop.id}:{idempotency_key}"
+        job = Job.objects.filter(idempotency_key=idempotency_key).first()
+        if job is not None:
+            return job
+    payload = {"shop_id": shop.id}
+    if upload is not None:
+        storage = shop.filename.storage
+        payload["path"] = storage.save(
+            shop.filename.field.generate_filename(shop, upload.name), upload
+        )
+    job = enqueue(
+        IMPORT_PRICE_LIST, payload, user=user, idempotency_key=idempotency_key
+    )
+    if upload is not None and job.payload.get("path") != payload["path"]:
+        # параллельный запрос с тем же ключом успел поставить свою задачу
+        storage.delete(payload["path"])
+    return job
+
+
+def queue_order_status_email(order):
+    """
+    Письмо о смене статуса заказа: на каждый статус - не больше одного
+    """
+    return enqueue(
+        ORDER_STATUS_EMAIL,
+        {"order_id": order.id, "status": order.status},
+        idempotency_key=f"order-status:{order.id}:{order.status}",
+    )
+
+
+def queue_order_status_emails(order_ids, status):
+    """
+    Письма о смене статуса пакета заказов одним INSERT
+    """
+    enqueue_many(
+        ORDER_STATUS_EMAIL,
+        (
+            (
+                {"order_id": order_id, "status": status},
+                f"order-status:{order_id}:{status}",
+            )
+            for order_id in order_ids
+        ),
+    )
+
+
+def queue_password_reset_email(token):
+    return enqueue(PASSWORD_RESET_EMAIL, {"token_id": token.pk})
@@ -1,3 +1,1900 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.benchmark import (
+    HOT_PATH_INDEXES,
+    EndpointBenchmark,
+    benchmark_endpoints,
+    compare_reports,
+    percentile,
+)
+from backend.cache import catalog_cache, shop_scope
+from backend.changes import prune_changes, read_changes
+from backend.exporter import export_catalog
+from backend.importer import PriceListError, import_price_list
+from backend.jobs import claim, enqueue, handler, requeue_stale, run_pending
+from backend.metrics import fingerprint, registry
+from backend.models import (
+    Category,
+    ChangeLog,
+    ImportMark,
+    Job,
+    Parameter,
+    Product,
+    ProductBestOffer,
+    ProductInfo,
+    ProductFacet,
+    ProductParameter,
+    SearchDocument,
+    Shop,
+    ShopDailySales,
+    ShopProductSales,
+    ShopStatusCount,
+    ShopStock,
+    Order,
+    OrderEvent,
+    OrderItem,
+    User,
+)
+from backend.orders import InsufficientStock, OrderError, checkout, update_basket
+from backend.routers import PIN_COOKIE, PrimaryReplicaRouter
+from backend.search import get_search_backend
+from backend.stats import rebuild_shop_stats, record_status_change
+from backend.stock import update_stock
+from backend.throttling import LocalBucketStore, get_store
+from backend.transitions import TransitionError, transition
+from backend.synthetic import MarketplaceSize, generate_marketplace
+from Py_Diplom_new.enums import JobState, Status
+
+
+def create_catalog(size, shops=2):
+    user = User.objects.create_user(f"shop{Shop.objects.count()}@example.com", "pass")
+    category = Category.objects.create(name="Смартфоны")
+    parameter = Parameter.objects.create(name="Цвет")
+    shop_list = [
+        Shop.objects.create(name=f"Магазин {i}", user=user) for i in range(shops)
+    ]
+    infos = []
+    for i in range(size):
+        product = Product.objects.create(name=f"Смартфон {i}", category=category)
+        ProductParameter.objects.create(
+            product=product, parameter=parameter, value="черный"
+        )
+        infos.append(
+            ProductInfo.objects.create(
+                product=product,
+                shop=shop_list[i % shops],
+                model=f"model-{i}",
+                quantity=10,
+                price=1000 + i,
+                price_rrc=1200 + i,
+            )
+        )
+    return infos
+
+
+class ProductViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_page_query_count_does_not_depend_on_page_size(self):
+        create_catalog(30)
+        for page_size in (5, 30):
+            # два запроса страницы и один - версии каталога для ETag
+            with self.assertNumQueries(3):
+                response = self.client.get("/product/", {"page_size": page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_cursor_pagination_walks_whole_catalog(self):
+        infos = create_catalog(12)
+        seen = []
+        url = "/product/?page_size=5"
+        while url:
+            response = self.client.get(url)
+            seen.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, [info.id for info in infos])
+
+    def test_item_contains_related_data(self):
+        info = create_catalog(1)[0]
+        response = self.client.get(f"/product/{info.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["shop"]["name"], info.shop.name)
+        self.assertEqual(response.data["product"]["category"]["name"], "Смартфоны")
+        self.assertEqual(
+            response.data["product"]["parameters"],
+            [{"parameter": "Цвет", "value": "черный"}],
+        )
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.reset_stats()
+        self.client = APIClient()
+        self.info = create_catalog(3)[0]
+
+    def get_card(self):
+        return self.client.get(f"/product/{self.info.id}/").data
+
+    def warm_card(self):
+        # первый промах запоминает области карточки, второй кеширует ее
+        self.get_card()
+        self.get_card()
+
+    def test_card_is_served_from_cache(self):
+        self.warm_card()
+        # только запрос версии для ETag
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_card()["price"], self.info.price)
+        self.assertEqual(catalog_cache.stats()["hits"], 1)
+        self.assertEqual(catalog_cache.stats()["misses"], 2)
+
+    def test_shop_toggle_invalidates_card_and_lists(self):
+        self.get_card()
+        self.client.get("/shops/")
+        with self.captureOnCommitCallbacks(execute=True):
+            shop = Shop.objects.get(pk=self.info.shop_id)
+            shop.state = False
+            shop.save()
+        self.assertFalse(self.get_card()["shop"]["state"])
+        states = {item["id"]: item["state"] for item in self.client.get("/shops/").data}
+        self.assertFalse(states[shop.id])
+
+    def test_unrelated_change_keeps_card(self):
+        self.warm_card()
+        other = ProductInfo.objects.exclude(shop_id=self.info.shop_id).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            other.price += 1
+            other.save()
+        # только запрос версии для ETag
+        with self.assertNumQueries(1):
+            self.get_card()
+
+    def test_checkout_invalidates_cached_card(self):
+        self.warm_card()
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {self.info.id: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(buyer)
+        # остаток не кончился, но карточка и ее ETag уже другие
+        self.assertEqual(self.get_card()["quantity"], self.info.quantity - 1)
+
+    def test_invalidation_during_production_is_not_cached(self):
+        def produce(value):
+            def producer():
+                # инвалидация фиксируется, пока значение вычисляется
+                catalog_cache._bump([shop_scope(1)])
+                return value
+
+            return producer
+
+        for scopes in ([shop_scope(1)], lambda value: [shop_scope(1)]):
+            cache.clear()
+            catalog_cache.get_or_set("race", produce("old"), scopes)
+            catalog_cache.get_or_set("race", produce("old"), scopes)
+            self.assertEqual(
+                catalog_cache.get_or_set("race", lambda: "new", scopes), "new"
+            )
+
+    def test_import_invalidates_cached_card(self):
+        self.warm_card()
+        shop = self.info.shop
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(
+                shop,
+                io.StringIO(
+                    json.dumps(
+                        {
+                            "shop": shop.name,
+                            "categories": [{"id": 1, "name": "Смартфоны"}],
+                            "goods": [
+                                {
+                                    "id": self.info.product_id,
+                                    "category": 1,
+                                    "name": self.info.product.name,
+                                    "model": "model-0",
+                                    "price": 5,
+                                    "price_rrc": 6,
+                                    "quantity": 1,
+                                    "parameters": {"Цвет": "черный"},
+                                }
+                            ],
+                        }
+                    )
+                ),
+                fmt="json",
+            )
+        self.assertEqual(self.get_card()["price"], 5)
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.infos = create_catalog(4)
+
+    def assertChangesETag(self, url, change):
+        etag = self.client.get(url)["ETag"]
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_not_modified_before_serialization(self):
+        for url in ("/product/", f"/product/{self.infos[0].id}/", "/shops/"):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header("Last-Modified"))
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304)
+
+    def test_bulk_update_changes_etag(self):
+        def change():
+            for info in self.infos:
+                info.price += 1
+            ProductInfo.objects.bulk_update(self.infos, ["price"])
+
+        self.assertChangesETag("/product/", change)
+        self.assertChangesETag(f"/product/{self.infos[0].id}/", change)
+
+    def test_late_commit_changes_etag(self):
+        # долгая транзакция зафиксировала строку со временем записи раньше
+        # уже выданного максимума
+        written = timezone.now() - timedelta(hours=1)
+        self.assertChangesETag(
+            "/product/",
+            lambda: ProductInfo.objects.filter(id=self.infos[0].id).update(
+                quantity=1, updated_at=written
+            ),
+        )
+
+    def test_delete_changes_etag(self):
+        self.assertChangesETag(
+            "/product/",
+            lambda: ProductInfo.objects.filter(id=self.infos[-1].id).delete(),
+        )
+
+    def test_shop_toggle_changes_etag(self):
+        self.assertChangesETag(
+            "/shops/",
+            lambda: Shop.objects.filter(id=self.infos[0].shop_id).update(state=False),
+        )
+
+    def test_parameter_change_changes_card_etag(self):
+        self.assertChangesETag(
+            f"/product/{self.infos[1].id}/",
+            lambda: ProductParameter.objects.filter(product_id=self.infos[1].product_id)
+            .first()
+            .save(),
+        )
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = APIClient()
+        create_catalog(3)
+
+    def test_server_timing_header(self):
+        response = self.client.get("/product/")
+        timing = dict(
+            item.strip().split(";", 1) for item in response["Server-Timing"].split(",")
+        )
+        self.assertEqual(set(timing), {"db", "view", "serialize", "total"})
+        self.assertIn('desc="queries=3 duplicated=0"', timing["db"])
+
+    def test_fingerprint_collapses_parameters(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM "t" WHERE "id" IN (%s, %s) LIMIT 21'),
+            fingerprint('SELECT 1 FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 5'),
+        )
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint(self):
+        self.client.get("/product/")
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn(
+            'http_request_db_queries_bucket{method="GET",route="product/",le="3"} 1',
+            text,
+        )
+        self.assertIn("catalog_cache_misses_total", text)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_only_counted(self):
+        response = self.client.get("/product/")
+        self.assertFalse(response.has_header("Server-Timing"))
+        text = registry.render()
+        self.assertIn(
+            'http_requests_total{method="GET",route="product/",status="200"} 1', text
+        )
+        self.assertNotIn("http_request_db_queries_bucket", text)
+
+
+class ProductFilterViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.infos = create_catalog(6)
+        diagonal = Parameter.objects.create(name="Диагональ")
+        for info in self.infos[:2]:
+            ProductParameter.objects.create(
+                product=info.product, parameter=diagonal, value="6.5"
+            )
+
+    def test_filter_by_parameter_value(self):
+        response = self.client.get(
+            "/product/filter/", {"param": "Диагональ:6.5", "price_max": 1000}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [self.infos[0].id]
+        )
+
+    def test_facet_counts_follow_index_updates(self):
+        ProductInfo.objects.filter(pk=self.infos[1].pk).delete()
+        response = self.client.get("/product/filter/", {"param": "Цвет:черный"})
+        facets = response.data["facets"]
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(facets["price"], {"min": 1000, "max": 1005})
+        self.assertEqual(sorted(item["count"] for item in facets["shops"]), [2, 3])
+        values = {item["name"]: item["values"] for item in facets["parameters"]}
+        self.assertEqual(values["Диагональ"], [{"value": "6.5", "count": 1}])
+
+    def test_invalid_parameter_filter(self):
+        response = self.client.get("/product/filter/", {"param": "Диагональ"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        get_search_backend().reset()
+        self.client = APIClient()
+        self.infos = create_catalog(3)
+        phone = self.infos[1].product
+        phone.name = "Смартфон Apple iPhone XR"
+        phone.save()
+
+    def test_ranked_typo_tolerant_search(self):
+        response = self.client.get("/search/", {"q": "iphnoe xr"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["id"], self.infos[1].id)
+
+    def test_index_follows_changes(self):
+        self.client.get("/search/", {"q": "смартфон"})
+        parameter = ProductParameter.objects.get(product=self.infos[0].product)
+        parameter.value = "белый"
+        parameter.save()
+        self.infos[2].delete()
+        response = self.client.get("/search/", {"q": "черный"})
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]],
+            [self.infos[1].id],
+        )
+
+    def test_unavailable_offers_do_not_shorten_results(self):
+        closed = self.infos[0].shop
+        Shop.objects.filter(pk=closed.pk).update(state=False)
+        response = self.client.get("/search/", {"q": "смартфон", "limit": 1})
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [self.infos[1].id]
+        )
+
+    @override_settings(SEARCH_INDEX_TTL=0)
+    def test_index_is_rebuilt_after_ttl(self):
+        self.client.get("/search/", {"q": "смартфон"})
+        # изменение другого процесса: мимо индекса в памяти этого процесса
+        SearchDocument.objects.filter(product_info=self.infos[0]).update(name="Планшет")
+        response = self.client.get("/search/", {"q": "планшет"})
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [self.infos[0].id]
+        )
+
+
+class BasketViewTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(2)
+        self.user = User.objects.create_user("buyer@example.com", "pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_add_update_and_remove_items(self):
+        first, second = self.infos
+        items = [{"product_info": first.id, "quantity": 2}]
+        self.client.post("/basket/", {"items": items}, format="json")
+        items.append({"product_info": second.id, "quantity": 1})
+        response = self.client.post("/basket/", {"items": items}, format="json")
+        quantities = {
+            item["product_info"]: (item["quantity"], item["total_amount"])
+            for item in response.data["ordered_items"]
+        }
+        self.assertEqual(
+            quantities,
+            {first.id: (4, first.price * 4), second.id: (1, second.price)},
+        )
+        response = self.client.put(
+            "/basket/",
+            {"items": [{"product_info": first.id, "quantity": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.data["ordered_items"][0]["quantity"], 1)
+        response = self.client.delete("/basket/", {"items": [first.id]}, format="json")
+        self.assertEqual(
+            [item["product_info"] for item in response.data["ordered_items"]],
+            [second.id],
+        )
+
+    def test_checkout_reserves_stock(self):
+        info = self.infos[0]
+        update_basket(self.user, {info.id: 3})
+        response = self.client.post("/basket/checkout/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], Status.new)
+        info.refresh_from_db()
+        self.assertEqual(info.quantity, 7)
+        update_basket(self.user, {info.id: 8})
+        response = self.client.post("/basket/checkout/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["product_infos"], [info.id])
+
+    def test_checkout_rejects_disabled_shop(self):
+        update_basket(self.user, {self.infos[0].id: 1})
+        Shop.objects.filter(pk=self.infos[0].shop_id).update(state=False)
+        response = self.client.post("/basket/checkout/")
+        self.assertEqual(response.status_code, 400)
+
+
+class ShopAvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_search_backend().reset()
+        self.infos = create_catalog(4)
+        self.shop = self.infos[0].shop
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop.user)
+
+    def catalog_ids(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return {item["id"] for item in response.data["results"]}
+
+    def test_toggle_hides_offers_without_per_offer_work(self):
+        open_ids = {self.infos[1].id, self.infos[3].id}
+        self.catalog_ids("/product/")
+        # магазин, его UPDATE, состояния магазинов, продукты и по UPDATE на
+        # три таблицы, журнал изменений, пересчет лучших предложений пакетом
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(12):
+            response = self.client.patch(
+                f"/shop/{self.shop.id}/state/", {"state": False}, format="json"
+            )
+        self.assertFalse(response.data["state"])
+        self.assertEqual(
+            set(
+                ProductFacet.objects.filter(available=False).values_list(
+                    "shop_id", flat=True
+                )
+            ),
+            {self.shop.id},
+        )
+        self.assertEqual(self.catalog_ids("/product/"), open_ids)
+        self.assertEqual(self.catalog_ids("/product/filter/"), open_ids)
+        self.assertEqual(self.catalog_ids("/search/", q="смартфон"), open_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f"/shop/{self.shop.id}/state/", {"state": True}, format="json"
+            )
+        self.assertEqual(len(self.catalog_ids("/product/")), 4)
+        self.assertFalse(ProductInfo.objects.filter(available=False).exists())
+
+    def test_split_checkout_keeps_unavailable_items_in_basket(self):
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        closed, open_ = self.infos[0], self.infos[1]
+        update_basket(buyer, {closed.id: 1, open_.id: 2})
+        Shop.objects.filter(id=self.shop.id).update(state=False)
+        with self.assertRaises(OrderError):
+            checkout(buyer)
+
+        order = checkout(buyer, split=True)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Status.new)
+        self.assertEqual(order.total_sum, open_.price * 2)
+        basket = Order.objects.get(user=buyer, status=Status.basket)
+        self.assertEqual(basket.total_sum, closed.price)
+        self.assertEqual(
+            list(basket.ordered_items.values_list("product_info_id", flat=True)),
+            [closed.id],
+        )
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    databases = "__all__"
+    buyers = 12
+    stock = 5
+
+    def setUp(self):
+        # в общей памяти SQLite блокирует таблицы без ожидания
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("нужна файловая база SQLite или PostgreSQL")
+
+    def test_concurrent_checkouts_never_oversell(self):
+        info = create_catalog(1, shops=1)[0]
+        ProductInfo.objects.filter(pk=info.pk).update(quantity=self.stock)
+        users = [
+            User.objects.create_user(f"buyer{i}@example.com", "pass")
+            for i in range(self.buyers)
+        ]
+        for user in users:
+            update_basket(user, {info.id: 1})
+        barrier = threading.Barrier(self.buyers)
+        results = []
+
+        def buy(user):
+            try:
+                barrier.wait()
+                checkout(user)
+                results.append("ok")
+            except InsufficientStock:
+                results.append("short")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        info.refresh_from_db()
+        self.assertEqual(info.quantity, 0)
+        self.assertEqual(results.count("ok"), self.stock)
+        self.assertEqual(results.count("short"), self.buyers - self.stock)
+        self.assertEqual(Order.objects.filter(status=Status.new).count(), self.stock)
+
+
+@skipUnless(connection.vendor == "postgresql", "нужны параллельные записи PostgreSQL")
+class ConcurrentChangeFeedTests(TransactionTestCase):
+    def test_slow_writer_committing_after_fast_one_is_delivered(self):
+        slow, fast = create_catalog(2, shops=1)
+        ChangeLog.objects.sequence()
+        cursor = ChangeLog.objects.latest("seq").seq
+        recorded = threading.Event()
+        release = threading.Event()
+
+        def write_slowly():
+            try:
+                with transaction.atomic():
+                    ChangeLog.objects.record("offer", [(slow.id, slow.shop_id)])
+                    recorded.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=write_slowly)
+        writer.start()
+        recorded.wait(10)
+        ChangeLog.objects.record("offer", [(fast.id, fast.shop_id)])
+        ChangeLog.objects.sequence()
+        cursor, changes = read_changes(cursor)
+        self.assertEqual([change["object_id"] for change in changes], [fast.id])
+        release.set()
+        writer.join()
+        ChangeLog.objects.sequence()
+        cursor, changes = read_changes(cursor)
+        self.assertEqual([change["object_id"] for change in changes], [slow.id])
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    def setUp(self):
+        # поток продления пишет через свое соединение
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("нужна файловая база SQLite или PostgreSQL")
+
+    @override_settings(JOBS_HEARTBEAT_INTERVAL=0.05)
+    def test_long_job_keeps_its_lock(self):
+        job = enqueue("tests.slow")
+        Job.objects.filter(id=job.id).update(payload={"job": job.id})
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.result), (JobState.done, {"requeued": 0}))
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.infos = create_catalog(2)
+        self.user = User.objects.create_user("replica@example.com", "pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = getattr(self.client, method)(url, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_catalog_reads_go_to_replica(self):
+        response, primary, replica = self.queries("get", "/product/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertGreater(replica, 0)
+        self.assertEqual(primary, 0)
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Order), "default")
+        with transaction.atomic():
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(Shop), "default")
+        self.assertFalse(PrimaryReplicaRouter().allow_migrate("replica", "backend"))
+
+    def test_user_is_pinned_to_primary_after_write(self):
+        items = {"items": [{"product_info": self.infos[0].id, "quantity": 1}]}
+        response, primary, replica = self.queries(
+            "post", "/basket/", data=items, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        cache.clear()
+        response, primary, replica = self.queries("get", "/product/")
+        self.assertEqual((replica, response.status_code), (0, 200))
+        del self.client.cookies[PIN_COOKIE]
+        cache.clear()
+        response, primary, replica = self.queries("get", "/product/")
+        self.assertGreater(replica, 0)
+
+    def test_health_checks_every_alias(self):
+        response = self.client.get("/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["databases"], {"default": "ok", "replica": "ok"})
+
+
+class OrderItemBulkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("b2b@example.com", "pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_lines_are_created_in_fixed_number_of_queries(self):
+        infos = create_catalog(500, shops=5)
+        lines = [{"product_info": info.id, "quantity": 2} for info in infos]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/basket/lines/", {"items": lines}, format="json"
+            )
+        # SQLite режет многострочный INSERT по лимиту параметров запроса
+        self.assertLessEqual(len(queries), 13)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["items_count"], 500)
+        self.assertEqual(
+            response.data["total_sum"], sum(info.price * 2 for info in infos)
+        )
+
+    def test_queryset_updates_keep_totals(self):
+        info = create_catalog(1)[0]
+        basket = update_basket(self.user, {info.id: 3})
+        items = basket.ordered_items.all()
+        items.update(quantity=F("quantity") + 1)
+        self.assertEqual(items.get().total_amount, info.price * 4)
+        items.update(price=10)
+        self.assertEqual(items.get().total_amount, 40)
+        item = items.get()
+        item.price, item.quantity = 7, 5
+        OrderItem.objects.bulk_update([item], ["price", "quantity"])
+        self.assertEqual(items.get().total_amount, 35)
+
+
+class OrderHistoryViewTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(3)
+        self.user = User.objects.create_user("history@example.com", "pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_totals_follow_item_changes(self):
+        first, second, third = self.infos
+        basket = update_basket(self.user, {first.id: 2, second.id: 1})
+        basket.refresh_from_db()
+        self.assertEqual(basket.items_count, 2)
+        self.assertEqual(basket.total_sum, first.price * 2 + second.price)
+        self.assertEqual(basket.shop_ids, sorted({first.shop_id, second.shop_id}))
+        basket.ordered_items.filter(product_info=first).delete()
+        OrderItem.objects.create(order=basket, product_info=third, price=5)
+        basket.refresh_from_db()
+        self.assertEqual(basket.items_count, 2)
+        self.assertEqual(basket.total_sum, second.price + 5)
+
+    def test_history_is_one_query(self):
+        update_basket(self.user, {self.infos[0].id: 1})
+        checkout(self.user)
+        update_basket(self.user, {self.infos[1].id: 1})
+        with self.assertNumQueries(1):
+            response = self.client.get("/orders/")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["total_sum"], self.infos[0].price)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.infos = create_catalog(5)
+        self.user = User.objects.create_user(
+            "async@example.com", "pass", is_active=True
+        )
+
+    def test_keyset_pages_match_catalog(self):
+        response = self.client.get("/async/product/?page_size=3")
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        self.assertEqual(
+            [offer["id"] for offer in first["results"]],
+            [info.id for info in self.infos[:3]],
+        )
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(
+            [offer["id"] for offer in second["results"]],
+            [info.id for info in self.infos[3:]],
+        )
+        self.assertIsNone(second["next"])
+
+    def test_card_matches_sync_view_and_revalidates(self):
+        url = f"/product/{self.infos[0].id}/"
+        response = self.client.get(f"/async{url}")
+        self.assertEqual(response.json(), json.loads(self.client.get(url).content))
+        response = self.client.get(f"/async{url}", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get("/async/product/0/").status_code, 404)
+        self.assertEqual(self.client.post(f"/async{url}").status_code, 405)
+
+    def test_order_status(self):
+        update_basket(self.user, {self.infos[0].id: 2})
+        order = checkout(self.user)
+        url = f"/async/orders/{order.id}/"
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        data = self.client.get(url).json()
+        self.assertEqual(data["status"], order.status)
+        self.assertEqual(data["items_count"], 1)
+        self.assertEqual(
+            data, json.loads(self.client.get(f"/orders/{order.id}/").content)
+        )
+        basket = update_basket(self.user, {self.infos[1].id: 1})
+        self.assertEqual(
+            self.client.get(f"/async/orders/{basket.id}/").status_code, 404
+        )
+
+
+@handler("tests.flaky")
+def flaky_job(payload):
+    raise RuntimeError("boom")
+
+
+@handler("tests.stolen")
+def stolen_job(payload):
+    # блокировка истекла, и задачу забрал другой воркер
+    Job.objects.filter(id=payload["job"]).update(locked_by="worker-2")
+    return {"ok": True}
+
+
+@handler("tests.slow")
+def slow_job(payload):
+    # блокировка устарела бы, если бы ее не продлевали
+    stale = timezone.now() - timedelta(hours=1)
+    Job.objects.filter(id=payload["job"]).update(locked_at=stale)
+    for _ in range(100):
+        if Job.objects.get(id=payload["job"]).locked_at > stale:
+            break
+        time.sleep(0.05)
+    return {"requeued": requeue_stale(timeout=60)}
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(2)
+        self.owner = self.infos[0].shop.user
+        self.client = APIClient()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    @override_settings(JOBS_MAX_ATTEMPTS=2)
+    def test_retry_with_backoff_then_fail(self):
+        job = enqueue("tests.flaky")
+        with self.assertLogs("backend.jobs", "WARNING"):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (JobState.queued, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn("boom", job.last_error)
+        # повтор откладывается до run_at
+        self.assertEqual(run_pending(), 0)
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        with self.assertLogs("backend.jobs", "ERROR"):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (JobState.failed, 2))
+
+    def test_idempotency_key_and_stale_jobs(self):
+        job = enqueue("tests.flaky", idempotency_key="once")
+        self.assertEqual(enqueue("tests.flaky", idempotency_key="once"), job)
+        self.assertEqual(claim("worker-1"), [job])
+        self.assertEqual(claim("worker-2"), [])
+        Job.objects.filter(id=job.id).update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale(timeout=60), 1)
+        self.assertEqual(Job.objects.get(id=job.id).state, JobState.queued)
+
+    def test_worker_that_lost_lock_does_not_overwrite_job(self):
+        job = enqueue("tests.stolen")
+        Job.objects.filter(id=job.id).update(payload={"job": job.id})
+        with self.assertLogs("backend.jobs", "WARNING"):
+            self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.state, job.locked_by, job.result),
+            (JobState.running, "worker-2", None),
+        )
+
+    def test_import_runs_in_worker(self):
+        shop = self.infos[0].shop
+        price_list = {
+            "shop": shop.name,
+            "categories": [{"id": 1, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": 77,
+                    "category": 1,
+                    "name": "Смартфон 77",
+                    "model": "model-77",
+                    "price": 10,
+                    "price_rrc": 12,
+                    "quantity": 3,
+                    "parameters": {"Цвет": "белый"},
+                }
+            ],
+        }
+        url = f"/shop/{shop.id}/import/"
+        self.client.force_authenticate(self.owner)
+
+        def post():
+            upload = io.BytesIO(json.dumps(price_list).encode())
+            upload.name = "price.json"
+            return self.client.post(
+                url, {"file": upload}, format="multipart", HTTP_IDEMPOTENCY_KEY="k1"
+            )
+
+        response = post()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(post().data["id"], response.data["id"])
+        self.assertFalse(Product.objects.filter(name="Смартфон 77").exists())
+
+        self.assertEqual(run_pending(), 1)
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["state"], JobState.done)
+        self.assertEqual(job["result"]["created"], 1)
+        self.assertNotIn("added", job["result"])
+        self.assertTrue(Product.objects.filter(name="Смартфон 77").exists())
+        self.client.force_authenticate(User.objects.create_user("x@example.com"))
+        self.assertEqual(self.client.get(response["Location"]).status_code, 404)
+
+    def test_upload_is_bound_to_its_job(self):
+        shop = self.infos[0].shop
+        url = f"/shop/{shop.id}/import/"
+        self.client.force_authenticate(self.owner)
+
+        def post(good, key):
+            upload = io.BytesIO(price_list(shop, {good: {}}).getvalue().encode())
+            upload.name = "price.json"
+            return self.client.post(
+                url, {"file": upload}, format="multipart", HTTP_IDEMPOTENCY_KEY=key
+            ).data["id"]
+
+        first = post(77, "k1")
+        # повтор с тем же ключом не подменяет файл поставленной задачи
+        self.assertEqual(post(78, "k1"), first)
+        second = post(78, "k2")
+        shop.refresh_from_db()
+        self.assertFalse(shop.filename)
+
+        self.assertEqual(run_pending(), 2)
+        results = {
+            job.id: job.result for job in Job.objects.filter(id__in=[first, second])
+        }
+        self.assertEqual(results[first]["created"], 1)
+        # вторая задача заменила товар 77 первого файла товаром 78
+        self.assertEqual(
+            (results[second]["created"], results[second]["deleted"]), (1, 1)
+        )
+        self.assertEqual(
+            list(
+                ProductInfo.objects.filter(shop=shop).values_list(
+                    "product__name", flat=True
+                )
+            ),
+            ["Смартфон 78"],
+        )
+        shop.refresh_from_db()
+        self.assertEqual(shop.filename.name, Job.objects.get(id=second).payload["path"])
+
+    def test_notification_mail_is_sent_by_worker(self):
+        user = User.objects.create_user("buyer@example.com", "pass", is_active=True)
+        update_basket(user, {self.infos[0].id: 1})
+        order = checkout(user)
+        response = self.client.post(
+            "/user/password_reset/", {"email": user.email}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(run_pending(), 2)
+        subjects = sorted(message.subject for message in mail.outbox)
+        self.assertEqual(subjects, [f"Заказ №{order.id}: Новый", "Сброс пароля"])
+        token = user.password_reset_tokens.get()
+        self.assertIn(token.key, mail.outbox[1].body + mail.outbox[0].body)
+
+
+def price_list(shop, goods):
+    return io.StringIO(
+        json.dumps(
+            {
+                "shop": shop.name,
+                "categories": [{"id": 1, "name": "Смартфоны"}],
+                "goods": [
+                    {
+                        "id": i,
+                        "category": 1,
+                        "name": f"Смартфон {i}",
+                        "model": f"model-{i}",
+                        "price": 1000 + i,
+                        "price_rrc": 1200 + i,
+                        "quantity": 10,
+                        "parameters": {"Цвет": "черный"},
+                        **good,
+                    }
+                    for i, good in goods.items()
+                ],
+            }
+        )
+    )
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("shop@example.com", "pass")
+        self.shop = Shop.objects.create(name="Связной", user=user)
+
+    def offers(self):
+        return dict(
+            ProductInfo.objects.filter(shop=self.shop).values_list(
+                "product__name", "quantity"
+            )
+        )
+
+    def test_import_creates_offers_in_batches(self):
+        result = import_price_list(
+            self.shop, price_list(self.shop, {i: {} for i in range(5)}), "json", 2
+        )
+        self.assertEqual((result.created, result.batches), (5, 3))
+        self.assertEqual(len(self.offers()), 5)
+        self.assertEqual(ProductParameter.objects.filter(value="черный").count(), 5)
+
+    def test_reimport_rewrites_only_changed_rows(self):
+        import_price_list(
+            self.shop, price_list(self.shop, {0: {}, 1: {}, 2: {}}), "json"
+        )
+        products = dict(Product.objects.values_list("name", "id"))
+        cursor = ChangeLog.objects.latest("id").id
+        result = import_price_list(
+            self.shop,
+            price_list(
+                self.shop,
+                {
+                    0: {},
+                    1: {"price": 900},
+                    3: {"parameters": {"Цвет": "белый"}},
+                },
+            ),
+            "json",
+        )
+        self.assertEqual(
+            (result.created, result.updated, result.unchanged, result.deleted),
+            (1, 1, 1, 1),
+        )
+        self.assertEqual(result.added, [Product.objects.get(name="Смартфон 3").id])
+        self.assertEqual(result.changed, [products["Смартфон 1"]])
+        self.assertEqual(result.removed, [products["Смартфон 2"]])
+        self.assertEqual(result.changed_fields, {"price": 1})
+        # неизменившаяся строка не перезаписана: в журнале ее нет
+        unchanged = ProductInfo.objects.get(product_id=products["Смартфон 0"])
+        self.assertFalse(
+            ChangeLog.objects.filter(id__gt=cursor, object_id=unchanged.id).exists()
+        )
+        # изменились только параметры
+        result = import_price_list(
+            self.shop,
+            price_list(
+                self.shop,
+                {
+                    0: {"parameters": {"Цвет": "белый"}},
+                    1: {"price": 900},
+                    3: {"parameters": {"Цвет": "белый"}},
+                },
+            ),
+            "json",
+        )
+        self.assertEqual((result.updated, result.unchanged), (1, 2))
+        self.assertEqual(result.changed, [products["Смартфон 0"]])
+        self.assertEqual(result.changed_fields, {"parameters": 1})
+        self.assertEqual(
+            ProductParameter.objects.get(product_id=products["Смартфон 0"]).value,
+            "белый",
+        )
+
+    def test_price_and_stock_changes_keep_search_and_facet_rows(self):
+        import_price_list(self.shop, price_list(self.shop, {0: {}, 1: {}}), "json")
+        # перестроенный документ потерял бы отметку
+        SearchDocument.objects.update(parameters="отметка")
+        facets = set(ProductFacet.objects.values_list("id", flat=True))
+        products = dict(Product.objects.values_list("name", "id"))
+        result = import_price_list(
+            self.shop,
+            price_list(self.shop, {0: {"price": 500}, 1: {"quantity": 0}}),
+            "json",
+        )
+        self.assertEqual(result.changed_fields, {"price": 1, "quantity": 1})
+        # строки индексов не перестроены, цена в фасетах обновлена на месте
+        self.assertEqual(
+            set(SearchDocument.objects.values_list("parameters", flat=True)),
+            {"отметка"},
+        )
+        self.assertEqual(set(ProductFacet.objects.values_list("id", flat=True)), facets)
+        self.assertEqual(
+            set(
+                ProductFacet.objects.filter(
+                    product_id=products["Смартфон 0"]
+                ).values_list("price", flat=True)
+            ),
+            {500},
+        )
+        self.assertEqual(
+            ProductBestOffer.objects.get(product_id=products["Смартфон 0"]).price, 500
+        )
+        self.assertFalse(
+            ProductBestOffer.objects.filter(product_id=products["Смартфон 1"]).exists()
+        )
+        # новая модель меняет только поисковые документы
+        import_price_list(
+            self.shop,
+            price_list(
+                self.shop, {0: {"price": 500, "model": "x"}, 1: {"quantity": 0}}
+            ),
+            "json",
+        )
+        self.assertEqual(set(ProductFacet.objects.values_list("id", flat=True)), facets)
+        self.assertEqual(
+            SearchDocument.objects.get(product_id=products["Смартфон 0"]).model, "x"
+        )
+
+    def test_missing_offers_with_orders_are_retired(self):
+        import_price_list(
+            self.shop, price_list(self.shop, {0: {}, 1: {}, 2: {}}), "json"
+        )
+        ordered = ProductInfo.objects.get(shop=self.shop, product__name="Смартфон 0")
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {ordered.id: 4})
+        order = checkout(buyer)
+        result = import_price_list(self.shop, price_list(self.shop, {2: {}}), "json")
+        # позиция заказа и сводка продаж остались, предложение снято с продажи
+        self.assertEqual((result.deleted, result.retired), (1, 1))
+        self.assertEqual(
+            sorted(result.removed),
+            sorted([ordered.product_id, Product.objects.get(name="Смартфон 1").id]),
+        )
+        self.assertEqual(self.offers(), {"Смартфон 0": 0, "Смартфон 2": 10})
+        order.refresh_from_db()
+        self.assertEqual((order.items_count, order.total_sum), (1, 4 * 1000))
+        self.assertTrue(ShopProductSales.objects.filter(product_info=ordered).exists())
+        self.assertFalse(
+            ProductBestOffer.objects.filter(product_id=ordered.product_id).exists()
+        )
+        # повторный импорт не трогает уже снятые предложения
+        result = import_price_list(self.shop, price_list(self.shop, {2: {}}), "json")
+        self.assertEqual((result.deleted, result.retired, result.removed), (0, 0, []))
+        # вернувшийся в прайс-лист товар снова продается
+        import_price_list(self.shop, price_list(self.shop, {0: {}, 2: {}}), "json")
+        self.assertEqual(self.offers(), {"Смартфон 0": 10, "Смартфон 2": 10})
+
+    def test_missing_offers_are_found_in_batches(self):
+        import_price_list(
+            self.shop, price_list(self.shop, {i: {} for i in range(7)}), "json", 2
+        )
+        with mock.patch("backend.importer.REPORT_LIMIT", 2):
+            result = import_price_list(
+                self.shop, price_list(self.shop, {0: {}, 6: {}}), "json", 2
+            )
+        self.assertEqual((result.deleted, result.unchanged), (5, 2))
+        # отчет ограничен, счетчики - нет
+        self.assertEqual(len(result.removed), 2)
+        self.assertEqual(self.offers(), {"Смартфон 0": 10, "Смартфон 6": 10})
+        self.assertEqual(ShopStock.objects.get(shop=self.shop).quantity, 20)
+        self.assertFalse(ImportMark.objects.exists())
+
+    def test_too_long_names_are_rejected(self):
+        too_long = [
+            {"categories": [{"id": 1, "name": "Электроника"}]},
+            {"goods": [{"id": 0, "category": 1, "name": "x" * 51}]},
+            {"goods": [{"id": 0, "category": 1, "parameters": {"Цвет": "x" * 101}}]},
+        ]
+        for changes in too_long:
+            data = json.loads(price_list(self.shop, {0: {}}).getvalue())
+            for section, records in changes.items():
+                data[section] = [{**data[section][0], **records[0]}]
+            with self.subTest(changes=changes), self.assertRaises(PriceListError):
+                import_price_list(self.shop, io.StringIO(json.dumps(data)), "json")
+        self.assertFalse(ProductInfo.objects.exists())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(4)
+        self.shop = self.infos[0].shop
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop.user)
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_shop_export_imports_back_unchanged(self):
+        # строки созданы не импортом: первый импорт только записывает отпечатки
+        content = self.download(f"/shop/{self.shop.id}/export/yaml/")
+        import_price_list(self.shop, io.BytesIO(content), "yaml")
+        for fmt in ("yaml", "csv"):
+            content = self.download(f"/shop/{self.shop.id}/export/{fmt}/")
+            result = import_price_list(self.shop, io.BytesIO(content), fmt)
+            self.assertEqual(
+                (result.created, result.updated, result.deleted), (0, 0, 0)
+            )
+            self.assertEqual(result.unchanged, 2)
+
+    def test_catalog_export_reads_in_chunks(self):
+        # запрос предложений и по запросу параметров на каждый пакет
+        with self.assertNumQueries(3):
+            lines = "".join(export_catalog("jsonl", chunk_size=2)).splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [record["offer"] for record in records], [info.id for info in self.infos]
+        )
+        self.assertEqual(records[0]["parameters"], {"Цвет": "черный"})
+        self.assertEqual(self.client.get("/export/catalog/xml/").status_code, 400)
+
+
+class StockUpdateTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(4, shops=1)
+        self.shop = self.infos[0].shop
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop.user)
+        self.url = f"/shop/{self.shop.id}/offers/"
+
+    def test_batch_updates_offers_and_reports_rows(self):
+        first, second, third, _ = self.infos
+        ProductInfo.objects.filter(id=first.id).update(fingerprint="imported")
+        rows = [
+            {"id": first.id, "quantity": 3, "price": 900},
+            {"product": second.product_id, "quantity": second.quantity},
+            {"product": third.product_id, "price_rrc": 1},
+            {"id": 0, "quantity": 1},
+        ]
+        # магазин, чтение пакета, запись предложений, журнала изменений, цен
+        # фасетов и остатка магазина, пересчет лучшего предложения одного
+        # продукта, у которого изменилась цена
+        with self.assertNumQueries(14):
+            response = self.client.patch(self.url, {"offers": rows}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row.get("id"), row["status"]) for row in response.data["results"]],
+            [
+                (first.id, "updated"),
+                (second.id, "unchanged"),
+                (third.id, "updated"),
+                (0, "not_found"),
+            ],
+        )
+        self.assertEqual(response.data["results"][0]["fields"], ["quantity", "price"])
+        first.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((first.quantity, first.price, first.fingerprint), (3, 900, ""))
+        self.assertEqual((third.quantity, third.price, third.price_rrc), (10, 1002, 1))
+        self.assertEqual(
+            set(
+                ProductFacet.objects.filter(product_info=first).values_list(
+                    "price", flat=True
+                )
+            ),
+            {900},
+        )
+
+    def test_invalid_rows_reject_whole_batch(self):
+        first = self.infos[0]
+        rows = [
+            {"id": first.id, "quantity": 1},
+            {"id": first.id, "price": -1},
+            {"product": first.product_id, "quantity": 2},
+        ]
+        response = self.client.patch(self.url, {"offers": rows}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row["index"] for row in response.data["rows"]], [1])
+        # одно предложение по id и по продукту обнаруживается при записи
+        del rows[1]
+        response = self.client.patch(self.url, {"offers": rows}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["rows"][0]["index"], 1)
+        first.refresh_from_db()
+        self.assertEqual(first.quantity, 10)
+        other = User.objects.create_user("other@example.com", "pass")
+        self.client.force_authenticate(other)
+        response = self.client.patch(self.url, {"offers": rows[:1]}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+
+class BestOfferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        infos = create_catalog(1, shops=3)
+        self.product = infos[0].product
+        self.shops = list(Shop.objects.order_by("id"))
+        self.offers = [infos[0]] + [
+            ProductInfo.objects.create(
+                product=self.product,
+                shop=shop,
+                model="m",
+                quantity=5,
+                price=price,
+                price_rrc=price,
+            )
+            for shop, price in zip(self.shops[1:], (900, 950))
+        ]
+        self.client = APIClient()
+
+    def best(self):
+        return ProductBestOffer.objects.get(product=self.product)
+
+    def test_cheapest_available_offer_follows_changes(self):
+        self.assertEqual(
+            (self.best().offer_id, self.best().price, self.best().offers),
+            (self.offers[1].id, 900, 3),
+        )
+        update_stock(self.shops[1], [{"id": self.offers[1].id, "quantity": 0}])
+        self.assertEqual(
+            (self.best().offer_id, self.best().offers), (self.offers[2].id, 2)
+        )
+
+        Shop.objects.filter(id=self.shops[2].id).update(state=False)
+        self.assertEqual(self.best().offer_id, self.offers[0].id)
+
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {self.offers[0].id: self.offers[0].quantity})
+        checkout(buyer)
+        self.assertFalse(ProductBestOffer.objects.filter(product=self.product).exists())
+
+    def test_prices_endpoint_and_catalog(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/products/{self.product.id}/prices/")
+        self.assertEqual(response.data["best_offer"]["offer"], self.offers[1].id)
+        self.assertEqual(
+            [offer["price"] for offer in response.data["offers"]], [900, 950, 1000]
+        )
+        response = self.client.get("/product/")
+        self.assertEqual(
+            {
+                item["product"]["best_offer"]["price"]
+                for item in response.data["results"]
+            },
+            {900},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductInfo.objects.filter(id=self.offers[1].id).delete()
+        response = self.client.get(f"/products/{self.product.id}/prices/")
+        self.assertEqual(response.data["best_offer"]["price"], 950)
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(2, shops=1)
+        self.shop = self.infos[0].shop
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop.user)
+        self.url = f"/shop/{self.shop.id}/orders/status/"
+        self.orders = []
+        for i in range(4):
+            buyer = User.objects.create_user(f"buyer{i}@example.com", "pass")
+            update_basket(buyer, {self.infos[0].id: 2, self.infos[1].id: 1})
+            self.orders.append(checkout(buyer).id)
+
+    def move(self, orders, expected, status):
+        return self.client.post(
+            self.url,
+            {"orders": orders, "expected": expected, "status": status},
+            format="json",
+        )
+
+    def test_batch_transition_skips_orders_in_other_status(self):
+        transition(self.orders[:1], Status.new, Status.confirmed)
+        # число запросов не зависит от размера пакета
+        for orders in (self.orders[1:2], self.orders[2:]):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.move(orders + self.orders[:1], "new", "confirmed")
+            self.assertEqual(response.data["skipped"], self.orders[:1])
+            self.assertEqual(response.data["updated"], orders)
+            if orders == self.orders[1:2]:
+                single = len(queries)
+        self.assertEqual(len(queries), single)
+        self.assertEqual(
+            ShopStatusCount.objects.get(shop=self.shop, status=Status.confirmed).orders,
+            4,
+        )
+        self.assertEqual(
+            Job.objects.filter(idempotency_key__startswith="order-status:")
+            .filter(idempotency_key__endswith=":confirmed")
+            .count(),
+            4,
+        )
+        self.assertEqual(
+            self.move(self.orders, "confirmed", "delivered").status_code, 400
+        )
+        with self.assertRaises(TransitionError):
+            transition(self.orders, Status.basket, Status.new)
+
+    def test_cancel_restores_stock_and_logs_events(self):
+        order_id = self.orders[0]
+        self.assertEqual(self.move([order_id], "new", "canceled").status_code, 200)
+        self.assertEqual(
+            list(ProductInfo.objects.order_by("id").values_list("quantity", flat=True)),
+            [10 - 2 * 3, 10 - 3],
+        )
+        self.assertEqual(
+            list(
+                OrderEvent.objects.filter(order_id=order_id)
+                .order_by("id")
+                .values_list("from_status", "status", "user_id")
+            ),
+            [
+                (Status.basket, Status.new, Order.objects.get(id=order_id).user_id),
+                (Status.new, Status.canceled, self.shop.user_id),
+            ],
+        )
+        self.client.force_authenticate(Order.objects.get(id=order_id).user)
+        response = self.client.get(f"/orders/{order_id}/events/")
+        self.assertEqual(
+            [event["status"] for event in response.data], ["new", "canceled"]
+        )
+
+    def test_shop_cannot_move_orders_with_other_shops_items(self):
+        other = ProductInfo.objects.create(
+            product=self.infos[0].product,
+            shop=Shop.objects.create(
+                name="Другой магазин",
+                user=User.objects.create_user("other@example.com", "pass"),
+            ),
+            quantity=10,
+            price=900,
+            price_rrc=1000,
+        )
+        buyer = User.objects.create_user("mixed@example.com", "pass")
+        update_basket(buyer, {self.infos[0].id: 1, other.id: 2})
+        mixed = checkout(buyer).id
+        response = self.move([mixed, self.orders[0]], "new", "canceled")
+        self.assertEqual(response.data["updated"], [self.orders[0]])
+        self.assertEqual(response.data["skipped"], [mixed])
+        self.assertEqual(Order.objects.get(id=mixed).status, Status.new)
+        # остаток другого магазина не вернулся на склад
+        self.assertEqual(ProductInfo.objects.get(id=other.id).quantity, 8)
+
+
+class ShopStatsTests(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(4, shops=1)
+        self.shop = self.infos[0].shop
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop.user)
+
+    def snapshot(self):
+        return [
+            sorted(model.objects.values_list(*fields))
+            for model, fields in (
+                (
+                    ShopDailySales,
+                    ("shop_id", "date", "orders", "items_sold", "revenue"),
+                ),
+                (
+                    ShopProductSales,
+                    ("product_info_id", "orders", "quantity", "revenue"),
+                ),
+                (ShopStatusCount, ("shop_id", "status", "orders")),
+                (ShopStock, ("shop_id", "quantity")),
+            )
+        ]
+
+    def stock(self):
+        return ShopStock.objects.get(shop=self.shop).quantity
+
+    def test_incremental_rollups_match_rebuild(self):
+        first, second = (
+            User.objects.create_user(f"buyer{i}@example.com", "pass") for i in range(2)
+        )
+        update_basket(first, {self.infos[0].id: 2, self.infos[1].id: 1})
+        checkout(first)
+        update_basket(second, {self.infos[0].id: 1})
+        order = checkout(second)
+        Order.objects.filter(id=order.id).update(status=Status.canceled)
+        record_status_change([order.id], Status.new, Status.canceled)
+
+        incremental = self.snapshot()
+        self.assertEqual(
+            incremental[0][0][2:], (1, 3, self.infos[0].price * 2 + self.infos[1].price)
+        )
+        rebuild_shop_stats()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_stock_rollup_follows_offer_writes(self):
+        self.assertEqual(self.stock(), 40)
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {self.infos[0].id: 3})
+        order = checkout(buyer)
+        self.assertEqual(self.stock(), 37)
+        transition([order.id], Status.new, Status.canceled)
+        self.assertEqual(self.stock(), 40)
+        update_stock(self.shop, [{"id": self.infos[1].id, "quantity": 4}])
+        self.assertEqual(self.stock(), 34)
+        info = ProductInfo.objects.get(id=self.infos[2].id)
+        info.quantity = 12
+        info.save()
+        self.assertEqual(self.stock(), 36)
+        self.infos[3].delete()
+        ProductInfo.objects.filter(id=self.infos[2].id).delete()
+        self.assertEqual(self.stock(), 14)
+        # импорт заменяет оставшиеся предложения новыми
+        import_price_list(self.shop, price_list(self.shop, {7: {}, 8: {}}), "json")
+        self.assertEqual(self.stock(), 20)
+        rebuild_shop_stats()
+        self.assertEqual(self.stock(), 20)
+
+    def test_dashboard_query_count_does_not_depend_on_history(self):
+        for i in range(3):
+            buyer = User.objects.create_user(f"buyer{i}@example.com", "pass")
+            update_basket(buyer, {self.infos[i].id: i + 1})
+            checkout(buyer)
+            # магазин и четыре запроса сводок
+            with self.assertNumQueries(5):
+                response = self.client.get(
+                    f"/shop/{self.shop.id}/dashboard/", {"top": 2}
+                )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["orders"], 3)
+        self.assertEqual(response.data["items_sold"], 6)
+        self.assertEqual(response.data["statuses"], {Status.new: 3})
+        self.assertEqual(
+            [product["product_info_id"] for product in response.data["top_products"]],
+            [self.infos[2].id, self.infos[1].id],
+        )
+        self.assertEqual(response.data["stock"], 34)
+        self.assertEqual(
+            self.client.get(
+                f"/shop/{self.shop.id}/dashboard/", {"days": 0}
+            ).status_code,
+            400,
+        )
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.infos = create_catalog(6)
+        admin_user = User.objects.create_superuser(
+            "admin@example.com", "pass", is_active=True
+        )
+        self.client.force_login(admin_user)
+
+    def test_changelists_query_count_does_not_depend_on_rows(self):
+        for url in (
+            "/admin/backend/productinfo/",
+            "/admin/backend/productparameter/",
+            "/admin/backend/order/",
+            "/admin/backend/orderitem/",
+        ):
+            with CaptureQueriesContext(connection) as small:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            create_catalog(6)
+            buyer = User.objects.create_user(f"{url.count('/')}{url}@example.com")
+            update_basket(buyer, {self.infos[0].id: 1, self.infos[1].id: 1})
+            with CaptureQueriesContext(connection) as large:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(len(large), len(small), url)
+
+        response = self.client.get(
+            "/admin/backend/productinfo/", {"quantity": "10-100", "price": "1000-10000"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_actions(self):
+        offer = self.infos[0]
+        response = self.client.post(
+            "/admin/backend/productinfo/",
+            {
+                "action": "change_price",
+                "index": 0,
+                "percent": "-10",
+                "_selected_action": [offer.id],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        offer.refresh_from_db()
+        self.assertEqual(offer.price, 900)
+        self.assertEqual(
+            set(
+                ProductFacet.objects.filter(product_info=offer).values_list(
+                    "price", flat=True
+                )
+            ),
+            {900},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/admin/backend/shop/",
+                {
+                    "action": "disable_orders",
+                    "index": 0,
+                    "_selected_action": [offer.shop_id],
+                },
+            )
+        self.assertFalse(Shop.objects.get(id=offer.shop_id).state)
+        self.assertFalse(
+            ProductInfo.objects.filter(shop=offer.shop_id, available=True).exists()
+        )
+
+    def test_order_status_changes_only_through_transitions(self):
+        offer = self.infos[0]
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {offer.id: 2})
+        order = checkout(buyer)
+        url = f"/admin/backend/order/{order.id}/change/"
+        response = self.client.get(url)
+        self.assertNotIn("status", response.context["adminform"].form.fields)
+        lines = response.context["inline_admin_formsets"][0]
+        self.assertFalse(lines.has_change_permission)
+        self.assertFalse(lines.has_delete_permission)
+        self.assertEqual(
+            self.client.post(
+                "/admin/backend/order/",
+                {
+                    "action": "change_status",
+                    "index": 0,
+                    "status": Status.canceled,
+                    "_selected_action": [order.id],
+                },
+            ).status_code,
+            302,
+        )
+        order.refresh_from_db()
+        offer.refresh_from_db()
+        self.assertEqual(order.status, Status.canceled)
+        self.assertEqual(offer.quantity, 10)
+        self.assertTrue(
+            OrderEvent.objects.filter(order=order, status=Status.canceled).exists()
+        )
+        # из конечного статуса перевода нет
+        response = self.client.post(
+            "/admin/backend/order/",
+            {
+                "action": "change_status",
+                "index": 0,
+                "status": Status.new,
+                "_selected_action": [order.id],
+            },
+            follow=True,
+        )
+        self.assertContains(response, "Недопустимый переход")
+        order.refresh_from_db()
+        self.assertEqual(order.status, Status.canceled)
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        get_store().clear()
+        registry.reset()
+        self.client = APIClient()
+
+    def test_bucket_refills_at_rate(self):
+        store = LocalBucketStore()
+        self.assertEqual([store.take("k", 2, 1, now=0) for _ in range(3)], [0, 0, 1])
+        self.assertEqual(store.take("k", 2, 1, now=0.5), 0.5)
+        self.assertEqual(store.take("k", 2, 1, now=1.5), 0)
+
+    @override_settings(THROTTLE_RATES={"catalog": {"anon": "2/m"}})
+    def test_anonymous_quota_returns_retry_after(self):
+        statuses = [self.client.get("/shops/").status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.client.get("/shops/")
+        self.assertEqual(int(response["Retry-After"]), 30)
+        self.assertIn(
+            'throttle_requests_total{scope="catalog",tenant="anon",result="throttled"} 2',
+            registry.render(),
+        )
+
+    def test_shop_quota_is_not_spent_by_other_users(self):
+        shop = create_catalog(1, shops=1)[0].shop
+        other = User.objects.create_user("other@example.com", "pass")
+        rows = {"offers": [{"product": 0, "quantity": 1}]}
+        url = f"/shop/{shop.id}/offers/"
+        with override_settings(
+            THROTTLE_TENANT_RATES={f"shop:{shop.id}": {"stock": "1/m"}}
+        ):
+            self.client.force_authenticate(other)
+            self.assertEqual(
+                self.client.patch(url, rows, format="json").status_code, 403
+            )
+            self.client.force_authenticate(shop.user)
+            statuses = [
+                self.client.patch(url, rows, format="json").status_code
+                for _ in range(2)
+            ]
+        self.assertEqual(statuses, [200, 429])
+
+    @override_settings(THROTTLE_RATES={"stock": {"default": "5/m"}})
+    def test_unknown_shop_ids_fall_back_to_user_tenant(self):
+        user = User.objects.create_user("probe@example.com", "pass")
+        self.client.force_authenticate(user)
+        for pk in (987654, 987655):
+            self.client.patch(f"/shop/{pk}/offers/", {"offers": []}, format="json")
+        metrics = registry.render()
+        self.assertNotIn('tenant="shop:', metrics)
+        self.assertIn(
+            f'throttle_requests_total{{scope="stock",tenant="{user.role}",'
+            'result="allowed"} 2',
+            metrics,
+        )
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        get_store().clear()
+        self.infos = create_catalog(3, shops=2)
+        self.shop = self.infos[0].shop
+        self.staff = User.objects.create_user(
+            "staff@example.com", "pass", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        ChangeLog.objects.sequence()
+        self.cursor = ChangeLog.objects.latest("seq").seq
+
+    def feed(self, url="/changes/", **params):
+        # нумерует воркер фоновых задач
+        ChangeLog.objects.sequence()
+        response = self.client.get(url, {"cursor": self.cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_feed_compacts_changes_and_resumes_from_cursor(self):
+        first, second, third = self.infos
+        update_stock(self.shop, [{"id": first.id, "quantity": 5}])
+        update_stock(self.shop, [{"id": first.id, "quantity": 3}])
+        ProductInfo.objects.filter(id=second.id).delete()
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {third.id: 1})
+        order = checkout(buyer)
+        data = self.feed()
+        self.assertEqual(
+            [
+                (change["topic"], change["object_id"], change["deleted"])
+                for change in data["changes"]
+            ],
+            [
+                ("offer", first.id, False),
+                ("offer", second.id, True),
+                ("offer", third.id, False),
+                ("order", order.id, False),
+            ],
+        )
+        # в ленте - текущее состояние, а не каждое изменение
+        self.assertEqual(data["changes"][0]["data"]["quantity"], 3)
+        self.assertEqual(data["changes"][3]["data"]["status"], Status.new)
+        self.assertEqual(data["cursor"], data["changes"][-1]["id"])
+        self.cursor = data["cursor"]
+        self.assertEqual(self.feed()["changes"], [])
+        # массовое изменение пишет журнал одним запросом
+        ProductInfo.objects.filter(shop=self.shop).update(available=False)
+        self.assertEqual(
+            [change["object_id"] for change in self.feed()["changes"]],
+            [first.id, third.id],
+        )
+
+    def test_row_committed_late_is_not_skipped(self):
+        first, second = self.infos[:2]
+        # ключ медленной транзакции выделен раньше, чем у быстрой
+        slow = ChangeLog.objects.create(
+            topic="offer", object_id=second.id, shop_id=second.shop_id
+        )
+        slow_id = slow.id
+        slow.delete()
+        update_stock(self.shop, [{"id": first.id, "quantity": 7}])
+        data = self.feed()
+        self.assertEqual(
+            [change["object_id"] for change in data["changes"]], [first.id]
+        )
+        self.cursor = data["cursor"]
+        # медленная транзакция фиксируется после чтения быстрой
+        ChangeLog.objects.create(
+            id=slow_id, topic="offer", object_id=second.id, shop_id=second.shop_id
+        )
+        data = self.feed()
+        self.assertEqual(
+            [change["object_id"] for change in data["changes"]], [second.id]
+        )
+        self.assertGreater(data["cursor"], self.cursor)
+
+    def test_reading_feed_does_not_write(self):
+        update_stock(self.shop, [{"id": self.infos[0].id, "quantity": 7}])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(read_changes(self.cursor), (self.cursor, []))
+        self.assertFalse(
+            [query for query in queries if not query["sql"].startswith("SELECT")]
+        )
+        # новые строки нумерует воркер, пустой опрос - один запрос
+        ChangeLog.objects.sequence()
+        self.assertEqual(len(read_changes(self.cursor)[1]), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(ChangeLog.objects.sequence(), 0)
+
+    def test_prune_keeps_last_sequenced_row(self):
+        update_stock(self.shop, [{"id": self.infos[0].id, "quantity": 7}])
+        self.cursor = self.feed()["cursor"]
+        ChangeLog.objects.update(created_at=timezone.now() - timedelta(days=30))
+        prune_changes(days=7)
+        self.assertEqual(ChangeLog.objects.get().seq, self.cursor)
+        update_stock(self.shop, [{"id": self.infos[0].id, "quantity": 8}])
+        data = self.feed()
+        self.assertEqual(len(data["changes"]), 1)
+        self.assertGreater(data["cursor"], self.cursor)
+
+    @override_settings(CHANGE_FEED_BATCH_SIZE=1)
+    def test_batches_walk_log_by_cursor(self):
+        offer_ids = []
+        for info in self.infos:
+            update_stock(info.shop, [{"id": info.id, "price": 500}])
+            offer_ids.append(info.id)
+        seen = []
+        for _ in range(3):
+            data = self.feed()
+            self.assertEqual(len(data["changes"]), 1)
+            seen.append(data["changes"][0]["object_id"])
+            self.cursor = data["cursor"]
+        self.assertEqual(seen, offer_ids)
+        self.assertEqual(self.feed()["changes"], [])
+
+    def test_shop_feed_is_limited_to_owner_and_shop(self):
+        own, foreign = self.infos[0], self.infos[1]
+        buyer = User.objects.create_user("buyer@example.com", "pass")
+        update_basket(buyer, {own.id: 1, foreign.id: 1})
+        order = checkout(buyer)
+        url = f"/shop/{self.shop.id}/changes/"
+        self.client.force_authenticate(buyer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get("/changes/").status_code, 403)
+        self.client.force_authenticate(self.shop.user)
+        # списание остатков при оформлении записано в журнал
+        self.assertEqual(
+            [
+                (change["topic"], change["object_id"])
+                for change in self.feed(url)["changes"]
+            ],
+            [("offer", own.id), ("order", order.id)],
+        )
+        self.assertEqual(
+            [change["topic"] for change in self.feed(url, topics="order")["changes"]],
+            ["order"],
+        )
+        response = self.client.get(url, {"topics": "user"})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(CHANGE_FEED_STREAM_SECONDS=0)
+    def test_event_stream_resumes_from_last_event_id(self):
+        update_stock(self.shop, [{"id": self.infos[0].id, "quantity": 1}])
+        ChangeLog.objects.sequence()
+        response = self.client.get(
+            "/changes/",
+            HTTP_ACCEPT="text/event-stream",
+            HTTP_LAST_EVENT_ID=str(self.cursor),
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        event_id = ChangeLog.objects.latest("seq").seq
+        self.assertTrue(body.startswith("retry: "))
+        self.assertIn(f"id: {event_id}\nevent: offer\ndata: ", body)
+        response = self.client.get(
+            "/changes/",
+            HTTP_ACCEPT="text/event-stream",
+            HTTP_LAST_EVENT_ID=str(event_id),
+        )
+        self.assertNotIn("id: ", b"".join(response.streaming_content).decode())
+
+
+class BenchmarkTests(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+
+    def test_generated_marketplace_drives_all_scenarios(self):
+        counts = generate_marketplace(
+            MarketplaceSize(
+                users=5, shops=2, categories=2, products=20, orders=5, items_per_order=2
+            )
+        )
+        self.assertEqual(counts["offers"], 40)
+        self.assertEqual(counts["order_items"], 20)
+        orders = Order.objects.count()
+
+        report = benchmark_endpoints(iterations=3, import_runs=1)
+
+        self.assertEqual(set(report["endpoints"]), set(EndpointBenchmark.scenarios))
+        for name, stats in report["endpoints"].items():
+            self.assertEqual(stats["requests"], 1 if name.startswith("import") else 3)
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+        self.assertEqual(report["endpoints"]["import"]["statuses"], {"202": 1})
+        self.assertEqual(report["endpoints"]["import_job"]["statuses"], {"done": 1})
+        # изменения данных сценариев откатываются
+        self.assertEqual(Order.objects.count(), orders)
+        slower = dict(report["endpoints"]["search"], p95_ms=1e6)
+        comparison = compare_reports(
+            report, {"endpoints": {"search": slower}}, threshold=0.2
+        )
+        self.assertEqual(comparison["regressions"], ["search"])
+
+
+class BenchmarkIndexesCommandTests(TransactionTestCase):
+    def test_command_measures_queries_and_keeps_indexes(self):
+        out = io.StringIO()
+        call_command(
+            "benchmark_indexes", "--seed-products", "20", "--repeat", "1", stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["vendor"], connection.vendor)
+        self.assertTrue(report["queries"])
+        for timings in report["queries"].values():
+            self.assertEqual(set(timings), {"before", "after"})
+        # удаление индексов для замера «до» откатывается
+        for model, name in HOT_PATH_INDEXES:
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(
+                    cursor, model._meta.db_table
+                )
+            self.assertIn(name, constraints)
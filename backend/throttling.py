@@ -0,0 +1,210 @@
+"""
+Ограничение частоты запросов к API по алгоритму token bucket.
+
+У каждого арендатора - магазина с собственной квотой на эндпоинтах
+``shop/<pk>/...``, пользователя или IP анонима - свое ведро на группу эндпоинтов
+(``throttle_scope`` представления). Емкость и скорость пополнения ведра
+задаются строкой ``"N/период"`` в ``THROTTLE_RATES`` по группе и роли
+(``anon``, ``buyer``, ``shop``, ``default``); ``THROTTLE_TENANT_RATES``
+переопределяет квоты отдельных магазинов (``shop:<id>``) и пользователей
+(``user:<id>``). Запрос берет из ведра один токен, при пустом ведре DRF
+отвечает 429 с ``Retry-After`` - временем до появления токена.
+
+Ведра хранятся в памяти процесса (``THROTTLE_STORE = "local"``) или в
+Redis и совместимых с ним серверах (``"redis"``, ``THROTTLE_REDIS_URL``):
+там пополнение и списание выполняются одним Lua-скриптом, поэтому квота
+общая для всех воркеров. Проверка - один вызов хранилища без запросов к
+БД (кроме эндпоинтов магазинов с собственной квотой: владение магазином
+проверяется одним запросом); итог учитывается в метрике ``throttle_requests_total`` по группе и
+арендатору.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from backend import metrics
+from backend.models import Shop
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+ANON = "anon"
+DEFAULT = "default"
+
+throttle_requests = metrics.registry.register(
+    metrics.Counter(
+        "throttle_requests_total",
+        "Проверки квот запросов по группе эндпоинтов, арендатору и итогу",
+        ("scope", "tenant", "result"),
+    )
+)
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    ``"N/период"`` (период - ``s``, ``m``, ``h``, ``d`` или полное слово) ->
+    (емкость ведра, токенов в секунду)
+    """
+    count, period = rate.split("/")
+    return int(count), int(count) / PERIODS[period.strip()[0]]
+
+
+class LocalBucketStore:
+    """
+    Ведра в памяти процесса; самые давние из ``max_keys`` вытесняются
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill, now=None):
+        """
+        Списывает токен; возвращает 0 или время в секундах до появления
+        токена, если ведро пусто
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / refill
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """
+    Ведра в Redis: состояние ведра - хеш с числом токенов и временем
+    обновления, ключ истекает, когда ведро заведомо снова полно
+    """
+
+    script = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / refill) + 1)
+return tostring(wait)
+"""
+
+    def __init__(self, url, prefix="throttle:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.script)
+
+    def take(self, key, capacity, refill, now=None):
+        now = time.time() if now is None else now
+        return float(self._take(keys=[self.prefix + key], args=[capacity, refill, now]))
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if getattr(settings, "THROTTLE_STORE", "local") == "redis":
+                    _store = RedisBucketStore(settings.THROTTLE_REDIS_URL)
+                else:
+                    _store = LocalBucketStore()
+    return _store
+
+
+def get_rate(scope, tenant, role):
+    """
+    Квота арендатора в группе ``scope`` или ``None``, если группа не
+    ограничена
+    """
+    override = getattr(settings, "THROTTLE_TENANT_RATES", {}).get(tenant, {})
+    if scope in override:
+        return override[scope]
+    rates = settings.THROTTLE_RATES.get(scope, {})
+    return rates.get(role, rates.get(DEFAULT))
+
+
+def shop_tenant(view, user):
+    """
+    Арендатор ``shop:<pk>`` для эндпоинтов магазина или ``None``: только
+    для магазинов с собственной квотой в ``THROTTLE_TENANT_RATES`` и только
+    их владельцу. ``pk`` берется из URL до проверки прав представлением,
+    поэтому произвольные идентификаторы не создают ни ведер, ни рядов
+    метрики - такие запросы считаются по квоте пользователя
+    """
+    pk = view.kwargs.get("pk")
+    if not getattr(view, "throttle_per_shop", False) or not str(pk).isdigit():
+        return None
+    tenant = f"shop:{int(pk)}"
+    if tenant not in getattr(settings, "THROTTLE_TENANT_RATES", {}):
+        return None
+    if not Shop.objects.filter(id=int(pk), user=user).exists():
+        return None
+    return tenant
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Квоты для представлений с ``throttle_scope``; остальные не ограничены
+    """
+
+    def allow_request(self, request, view):
+        self.delay = 0
+        scope = getattr(view, "throttle_scope", None)
+        if scope is None or not getattr(settings, "THROTTLE_ENABLED", True):
+            return True
+        user = request.user
+        if not user or not user.is_authenticated:
+            tenant = label = role = ANON
+            key = f"{ANON}:{self.get_ident(request)}"
+        elif tenant := shop_tenant(view, user):
+            # ведро магазина делит только его владелец: чужие запросы к
+            # магазину не расходуют его квоту
+            label = tenant
+            role, key = user.role, f"{tenant}:{user.id}"
+        else:
+            # в метриках покупатели сводятся к роли, чтобы число рядов не
+            # росло с числом пользователей
+            tenant = key = f"user:{user.id}"
+            label = role = user.role
+        rate = get_rate(scope, tenant, role)
+        if rate is None:
+            return True
+        self.delay = get_store().take(f"{scope}:{key}", *parse_rate(rate))
+        throttle_requests.inc(scope, label, "throttled" if self.delay else "allowed")
+        return not self.delay
+
+    def wait(self):
+        return self.delay
@@ -0,0 +1,135 @@
+"""
+Смена статусов заказов.
+
+Допустимые переходы заданы в ``TRANSITIONS``: корзина оформляется только
+через ``backend.orders.checkout``, отправленный заказ нельзя отменить, а
+доставленный и отмененный - конечные статусы. ``transition`` переводит
+пакет заказов из ожидаемого статуса в новый частями по ``BATCH_SIZE``, по
+транзакции на часть: заказы части блокируются в порядке первичного ключа
+и переводятся одним условным UPDATE (``WHERE status = ожидаемый``),
+поэтому заказ, который успел сменить статус в другой транзакции,
+пропускается, а не переводится повторно. В той же транзакции одним
+запросом на таблицу пишутся события ``OrderEvent``, журнал изменений
+``ChangeLog``, сводки продаж (``backend.stats``) и письма покупателям, а
+при отмене остатки позиций возвращаются на склад
+(``backend.stock.restore_stock``).
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from backend.models import ChangeLog, Order, OrderEvent, OrderItem
+from backend.orders import OrderError
+from backend.stats import record_status_change
+from backend.stock import restore_stock
+from backend.tasks import queue_order_status_emails
+from Py_Diplom_new.enums import Status
+
+BATCH_SIZE = 1000
+MAX_ORDERS = 10000
+
+TRANSITIONS = {
+    Status.basket: frozenset((Status.new,)),
+    Status.new: frozenset((Status.confirmed, Status.canceled)),
+    Status.confirmed: frozenset((Status.assembled, Status.canceled)),
+    Status.assembled: frozenset((Status.sent, Status.canceled)),
+    Status.sent: frozenset((Status.delivered,)),
+    Status.delivered: frozenset(),
+    Status.canceled: frozenset(),
+}
+
+# статусы, в которых остаток позиций заказа списан со склада
+RESERVED_STATUSES = frozenset((Status.new, Status.confirmed, Status.assembled))
+
+
+class TransitionError(OrderError):
+    """
+    Недопустимый переход статуса заказа
+    """
+
+
+class TransitionConflict(TransitionError):
+    """
+    Заказы сменили статус в другой транзакции между блокировкой и UPDATE
+    (возможно на СУБД без блокировки строк); пакет нужно повторить
+    """
+
+
+def validate_transition(old_status, new_status):
+    if new_status not in TRANSITIONS.get(old_status, ()):
+        raise TransitionError(
+            f"Недопустимый переход статуса заказа: {old_status} -> {new_status}"
+        )
+
+
+def record_events(order_ids, old_status, new_status, user=None):
+    OrderEvent.objects.bulk_create(
+        OrderEvent(
+            order_id=order_id,
+            from_status=old_status,
+            status=new_status,
+            user=user,
+        )
+        for order_id in order_ids
+    )
+
+
+def _apply_batch(orders, old_status, new_status, user):
+    ids = list(
+        orders.select_for_update(of=("self",))
+        .filter(status=old_status)
+        .order_by("pk")
+        .values_list("id", flat=True)
+    )
+    if not ids:
+        return ids
+    if Order.objects.filter(id__in=ids, status=old_status).update(
+        status=new_status
+    ) != len(ids):
+        raise TransitionConflict("Статус части заказов изменен другим запросом")
+    record_events(ids, old_status, new_status, user)
+    ChangeLog.objects.record_orders(ids)
+    record_status_change(ids, old_status, new_status)
+    if new_status == Status.canceled and old_status in RESERVED_STATUSES:
+        restore_stock(
+            dict(
+                OrderItem.objects.filter(order_id__in=ids, product_info__isnull=False)
+                .order_by()
+                .values("product_info_id")
+                .annotate(total=Sum("quantity"))
+                .values_list("product_info_id", "total")
+            )
+        )
+    queue_order_status_emails(ids, new_status)
+    return ids
+
+
+def transition(order_ids, old_status, new_status, user=None, shop=None):
+    """
+    Переводит заказы ``order_ids`` из статуса ``old_status`` в
+    ``new_status``; с ``shop`` - только заказы, все позиции которых
+    принадлежат магазину: статус и остатки заказа с позициями нескольких
+    магазинов общие, и один магазин не может менять их за другие.
+    Возвращает идентификаторы переведенных заказов, остальные пропущены
+    """
+    validate_transition(old_status, new_status)
+    if old_status == Status.basket:
+        raise TransitionError("Корзина оформляется только через checkout")
+    order_ids = sorted(set(order_ids))
+    if len(order_ids) > MAX_ORDERS:
+        raise TransitionError(f"Не больше {MAX_ORDERS} заказов за запрос")
+    moved = []
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        orders = Order.objects.filter(id__in=order_ids[start : start + BATCH_SIZE])
+        if shop is not None:
+            orders = orders.filter(
+                id__in=OrderItem.objects.filter(product_info__shop=shop).values(
+                    "order_id"
+                )
+            ).exclude(
+                id__in=OrderItem.objects.exclude(product_info__shop=shop).values(
+                    "order_id"
+                )
+            )
+        with transaction.atomic():
+            moved.extend(_apply_batch(orders, old_status, new_status, user))
+    return moved
@@ -1,31 +1,725 @@
-from django.shortcuts import render
+import tempfile
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, connections
+from django.db.models import Prefetch
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from backend.models import Product, Shop
-from backend.serializers import ProductSerializer
-
-
-class ProductView(APIView):
-    pass
-
-
-#     def get(self, request, *args,**kwargs):
-#         shop = Shop.objects.create(name='Sviaznoy', state=True)
-#         Product.objects.create(name='Iphone',
-#                                category='phones',
-#                                quantity=20,
-#                                price=80000,
-#                                shop_id = shop.id)
-#         queryset = Product.objects.all().select_related('shop')
-#         serializer = ProductSerializer(queryset, many=True)
-#         return Response(serializer.data)
-#
-#     def post(self,request, *args,**kwargs):
-#         request.data
-#         serializer = ProductSerializer(data=request.data)
-#         if serializer.is_valid():
-#             product = serializer.save()
-#             return Response(ProductSerializer(product).data)
-#         else:
-#             return Response(serializer.errors)
+from backend.cache import (
+    CATALOG,
+    CATEGORIES,
+    SHOPS,
+    catalog_cache,
+    offer_scopes,
+    product_scope,
+)
+from backend.changes import (
+    EventStreamRenderer,
+    format_event,
+    format_retry,
+    stream_changes,
+    wait_changes,
+)
+from backend.conditional import (
+    catalog_state,
+    categories_state,
+    conditional,
+    offer_state,
+    shops_state,
+)
+from backend.exporter import CONTENT_TYPES, ExportError, export_catalog
+from backend.facets import facet_counts, filter_offers
+from backend.models import (
+    Category,
+    Job,
+    Order,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.orders import (
+    InsufficientStock,
+    OrderError,
+    checkout,
+    get_basket,
+    remove_from_basket,
+    update_basket,
+)
+from backend.pagination import (
+    CatalogPagination,
+    JobPagination,
+    OrderHistoryPagination,
+)
+from backend.metrics import registry
+from backend.permissions import IsMetricsScraper, IsShopOwner
+from backend.search import search_products
+from backend.serializers import (
+    BasketRemoveSerializer,
+    BasketUpdateSerializer,
+    CatalogFilterSerializer,
+    ChangeFeedQuerySerializer,
+    CategoryListSerializer,
+    CheckoutSerializer,
+    DashboardQuerySerializer,
+    JobSerializer,
+    OrderSerializer,
+    OrderEventSerializer,
+    OrderTotalsSerializer,
+    OrderTransitionSerializer,
+    ProductInfoSerializer,
+    ProductPricesSerializer,
+    SearchQuerySerializer,
+    SearchResultSerializer,
+    ShopSerializer,
+    ShopStateSerializer,
+)
+from backend.stats import shop_dashboard
+from backend.stock import StockUpdateError, update_stock
+from backend.tasks import queue_price_list_import
+from backend.transitions import TransitionConflict, TransitionError, transition
+from Py_Diplom_new.enums import Status
+
+
+def catalog_queryset():
+    """
+    Предложения каталога со всеми связанными данными, загружаемыми
+    фиксированным числом запросов
+    """
+    return ProductInfo.objects.select_related(
+        "product__category", "product__best_offer", "shop"
+    ).prefetch_related(
+        Prefetch(
+            "product__products_info",
+            queryset=ProductParameter.objects.select_related("parameter"),
+        )
+    )
+
+
+@conditional(catalog_state)
+class ProductView(ListAPIView):
+    """
+    Каталог: предложения магазинов вместе с продуктом, категорией,
+    магазином и параметрами; страница всегда стоит два SQL-запроса, а из
+    кеша - ни одного (плюс один запрос версии каталога для ETag)
+    """
+
+    throttle_scope = "catalog"
+    serializer_class = ProductInfoSerializer
+    pagination_class = CatalogPagination
+
+    def get_queryset(self):
+        return catalog_queryset().filter(available=True)
+
+    def list(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            f"products:{request.build_absolute_uri()}",
+            lambda: super(ProductView, self).list(request, *args, **kwargs).data,
+            [CATALOG],
+        )
+        return Response(data)
+
+
+@conditional(offer_state)
+class ProductDetailView(RetrieveAPIView):
+    """
+    Карточка предложения из каталога; кешируется до изменения самого
+    предложения, его магазина, продукта или категории
+    """
+
+    throttle_scope = "catalog"
+    serializer_class = ProductInfoSerializer
+
+    def get_queryset(self):
+        return catalog_queryset()
+
+    def retrieve(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            f"offer:{kwargs['pk']}",
+            lambda: super(ProductDetailView, self)
+            .retrieve(request, *args, **kwargs)
+            .data,
+            offer_scopes,
+        )
+        return Response(data)
+
+
+class ProductPricesView(RetrieveAPIView):
+    """
+    Сравнение цен продукта: лучшее предложение и все предложения магазинов,
+    принимающих заказы, с ненулевым остатком по возрастанию цены; два
+    запроса по индексу (продукт, цена)
+    """
+
+    throttle_scope = "catalog"
+    serializer_class = ProductPricesSerializer
+
+    def get_queryset(self):
+        return Product.objects.select_related(
+            "category", "best_offer"
+        ).prefetch_related(
+            Prefetch(
+                "products",
+                queryset=ProductInfo.objects.filter(available=True, quantity__gt=0)
+                .select_related("shop")
+                .order_by("price", "id"),
+                to_attr="offers_in_stock",
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            f"prices:{kwargs['pk']}",
+            lambda: super(ProductPricesView, self)
+            .retrieve(request, *args, **kwargs)
+            .data,
+            [CATALOG, product_scope(kwargs["pk"])],
+        )
+        return Response(data)
+
+
+@conditional(shops_state)
+class ShopListView(ListAPIView):
+    """
+    Список магазинов с признаком приема заказов
+    """
+
+    throttle_scope = "catalog"
+    serializer_class = ShopSerializer
+    queryset = Shop.objects.order_by("id")
+
+    def list(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            "shops",
+            lambda: super(ShopListView, self).list(request, *args, **kwargs).data,
+            [SHOPS],
+        )
+        return Response(data)
+
+
+@conditional(categories_state)
+class CategoryListView(ListAPIView):
+    """
+    Список категорий с магазинами, в которых они представлены
+    """
+
+    throttle_scope = "catalog"
+    serializer_class = CategoryListSerializer
+
+    def get_queryset(self):
+        return Category.objects.prefetch_related("shops").order_by("id")
+
+    def list(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_set(
+            "categories",
+            lambda: super(CategoryListView, self).list(request, *args, **kwargs).data,
+            [CATEGORIES],
+        )
+        return Response(data)
+
+
+class MetricsView(APIView):
+    """
+    Метрики запросов текущего процесса в текстовом формате Prometheus
+    """
+
+    permission_classes = [IsMetricsScraper]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
+class HealthView(APIView):
+    """
+    Проверка доступности основной БД и реплики для балансировщика
+    """
+
+    def get(self, request, *args, **kwargs):
+        databases = {}
+        for connection in connections.all():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                databases[connection.alias] = "ok"
+            except DatabaseError as exc:
+                databases[connection.alias] = str(exc)
+        healthy = all(state == "ok" for state in databases.values())
+        return Response({"databases": databases}, status=200 if healthy else 503)
+
+
+class CacheStatsView(APIView):
+    """
+    Счетчики попаданий и промахов кеша каталога в текущем процессе
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(catalog_cache.stats())
+
+
+@conditional(catalog_state)
+class ProductFilterView(ListAPIView):
+    """
+    Фильтрация каталога по категории, магазину, цене и значениям параметров;
+    первая страница дополнительно содержит счетчики фасетов
+    """
+
+    throttle_scope = "catalog"
+    serializer_class = ProductInfoSerializer
+    pagination_class = CatalogPagination
+
+    def get_queryset(self):
+        return catalog_queryset().filter(id__in=self.offers.values("product_info_id"))
+
+    def list(self, request, *args, **kwargs):
+        params = CatalogFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = dict(params.validated_data)
+        filters["parameters"] = filters.pop("param", None)
+        self.offers = filter_offers(**filters)
+        response = super().list(request, *args, **kwargs)
+        if self.paginator.cursor_query_param not in request.query_params:
+            response.data["facets"] = facet_counts(self.offers)
+        return response
+
+
+class SearchView(APIView):
+    """
+    Полнотекстовый поиск по каталогу с ранжированием по релевантности
+    """
+
+    throttle_scope = "catalog"
+
+    def get(self, request, *args, **kwargs):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        hits = search_products(
+            params.validated_data["q"], params.validated_data["limit"]
+        )
+        offers = (
+            catalog_queryset().filter(available=True).in_bulk([pk for pk, _ in hits])
+        )
+        results = []
+        for pk, rank in hits:
+            # предложение могло быть удалено или снято с продажи после
+            # поиска
+            if pk in offers:
+                offers[pk].rank = rank
+                results.append(offers[pk])
+        return Response(
+            {
+                "query": params.validated_data["q"],
+                "results": SearchResultSerializer(results, many=True).data,
+            }
+        )
+
+
+def _order_response(order):
+    if order is None:
+        return Response({"ordered_items": []})
+    order = Order.objects.prefetch_related("ordered_items").get(pk=order.pk)
+    return Response(OrderSerializer(order).data)
+
+
+class BasketView(APIView):
+    """
+    Корзина пользователя: POST добавляет позиции, PUT задает количество,
+    DELETE удаляет позиции
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return _order_response(get_basket(request.user))
+
+    def post(self, request, *args, **kwargs):
+        return self._update(request, replace=False)
+
+    def put(self, request, *args, **kwargs):
+        return self._update(request, replace=True)
+
+    def delete(self, request, *args, **kwargs):
+        params = BasketRemoveSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        basket = remove_from_basket(request.user, params.validated_data["items"])
+        return _order_response(basket)
+
+    def _update(self, request, replace):
+        params = BasketUpdateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        try:
+            basket = update_basket(
+                request.user, params.validated_data["items"], replace=replace
+            )
+        except OrderError as exc:
+            return Response({"error": str(exc)}, status=400)
+        return _order_response(basket)
+
+
+class BasketLinesView(APIView):
+    """
+    Массовое добавление позиций в корзину (до 1000 строк за запрос);
+    в ответе только итоги заказа, посчитанные в SQL
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        params = BasketUpdateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        try:
+            basket = update_basket(
+                request.user,
+                params.validated_data["items"],
+                replace=request.query_params.get("replace") == "1",
+            )
+        except OrderError as exc:
+            return Response({"error": str(exc)}, status=400)
+        basket.refresh_from_db()
+        return Response(OrderTotalsSerializer(basket).data)
+
+
+class OrderHistoryView(ListAPIView):
+    """
+    История заказов пользователя с готовыми итогами, без агрегации позиций
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderTotalsSerializer
+    pagination_class = OrderHistoryPagination
+
+    def get_queryset(self):
+        return Order.objects.filter(user=self.request.user).exclude(
+            status=Status.basket
+        )
+
+
+class OrderStatusView(RetrieveAPIView):
+    """
+    Статус и итоги заказа пользователя
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderTotalsSerializer
+
+    def get_queryset(self):
+        return Order.objects.filter(user=self.request.user).exclude(
+            status=Status.basket
+        )
+
+
+class OrderEventsView(ListAPIView):
+    """
+    Хронология статусов заказа пользователя
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderEventSerializer
+
+    def get_queryset(self):
+        order = get_object_or_404(Order, pk=self.kwargs["pk"], user=self.request.user)
+        return order.events.order_by("id")
+
+
+class CheckoutView(APIView):
+    """
+    Оформление корзины в заказ со списанием остатков
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        params = CheckoutSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        try:
+            order = checkout(
+                request.user,
+                params.validated_data.get("contact"),
+                params.validated_data["split"],
+            )
+        except InsufficientStock as exc:
+            return Response(
+                {"error": str(exc), "product_infos": exc.product_info_ids}, status=409
+            )
+        except OrderError as exc:
+            return Response({"error": str(exc)}, status=400)
+        return _order_response(order)
+
+
+class ShopImportView(APIView):
+    """
+    Постановка импорта прайс-листа магазина в очередь фоновых задач; новый
+    файл можно передать в поле ``file``. Заголовок ``Idempotency-Key``
+    защищает от повторной постановки при повторе запроса клиентом
+    """
+
+    throttle_scope = "import"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+
+    def post(self, request, pk, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        job = queue_price_list_import(
+            shop,
+            request.user,
+            request.headers.get("Idempotency-Key"),
+            request.FILES.get("file"),
+        )
+        return Response(
+            JobSerializer(job).data,
+            status=202,
+            headers={"Location": f"/jobs/{job.id}/"},
+        )
+
+
+class JobListView(ListAPIView):
+    """
+    Фоновые задачи пользователя
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+    serializer_class = JobSerializer
+    pagination_class = JobPagination
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+class JobDetailView(RetrieveAPIView):
+    """
+    Состояние фоновой задачи
+    """
+
+    throttle_scope = "orders"
+    permission_classes = [IsAuthenticated]
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+
+def _export_response(request, fmt, filename, shop=None):
+    try:
+        chunks = export_catalog(fmt, shop)
+    except ExportError as exc:
+        return Response({"error": str(exc)}, status=400)
+    filename = f"{filename}.{fmt}"
+    if isinstance(request._request, ASGIRequest):
+        # Django 4.1 читает потоковый ответ ASGI в цикле событий, где ORM
+        # недоступен: выгрузка пишется во временный файл в потоке
+        # представления и отдается с диска
+        spool = tempfile.TemporaryFile()
+        for chunk in chunks:
+            spool.write(chunk.encode())
+        spool.seek(0)
+        return FileResponse(
+            spool,
+            as_attachment=True,
+            filename=filename,
+            content_type=CONTENT_TYPES[fmt],
+        )
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class CatalogExportView(APIView):
+    """
+    Потоковая выгрузка всего каталога в CSV, JSON Lines или YAML
+    """
+
+    throttle_scope = "export"
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, fmt, *args, **kwargs):
+        return _export_response(request, fmt, "catalog")
+
+
+class ShopExportView(APIView):
+    """
+    Потоковая выгрузка предложений магазина в формате прайс-листа
+    """
+
+    throttle_scope = "export"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+
+    def get(self, request, pk, fmt, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        return _export_response(request, fmt, f"shop-{shop.id}", shop)
+
+
+class ShopStateView(APIView):
+    """
+    Включение и выключение приема заказов магазином
+    """
+
+    throttle_scope = "shop"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+
+    def patch(self, request, pk, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        params = ShopStateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        shop.state = params.validated_data["state"]
+        # доступность предложений и кеш каталога обновляют сигналы магазина
+        shop.save(update_fields=["state"])
+        return Response(ShopSerializer(shop).data)
+
+
+class ShopStockView(APIView):
+    """
+    Массовое обновление остатков и цен предложений магазина
+    """
+
+    throttle_scope = "stock"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+
+    def patch(self, request, pk, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        rows = request.data.get("offers") if isinstance(request.data, dict) else None
+        try:
+            results = update_stock(shop, rows)
+        except StockUpdateError as exc:
+            return Response({"error": str(exc), "rows": exc.rows}, status=400)
+        return Response({"results": results})
+
+
+class ShopOrderStatusView(APIView):
+    """
+    Пакетная смена статуса заказов магазина; заказы не в ожидаемом статусе
+    и заказы с позициями других магазинов пропускаются
+    """
+
+    throttle_scope = "shop"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+
+    def post(self, request, pk, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        params = OrderTransitionSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        orders = params.validated_data["orders"]
+        try:
+            moved = transition(
+                orders,
+                params.validated_data["expected"],
+                params.validated_data["status"],
+                user=request.user,
+                shop=shop,
+            )
+        except TransitionConflict as exc:
+            return Response({"error": str(exc)}, status=409)
+        except TransitionError as exc:
+            return Response({"error": str(exc)}, status=400)
+        return Response(
+            {"updated": moved, "skipped": sorted(set(orders).difference(moved))}
+        )
+
+
+def _changes_response(request, shop=None):
+    query = request.query_params.dict()
+    # переподключение EventSource повторяет исходный URL с Last-Event-ID
+    if "Last-Event-ID" in request.headers:
+        query["cursor"] = request.headers["Last-Event-ID"]
+    params = ChangeFeedQuerySerializer(data=query)
+    params.is_valid(raise_exception=True)
+    cursor = params.validated_data["cursor"]
+    topics = params.validated_data.get("topics")
+    if request.accepted_renderer.format != EventStreamRenderer.format:
+        cursor, changes = wait_changes(
+            cursor, topics, shop, params.validated_data["wait"]
+        )
+        return Response({"cursor": cursor, "changes": changes})
+    if isinstance(request._request, ASGIRequest):
+        # потоковый ответ ASGI читается в цикле событий без ORM (см.
+        # _export_response): отдается один пакет, дождавшись изменений, а
+        # EventSource переподключается сам
+        cursor, changes = wait_changes(
+            cursor, topics, shop, params.validated_data["wait"]
+        )
+        response = HttpResponse(
+            format_retry() + "".join(map(format_event, changes)),
+            content_type=EventStreamRenderer.media_type,
+        )
+    else:
+        response = StreamingHttpResponse(
+            stream_changes(cursor, topics, shop),
+            content_type=EventStreamRenderer.media_type,
+        )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class ChangeFeedView(APIView):
+    """
+    Лента изменений всех предложений и заказов: JSON с ожиданием
+    изменений до ``wait`` секунд или поток Server-Sent Events
+    """
+
+    throttle_scope = "changes"
+    permission_classes = [IsAdminUser]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+    def get(self, request, *args, **kwargs):
+        return _changes_response(request)
+
+
+class ShopChangeFeedView(APIView):
+    """
+    Лента изменений предложений магазина и заказов с его позициями
+    """
+
+    throttle_scope = "changes"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+    def get(self, request, pk, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        return _changes_response(request, shop)
+
+
+class ShopDashboardView(APIView):
+    """
+    Панель владельца магазина: продажи, популярные предложения, заказы по
+    статусам и оборачиваемость остатка по сводным таблицам
+    """
+
+    throttle_scope = "shop"
+    throttle_per_shop = True
+    permission_classes = [IsAuthenticated, IsShopOwner]
+
+    def get(self, request, pk, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=pk)
+        self.check_object_permissions(request, shop)
+        params = DashboardQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(shop_dashboard(shop, **params.validated_data))